@@ -7,6 +7,7 @@ from starlette.middleware.cors import CORSMiddleware
 
 from src.rest.endpoints import router
 from src.settings import settings
+from src.utils.versions import VersionCache
 
 
 async def http_exception_handler(
@@ -62,9 +63,12 @@ async def startup_db_client():
         tz_aware=True,
     )
     app.mongodb = app.mongodb_client[settings.MONGODB_DB]
+    app.version_cache = VersionCache()
+    app.version_cache.listen()
 
 
 @app.on_event('shutdown')
 async def shutdown_db_client():
     """Действия на закрытие приложения."""
+    app.version_cache.close()
     app.mongodb_client.close()
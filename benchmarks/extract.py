@@ -0,0 +1,182 @@
+"""Сравнение извлечения данных через BeautifulSoup и через lxml.
+
+Запуск::
+
+    python -m benchmarks.extract <каталог корпуса> --repeat 5
+
+Каталог корпуса содержит сохранённые страницы и файл index.json со
+списком записей вида::
+
+    {"site": "allstars", "kind": "product", "url": "/store/...",
+     "file": "product-1.html", "encoding": "utf-8"}
+
+Для страниц каталога multisports указывается start_page, для страниц
+продуктов multisports - список categories из объектов с id и name.
+"""
+import json
+import os
+import time
+from typing import Any, Callable
+
+import click
+
+from benchmarks.legacy import allstars as legacy_allstars
+from benchmarks.legacy import multisports as legacy_multisports
+from src.crawler.extract import PageContext
+from src.crawler.registry import get_parser
+from src.enums import SiteEnum
+from src.models import Category
+
+
+def load_corpus(path: str) -> list[dict[str, Any]]:
+    """Загружает описание корпуса и тела страниц.
+
+    Args:
+        path: Каталог корпуса.
+
+    Returns:
+        Записи корпуса с телом страницы в поле content.
+    """
+    with open(os.path.join(path, 'index.json')) as index:
+        entries = json.load(index)
+    for entry in entries:
+        with open(os.path.join(path, entry['file']), 'rb') as page:
+            entry['content'] = page.read()
+        entry.setdefault('encoding', 'utf-8')
+        entry['categories'] = {
+            Category(**category) for category in entry.get('categories', [])
+        }
+    return entries
+
+
+def run_legacy(entry: dict[str, Any]) -> Any:
+    """Извлекает данные прежним способом через BeautifulSoup.
+
+    Args:
+        entry: Запись корпуса.
+
+    Returns:
+        Результат извлечения.
+    """
+    page = entry['content'].decode(entry['encoding'], errors='replace')
+    if entry['site'] == 'allstars' and entry['kind'] == 'listing':
+        return legacy_allstars.parse_listing(page)
+    if entry['site'] == 'allstars':
+        return legacy_allstars.parse_product(page, entry['url'])
+    if entry['kind'] == 'listing':
+        return legacy_multisports.parse_listing(page, entry['start_page'])
+    return legacy_multisports.parse_product(
+        page,
+        entry['url'],
+        entry['categories'],
+    )
+
+
+def run_lxml(entry: dict[str, Any]) -> Any:
+    """Извлекает данные через PageContext.
+
+    Args:
+        entry: Запись корпуса.
+
+    Returns:
+        Результат извлечения в том же виде, что и у run_legacy.
+    """
+    ctx = PageContext(entry['content'], entry['encoding'])
+    parser = get_parser(SiteEnum(entry['site']))
+    if entry['kind'] == 'product':
+        return parser.extract_product(
+            ctx,
+            parser.base_url + entry['url'],
+            entry['categories'],
+        )
+    links = set(parser.get_product_links(ctx))
+    if entry['site'] == 'multisports':
+        categories = parser.listing_categories(ctx, entry['start_page'])
+        links = {
+            (link, category)
+            for link in links
+            for category in categories
+        }
+    return links, parser.get_next_page(ctx)
+
+
+def comparable(result: Any) -> Any:
+    """Убирает из документа поля, которые различаются между запусками.
+
+    Args:
+        result: Результат извлечения.
+
+    Returns:
+        Результат без _id и parsed.
+    """
+    if isinstance(result, dict):
+        return {
+            key: value
+            for key, value in result.items()
+            if key not in {'_id', 'parsed'}
+        }
+    return result
+
+
+def measure(
+    func: Callable[[dict[str, Any]], Any],
+    entries: list[dict[str, Any]],
+    repeat: int,
+) -> float:
+    """Измеряет скорость обработки страниц.
+
+    Args:
+        func: Функция извлечения.
+        entries: Записи корпуса.
+        repeat: Количество повторов.
+
+    Returns:
+        Страниц в секунду.
+    """
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for entry in entries:
+            func(entry)
+    return len(entries) * repeat / (time.perf_counter() - started)
+
+
+@click.command()
+@click.argument('corpus')
+@click.option('--repeat', '-r', default=3)
+def main(corpus: str, repeat: int) -> None:
+    """Сравнивает скорость и результат двух способов извлечения.
+
+    Args:
+        corpus: Каталог корпуса.
+        repeat: Количество повторов.
+
+    """
+    entries = load_corpus(corpus)
+    groups: dict[tuple[str, str], list[dict[str, Any]]] = {}
+    for entry in entries:
+        groups.setdefault((entry['site'], entry['kind']), []).append(entry)
+    for (site, kind), group in sorted(groups.items()):
+        mismatches = [
+            entry['file']
+            for entry in group
+            if comparable(run_legacy(entry)) != comparable(run_lxml(entry))
+        ]
+        before = measure(run_legacy, group, repeat)
+        after = measure(run_lxml, group, repeat)
+        click.echo(
+            '{0:12} {1:8} pages: {2:5} before: {3:8.1f}/s '
+            'after: {4:8.1f}/s x{5:.1f}'.format(
+                site,
+                kind,
+                len(group),
+                before,
+                after,
+                after / before,
+            ),
+        )
+        for name in mismatches:
+            click.echo('  result differs: {0}'.format(name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""Извлечение данных allstars через BeautifulSoup.
+
+Копия экстракторов до перехода на lxml, используется бенчмарком для
+сравнения скорости и проверки совпадения результатов.
+"""
+import json
+import re
+from json import JSONDecodeError
+from typing import Any, Optional
+
+from bs4 import BeautifulSoup
+from fastapi.encoders import jsonable_encoder
+from pydantic import HttpUrl, ValidationError
+
+from src.enums import SexEnum
+from src.models import Category, ProductModelParse, Size, Specification
+
+BASE_URL = 'https://all-stars.by'
+
+
+def parse_listing(text: str) -> tuple[set[str], Optional[str]]:
+    """Разбирает страницу каталога.
+
+    Args:
+        text: Текст страницы.
+
+    Returns:
+        Ссылки на продукты и ссылка на следующую страницу.
+    """
+    soup = BeautifulSoup(text, 'lxml')
+    uniq_pages = set()
+    cards: list[BeautifulSoup] = soup.findAll(
+        'article',
+        {'class': 's_item'},
+    )
+    for item in cards:
+        uniq_pages.add(
+            item.findNext(
+                'div',
+                {'class': 's_item-det'},
+            ).findNext(
+                'a',
+            ).attrs.get('href'),
+        )
+    return uniq_pages, get_next_page(soup)
+
+
+def parse_product(text: str, url: str) -> Optional[dict[str, Any]]:
+    """Разбирает страницу продукта.
+
+    Args:
+        text: Текст страницы.
+        url: Ссылка на страницу продукта.
+
+    Returns:
+        Документ продукта.
+    """
+    add_item_json = re.search(
+        "data-pixel-add-items-to-cart='({.*})'",
+        text,
+    )[1]
+    soup = BeautifulSoup(text, 'lxml')
+    soup.find(
+        'button', {'class': 'js-add-cart'},
+    ).attrs['data-pixel-add-items-to-cart'] = add_item_json
+    price = soup.find(
+        'button',
+        {'class': 'js-add-cart'},
+    ).attrs['data-price']
+    old_price = soup.find(
+        'button',
+        {'class': 'js-add-cart'},
+    ).attrs['data-oldprice']
+    try:
+        pm = ProductModelParse(
+            title=soup.find('meta', {'itemprop': 'name'}).attrs['content'],
+            images=get_images(soup, BASE_URL),
+            link=BASE_URL + url,
+            price=price,
+            discounted_price=old_price if old_price != price else None,
+            category=get_categories(soup),
+            site='allstars',
+            article=get_article(soup),
+            specification=get_specification(soup),
+        )
+    except ValidationError:
+        return None
+    return jsonable_encoder(pm, by_alias=True)
+
+
+def get_categories(page: BeautifulSoup) -> list[Category]:
+    """Парсинг карточки с информацией о продукте.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        Информация о продукте.
+    """
+    content = page.find('div', {'class': 'breadcrumbs'}).findAll('a')
+    out = []
+    out.append(Category(id='obuv', name='обувь'))
+    out.append(Category(
+        id=content[-1].attrs['href'].split('/')[-2],
+        name=content[-1].attrs['title'].strip().lower(),
+    ))
+    return out
+
+
+def get_specification(page: BeautifulSoup) -> Specification:
+    """Парсинг карточки с информацией о продукте.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        Информация о продукте.
+    """
+    content = page.find('div', {'class': 'content-container'})
+    return Specification(
+        color=get_color(content),
+        sex=get_sex(content),
+        size=get_sizes(content),
+    )
+
+
+def get_sizes(page: BeautifulSoup) -> list[Size]:  # noqa: C901
+    """Парсит карточку размеров продкута.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        Список размеров.
+    """
+    well_known_keys = ('data-us', 'data-eu', 'data-uk', 'data-ru', 'data-cm')
+    sizes_block = page.findAll('a', {'class': 'js-size-type'})
+    size_merged = {}
+    for size in sizes_block:
+        for key, value in size.attrs.items():
+            if key not in size_merged:
+                size_merged[key] = []
+            size_merged[key].append(value)
+    out = []
+    for key, value in size_merged.items():
+        if key in well_known_keys:
+            try:
+                out.append(Size(
+                    size_type=key.split('-')[-1],
+                    values=value,
+                ))
+            except ValidationError:
+                continue
+    return out
+
+
+def get_color(page: BeautifulSoup) -> list[str]:
+    """Парсинг в поисках цвета.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        наименование цвета.
+    """
+    return json.loads(page.find(
+        'button', {'class': 'js-add-cart'},
+    ).attrs.get(
+        'data-pixel-add-items-to-cart',
+    )).get('color').split(' ')
+
+
+def get_article(page: BeautifulSoup) -> str:
+    """Парсинг в поисках цвета.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        наименование цвета.
+    """
+    try:
+        return json.loads(page.find(
+            'button', {'class': 'js-add-cart'},
+        ).attrs.get(
+            'data-pixel-add-items-to-cart',
+        )).get('article')
+    except JSONDecodeError:
+        raise JSONDecodeError
+
+
+def get_sex(page: BeautifulSoup) -> SexEnum:
+    """Парсинг в поисках цвета.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        наименование цвета.
+    """
+    return encode_sex(page.find(
+        'div', {'class': 'subtitle'},
+    ).text)
+
+
+def encode_sex(sex: str) -> SexEnum:
+    """Переводит пол из того что записано на сайте, в енум.
+
+    Args:
+        sex: Пол с сайта.
+
+    Returns:
+        Пол по енуму.
+    """
+    sex = sex.strip().lower()
+    if sex == 'для мужчин' or sex == 'для мальчиков':
+        return SexEnum.MALE
+    if sex == 'для женщин' or sex == 'для девочек':
+        return SexEnum.FEMALE
+    return SexEnum.UNISEX
+
+
+def get_next_page(page: BeautifulSoup) -> Optional[str]:
+    """Находит следующую страницу на главной.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        Ссылку на следующую страницу.
+    """
+    pagination = page.findAll('nav', {'class': 'pages'})
+    if len(pagination) == 0:
+        return None
+    next_page_tag = pagination[0].findNext(
+        'a',
+        {'aria-label': 'Next'},
+    )
+    if next_page_tag is None:
+        return None
+    else:
+        return next_page_tag.attrs.get('href')
+
+
+def get_images(page: BeautifulSoup, base_url: str) -> list[HttpUrl]:
+    """Парсит страницу для получения ссылок на картинки модели.
+
+    Args:
+        page: Страница для парсинга.
+        base_url: Базовый url для подшивания в адреса.
+
+    Returns:
+        Список ссылок на картинки.
+    """
+    image_rotator = page.find('ul', {'class': 'js-images-main'}).findAll('img')
+    images = []
+    for img in image_rotator:
+        images.append(base_url + img.attrs['src'])
+    return images
@@ -0,0 +1,274 @@
+"""Извлечение данных multisports через BeautifulSoup.
+
+Копия экстракторов до перехода на lxml, используется бенчмарком для
+сравнения скорости и проверки совпадения результатов.
+"""
+from typing import Any, Optional, Set, Tuple, Union
+
+from bs4 import BeautifulSoup, Tag
+from fastapi.encoders import jsonable_encoder
+from pydantic import HttpUrl, ValidationError
+
+from src.enums import SexEnum
+from src.models import Category, ProductModelParse, Size, Specification
+
+BASE_URL = 'https://multisports.by'
+spec_mapper = {
+    'пол': 'sex',
+    'цвет': 'color',
+    'артикул': 'article',
+}
+
+
+def parse_listing(
+    text: str,
+    start_page: str,
+) -> tuple[set[tuple[str, Category]], Optional[str]]:
+    """Разбирает страницу каталога.
+
+    Args:
+        text: Текст страницы.
+        start_page: Адрес начальной страницы каталога.
+
+    Returns:
+        Ссылки на продукты с категорией и ссылка на следующую страницу.
+    """
+    soup = BeautifulSoup(text, 'lxml')
+    uniq_pages = set()
+    category = Category(
+        id=start_page.split('/')[-2],
+        name=soup.findAll(
+            'a',
+            {'href': start_page},
+        )[-1].text.strip(),
+    )
+    cards: list[BeautifulSoup] = soup.findAll(
+        'div',
+        {'class': 'wrap-product-card'},
+    )
+    for item in cards:
+        uniq_pages.add(
+            (
+                item.findNext(
+                    'a',
+                    {'class': 'product-name'},
+                ).attrs.get('href'),
+                category,
+            ),
+        )
+    return uniq_pages, get_next_page(soup)
+
+
+def parse_product(
+    text: str,
+    url: str,
+    categories: set[Category],
+) -> Optional[dict[str, Any]]:
+    """Разбирает страницу продукта.
+
+    Args:
+        text: Текст страницы.
+        url: Ссылка на страницу продукта.
+        categories: Категории продукта.
+
+    Returns:
+        Документ продукта.
+    """
+    soup = BeautifulSoup(text, 'lxml')
+    card_info = get_card_info(soup)
+    card_info['size'] = get_sizes(soup)
+    try:
+        pm = ProductModelParse(
+            title=get_title(soup),
+            images=get_images(soup, BASE_URL),
+            link=BASE_URL + url,
+            price=get_price(soup),
+            discounted_price=get_discounted_price(soup),
+            category=categories,
+            site='multisports',
+            article=card_info['article'],
+            specification=Specification.parse_obj(card_info),
+        )
+    except ValidationError:
+        return None
+    return jsonable_encoder(pm, by_alias=True)
+
+
+def get_card_info(page: BeautifulSoup) -> dict[str, Any]:
+    """Парсинг карточки с информацией о продукте.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        Информация о продукте.
+    """
+    card_info: Tag = page.findAll('div', {'class': 'wrap-card-info'}).pop()
+    out = {}
+    for span in card_info.findAll('span'):
+        row = span.text.lower().split(':')
+        if row[0] not in spec_mapper.keys():
+            continue
+        key = spec_mapper[row[0]]
+        if key == 'sex':
+            row[1] = encode_sex(row[1])
+        if key == 'color':
+            row[1] = [row[1]]
+        out[key] = row[1]
+    return out
+
+
+def encode_sex(sex: str) -> str:
+    """Переводит пол из того что записано на сайте, в енум.
+
+    Args:
+        sex: Пол с сайта.
+
+    Returns:
+        Пол по енуму.
+    """
+    sex = sex.strip()
+    if sex == 'мужчины' or sex == 'мальчики':
+        return SexEnum.MALE.value
+    if sex == 'женщины' or sex == 'девочки':
+        return SexEnum.FEMALE.value
+    return SexEnum.UNISEX.value
+
+
+def get_sizes(page: BeautifulSoup) -> list[Size]:
+    """Парсит карточку размеров продкута.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        Список размеров.
+    """
+    sizes_block: Tag = page.findAll('ul', {'class': 'list-sizes'}).pop()
+    sizes = []
+    if sizes_block is None:
+        return []
+    for li in sizes_block.findAll('li'):
+        if not li.text.strip():
+            continue
+        sizes.append(float(li.text.strip().replace(',', '.')))
+    sizes.sort()
+    if len(sizes) == 0:
+        return []
+    return [Size(
+        size_type='ru' if sizes[-1] > 20 else 'us',
+        values=sizes,
+    )]
+
+
+def get_price(page: BeautifulSoup) -> Optional[float]:
+    """Парсит карточку с ценой.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        Цена.
+    """
+    price_block: Tag = page.findAll('div', {'class': 'price-list'}).pop()
+    card_info = price_block.findAll('span', {'class': 'cur-price'})
+    if len(card_info) == 0:
+        return None
+    card_info = card_info.pop()
+    return float(card_info.text.strip().split(' ')[0])
+
+
+def get_discounted_price(page: BeautifulSoup) -> Optional[float]:
+    """Парсит карточку с ценой для поиска цены до скидки.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        Цена до скидки.
+    """
+    price_block: Tag = page.findAll('div', {'class': 'price-list'}).pop()
+    card_info = price_block.findAll('span', {'class': 'old-price'})
+    if len(card_info) == 0:
+        return None
+    card_info = card_info.pop()
+    return float(card_info.text.strip().split(' ')[0])
+
+
+def get_title(page: BeautifulSoup) -> str:
+    """Парсит карточку в поисках названия.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        Название модели.
+    """
+    title_tag: Tag = page.findAll(
+        'div',
+        {'class': 'wrap-product-card-name'},
+    ).pop()
+    return title_tag.text.strip()
+
+
+def get_next_page(page: BeautifulSoup) -> Optional[str]:
+    """Находит следующую страницу на главной.
+
+    Args:
+        page: Страница для парсинга.
+
+    Returns:
+        Ссылку на следующую страницу.
+    """
+    pagination = page.findAll('div', {'class': 'pagination'})
+    if len(pagination) == 0:
+        return None
+    next_page_tag = pagination[0].findNext(
+        'a',
+        {'title': 'Следующая страница'},
+    )
+    if next_page_tag is None:
+        return None
+    else:
+        return next_page_tag.attrs.get('href')
+
+
+def get_images(page: BeautifulSoup, base_url: str) -> list[HttpUrl]:
+    """Парсит страницу для получения ссылок на картинки модели.
+
+    Args:
+        page: Страница для парсинга.
+        base_url: Базовый url для подшивания в адреса.
+
+    Returns:
+        Список ссылок на картинки.
+    """
+    image_rotator = page.findAll('div', {'class': 'main-image'}).pop()
+    images = []
+    for img in image_rotator.findAll('img'):
+        images.append(base_url + img.attrs['src'])
+    return images
+
+
+def remove_duplicates(
+    urls: Set[Tuple[str, Category]],
+) -> list[dict[str, Union[str, set[Category]]]]:
+    """Удаляет дубликаты моделей из списка ссылок, сохраняет категории.
+
+    Args:
+        urls: Список ссылок для обработки.
+
+    Returns:
+        Список ссылок для дальнейшего парсинга.
+    """
+    unic_item_urls = {}
+    for url in urls:
+        object_name = url[0].split('/')[-2]
+        if object_name in unic_item_urls.keys():
+            unic_item_urls[object_name]['categories'].add(url[1])
+            continue
+        unic_item_urls[object_name] = {
+            'url': url[0],
+            'categories': {url[1]},
+        }
+    return list(unic_item_urls.values())
@@ -0,0 +1,462 @@
+"""Замеры отдельных стадий разбора страниц обоих сайтов.
+
+Запуск::
+
+    python -m benchmarks.parsers <корпус>... --repeat 5 --output run.json
+    python -m benchmarks.parsers <корпус>... --compare run.json
+
+Корпус - каталог с index.json (см. benchmarks.extract) или архив,
+записанный ``manage.py startparse --record``. Страницы архива делятся
+на страницы каталога и продуктов по их содержимому.
+
+Для каждой стадии считается время на вызов и память, выделенная за
+вызов (пик и оставшаяся после вызова, по tracemalloc). Каждая функция
+вызывается на свежем PageContext, поэтому кэш узлов страницы не
+переносится между стадиями. Результат в формате JSON можно сравнить с
+результатом другого коммита через --compare.
+"""
+import base64
+import gzip
+import json
+import os
+import platform
+import subprocess  # noqa: S404
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Iterable, Optional
+from urllib.parse import urlsplit
+
+import click
+import httpx
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.extract import load_corpus
+from benchmarks.legacy import multisports as legacy_multisports
+from src.allstars import parse as allstars
+from src.crawler.documents import build_trusted, build_validated
+from src.crawler.extract import PageContext
+from src.crawler.registry import get_parser, get_parsers
+from src.enums import SiteEnum
+from src.models import Category, ProductModelParse
+from src.multisports import parse as multisports
+
+Stage = Callable[[dict[str, Any], Optional[PageContext]], Any]
+SITES = {
+    'allstars': allstars,
+    'multisports': multisports,
+}
+
+
+def load_archive(path: str) -> list[dict[str, Any]]:
+    """Загружает страницы из архива записанных ответов.
+
+    Args:
+        path: Путь к архиву.
+
+    Returns:
+        Записи корпуса.
+    """
+    entries = []
+    hosts = {
+        urlsplit(parser.base_url).netloc: parser
+        for parser in get_parsers()
+    }
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            record = json.loads(line)
+            address = urlsplit(record['url'])
+            parser = hosts.get(address.netloc)
+            if parser is None or record['status'] != 200:
+                continue
+            response = httpx.Response(
+                record['status'],
+                headers=record['headers'],
+                content=base64.b64decode(record['body']),
+            )
+            response.read()
+            entry = {
+                'site': parser.site.value,
+                'url': record['url'][len(parser.base_url):],
+                'file': record['url'],
+                'content': response.content,
+                'encoding': response.encoding or 'utf-8',
+                'categories': set(),
+                'start_page': address.path,
+            }
+            entry['kind'] = classify(entry)
+            if entry['kind'] is not None:
+                entries.append(entry)
+    return entries
+
+
+def classify(entry: dict[str, Any]) -> Optional[str]:
+    """Определяет тип страницы по её содержимому.
+
+    Args:
+        entry: Запись корпуса.
+
+    Returns:
+        product, listing или None для прочих страниц.
+    """
+    ctx = PageContext(entry['content'], entry['encoding'])
+    if entry['site'] == 'allstars':
+        if ctx.first(allstars.ADD_CART) is not None:
+            return 'product'
+        return 'listing' if ctx.xpath(allstars.CARDS) else None
+    if ctx.xpath(multisports.CARD_INFO):
+        return 'product'
+    return 'listing' if ctx.xpath(multisports.CARDS) else None
+
+
+def extract(entry: dict[str, Any], ctx: PageContext) -> Optional[dict]:
+    """Собирает документ продукта.
+
+    Args:
+        entry: Запись корпуса.
+        ctx: Страница.
+
+    Returns:
+        Документ продукта.
+    """
+    parser = get_parser(SiteEnum(entry['site']))
+    return parser.extract_product(
+        ctx,
+        parser.base_url + entry['url'],
+        entry['categories'],
+    )
+
+
+def get_fields(entry: dict[str, Any]) -> dict[str, Any]:
+    """Поля модели продукта, из которых собирается документ.
+
+    Args:
+        entry: Запись корпуса.
+
+    Returns:
+        Поля модели продукта.
+    """
+    parser = get_parser(SiteEnum(entry['site']))
+    return {
+        'link': parser.base_url + entry['url'],
+        'site': parser.site,
+        **parser.product_fields(
+            PageContext(entry['content'], entry['encoding']),
+            entry['categories'],
+        ),
+    }
+
+
+def listing_links(entry: dict[str, Any]) -> set[tuple[str, Category]]:
+    """Ссылки страницы каталога multisports вместе с категорией.
+
+    Args:
+        entry: Запись корпуса.
+
+    Returns:
+        Пары из ссылки и категории.
+    """
+    ctx = PageContext(entry['content'], entry['encoding'])
+    parser = get_parser(SiteEnum.MULTISPORTS)
+    categories = parser.listing_categories(ctx, entry['start_page'])
+    return {
+        (link, category)
+        for link in parser.get_product_links(ctx)
+        for category in categories
+    }
+
+
+def dedup(links: Iterable[tuple[str, Category]]) -> dict[str, set[Category]]:
+    """Удаление дублей так же, как в конвейере парсинга.
+
+    Args:
+        links: Пары из ссылки и категории.
+
+    Returns:
+        Категории по ключу модели.
+    """
+    products: dict[str, set[Category]] = {}
+    for link, category in links:
+        products.setdefault(
+            multisports.get_product_key(link),
+            set(),
+        ).add(category)
+    return products
+
+
+def get_stages(site: str, kind: str) -> dict[str, Stage]:
+    """Стадии разбора для типа страницы.
+
+    Функции получают запись корпуса и свежий контекст страницы, стадия
+    page включает разбор HTML и сборку документа целиком.
+
+    Args:
+        site: Сайт.
+        kind: Тип страницы.
+
+    Returns:
+        Функции стадий по имени.
+    """
+    module = SITES[site]
+    parser = get_parser(SiteEnum(site))
+    stages: dict[str, Stage] = {
+        'html': lambda entry, ctx: PageContext(
+            entry['content'],
+            entry['encoding'],
+        ),
+    }
+    if kind == 'listing':
+        stages['get_product_links'] = _bind(parser.get_product_links)
+        stages['get_page_links'] = _bind(parser.get_page_links)
+        stages['get_next_page'] = _bind(parser.get_next_page)
+        if site == 'multisports':
+            stages['dedup'] = lambda entry, _: dedup(entry['links'])
+            stages['remove_duplicates'] = lambda entry, _: (
+                legacy_multisports.remove_duplicates(entry['links'])
+            )
+        return stages
+    names = {
+        'allstars': (
+            'get_cart_json',
+            'get_categories',
+            'get_specification',
+            'get_sizes',
+            'get_color',
+            'get_article',
+            'get_sex',
+        ),
+        'multisports': (
+            'get_card_info',
+            'get_sizes',
+            'get_price',
+            'get_discounted_price',
+            'get_title',
+        ),
+    }[site]
+    for name in names:
+        stages[name] = _bind(getattr(module, name))
+    stages['get_images'] = _bind(parser.get_images)
+    stages['product_fields'] = lambda entry, ctx: (
+        parser.product_fields(ctx, entry['categories'])
+    )
+    stages['build_trusted'] = lambda entry, _: build_trusted(entry['fields'])
+    stages['build_validated'] = lambda entry, _: (
+        build_validated(entry['fields'])
+    )
+    stages['extract_product'] = extract
+    stages['validate'] = lambda entry, _: (
+        ProductModelParse.parse_obj(entry['document'])
+    )
+    stages['encode'] = lambda entry, _: (
+        jsonable_encoder(entry['model'], by_alias=True)
+    )
+    stages['page'] = lambda entry, _: extract(
+        entry,
+        PageContext(entry['content'], entry['encoding']),
+    )
+    return stages
+
+
+def _bind(func: Callable[[PageContext], Any]) -> Stage:
+    """Оборачивает экстрактор в функцию стадии.
+
+    Args:
+        func: Экстрактор страницы.
+
+    Returns:
+        Функция стадии.
+    """
+    return lambda _, ctx: func(ctx)
+
+
+def prepare(entries: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Готовит входные данные стадий, не входящие в замер.
+
+    Args:
+        entries: Записи корпуса.
+
+    Returns:
+        Записи, для которых можно выполнить все стадии.
+    """
+    prepared = []
+    for entry in entries:
+        if entry['kind'] == 'listing' and entry['site'] == 'multisports':
+            entry['links'] = listing_links(entry)
+        if entry['kind'] == 'product':
+            entry['document'] = extract(
+                entry,
+                PageContext(entry['content'], entry['encoding']),
+            )
+            if entry['document'] is None:
+                continue
+            entry['model'] = ProductModelParse.parse_obj(entry['document'])
+            entry['fields'] = get_fields(entry)
+        prepared.append(entry)
+    return prepared
+
+
+def measure(
+    stage: Stage,
+    entries: list[dict[str, Any]],
+    repeat: int,
+) -> dict[str, float]:
+    """Замеряет время и память стадии.
+
+    Args:
+        stage: Функция стадии.
+        entries: Записи корпуса.
+        repeat: Количество повторов для замера времени.
+
+    Returns:
+        Количество вызовов, время на вызов в микросекундах и память на
+        вызов в байтах.
+    """
+    elapsed = 0.0
+    calls = 0
+    for _ in range(repeat):
+        for entry in entries:
+            ctx = PageContext(entry['content'], entry['encoding'])
+            started = time.perf_counter()
+            stage(entry, ctx)
+            elapsed += time.perf_counter() - started
+            calls += 1
+    peak = 0
+    retained = 0
+    tracemalloc.start()
+    for entry in entries:
+        ctx = PageContext(entry['content'], entry['encoding'])
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = stage(entry, ctx)
+        current, highest = tracemalloc.get_traced_memory()
+        peak += highest - before
+        retained += current - before
+        del result
+    tracemalloc.stop()
+    return {
+        'calls': calls,
+        'per_call_us': elapsed / calls * 1e6,
+        'per_sec': calls / elapsed if elapsed else 0,
+        'peak_bytes': peak / len(entries),
+        'retained_bytes': retained / len(entries),
+    }
+
+
+def git_revision() -> Optional[str]:
+    """Текущий коммит репозитория.
+
+    Returns:
+        Короткий хеш или None вне репозитория.
+    """
+    try:
+        return subprocess.check_output(  # noqa: S603, S607
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    entries: list[dict[str, Any]],
+    repeat: int,
+) -> dict[str, dict[str, float]]:
+    """Замеряет все стадии для всех типов страниц.
+
+    Args:
+        entries: Записи корпуса.
+        repeat: Количество повторов.
+
+    Returns:
+        Результаты по ключу сайт.тип.стадия.
+    """
+    groups: dict[tuple[str, str], list[dict[str, Any]]] = {}
+    for entry in prepare(entries):
+        groups.setdefault((entry['site'], entry['kind']), []).append(entry)
+    results = {}
+    for (site, kind), group in sorted(groups.items()):
+        for name, stage in get_stages(site, kind).items():
+            key = '{0}.{1}.{2}'.format(site, kind, name)
+            results[key] = measure(stage, group, repeat)
+    return results
+
+
+def print_results(
+    results: dict[str, dict[str, float]],
+    baseline: Optional[dict[str, dict[str, float]]] = None,
+) -> None:
+    """Печатает таблицу результатов.
+
+    Args:
+        results: Результаты замеров.
+        baseline: Результаты для сравнения.
+    """
+    for key, result in results.items():
+        line = '{0:45} {1:10.1f} us {2:10.1f}/s {3:10.0f} B peak'.format(
+            key,
+            result['per_call_us'],
+            result['per_sec'],
+            result['peak_bytes'],
+        )
+        previous = (baseline or {}).get(key)
+        if previous and previous['per_call_us']:
+            line += '  time x{0:.2f}'.format(
+                result['per_call_us'] / previous['per_call_us'],
+            )
+            if previous['peak_bytes']:
+                line += ' memory x{0:.2f}'.format(
+                    result['peak_bytes'] / previous['peak_bytes'],
+                )
+        click.echo(line)
+
+
+@click.command()
+@click.argument('corpus', nargs=-1, required=True)
+@click.option('--repeat', '-r', default=3)
+@click.option('--output', '-o', type=click.Path(dir_okay=False))
+@click.option('--compare', '-c', type=click.Path(exists=True))
+def main(
+    corpus: tuple[str, ...],
+    repeat: int,
+    output: Optional[str],
+    compare: Optional[str],
+) -> None:
+    """Замеряет стадии разбора страниц.
+
+    Args:
+        corpus: Каталоги корпуса или архивы ответов.
+        repeat: Количество повторов.
+        output: Файл для результатов в JSON.
+        compare: Файл с результатами для сравнения.
+
+    """
+    entries = []
+    for path in corpus:
+        if os.path.isdir(path):
+            entries.extend(load_corpus(path))
+        else:
+            entries.extend(load_archive(path))
+    results = run(entries, repeat)
+    baseline = None
+    if compare:
+        with open(compare) as report:
+            baseline = json.load(report)['results']
+    print_results(results, baseline)
+    if output:
+        with open(output, 'w') as report:
+            json.dump(
+                {
+                    'revision': git_revision(),
+                    'created': datetime.now().isoformat(),
+                    'python': platform.python_version(),
+                    'pages': len(entries),
+                    'repeat': repeat,
+                    'results': results,
+                },
+                report,
+                indent=2,
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,16 @@
 import asyncio
-import logging
+from typing import Optional
 
 import click
 import uvicorn
 
-from src.allstars.parse import parse_site as allstars
-from src.multisports.parse import parse_site as multisports
+from src.crawler import archive, images, metrics, pool
+from src.crawler.documents import validate_stored
+from src.crawler.history import migrate
 from src.runners import start_parse
+from src.utils.logs import configure_logging
+from src.utils.utils import get_max_version, get_mongodb
+from src.utils.versions import publish_version
 
 
 @click.group()
@@ -33,22 +37,132 @@ def runserver(ctx: click.core.Context, port: int, host: str) -> None:
         host: хост для запуска приложения, по умолчанию 'localhost'
 
     """
-    logging.basicConfig(format='%(asctime)-15s %(message)s', level=20)
+    configure_logging()
     uvicorn.run('app:app', host=host, port=port, reload=True)
 
 
 @main.command()
+@click.option('--workers', '-w', type=int, default=None)
+@click.option('--resume', is_flag=True, default=False)
+@click.option('--record', type=click.Path(dir_okay=False), default=None)
+@click.option(
+    '--replay',
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+)
 @click.pass_context
-def startparse(ctx: click.core.Context) -> None:
-    """Запуск web-части приложения.
+def startparse(
+    ctx: click.core.Context,
+    workers: Optional[int],
+    resume: bool,
+    record: Optional[str],
+    replay: Optional[str],
+) -> None:
+    """Парсинг всех сайтов в одном процессе с публикацией новой версии.
+
+    Сайты разбираются одновременно, документы пишутся в новую версию,
+    которая после завершения сворачивается в историю и публикуется.
+    Ответы сайтов можно записать в архив и потом воспроизвести без
+    обращения к сайтам.
+
+    Args:
+        ctx: контекстный менеджер
+        workers: количество процессов для разбора страниц, 0 - разбирать
+            в цикле событий, по умолчанию из настроек
+        resume: продолжить прерванный запуск парсинга
+        record: архив, в который записываются ответы сайтов
+        replay: архив, из которого берутся ответы вместо сайтов
+
+    Raises:
+        UsageError: если одновременно указаны запись и воспроизведение
+
+    """
+    if record and replay:
+        raise click.UsageError('--record and --replay are exclusive.')
+    configure_logging()
+    pool.configure(workers)
+    archive.configure(record=record, replay=replay)
+    metrics.serve()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(start_parse(resume=resume))
+
+
+@main.command()
+@click.option('--version', '-v', type=int, default=None)
+@click.option('--limit', '-l', default=0)
+@click.pass_context
+def validate(
+    ctx: click.core.Context,
+    version: Optional[int],
+    limit: int,
+) -> None:
+    """Проверка записанных продуктов полной валидацией модели.
+
+    Args:
+        ctx: контекстный менеджер
+        version: версия запуска, по умолчанию последняя завершённая
+        limit: максимум документов для проверки, 0 - все документы
+
+    Raises:
+        ClickException: если есть невалидные документы
+
+    """
+    configure_logging()
+    db = get_mongodb()
+    loop = asyncio.get_event_loop()
+    if version is None:
+        version = loop.run_until_complete(
+            get_max_version(db['byshoes-collection']),
+        )
+    checked, invalid = loop.run_until_complete(
+        validate_stored(db, version, limit),
+    )
+    click.echo('Version {0}: {1} checked, {2} invalid.'.format(
+        version,
+        checked,
+        invalid,
+    ))
+    if invalid:
+        raise click.ClickException('Stored documents are invalid.')
+
+
+@main.command()
+@click.option('--version', '-v', type=int, default=None)
+@click.pass_context
+def prefetchimages(ctx: click.core.Context, version: Optional[int]) -> None:
+    """Сохранение картинок продуктов в локальное хранилище.
+
+    Args:
+        ctx: контекстный менеджер
+        version: версия запуска, по умолчанию последняя завершённая
+
+    """
+    configure_logging()
+    db = get_mongodb()
+    loop = asyncio.get_event_loop()
+    if version is None:
+        version = loop.run_until_complete(
+            get_max_version(db['byshoes-collection']),
+        )
+    loop.run_until_complete(images.prefetch(db, version))
+
+
+@main.command()
+@click.pass_context
+def migratehistory(ctx: click.core.Context) -> None:
+    """Перенос версий, записанных полными копиями, в историю продуктов.
 
     Args:
         ctx: контекстный менеджер
 
     """
-    logging.basicConfig(format='%(asctime)-15s %(message)s', level=20)
+    configure_logging()
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(start_parse())
+    db = get_mongodb()
+    versions = loop.run_until_complete(migrate(db))
+    if versions:
+        loop.run_until_complete(publish_version(db, versions[-1]))
+    click.echo('Migrated {0} versions.'.format(len(versions)))
 
 
 if __name__ == '__main__':
@@ -1,20 +1,45 @@
-import logging
-
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import setup_logging, worker_init
 
+from src.crawler import metrics
 from src.settings import settings
+from src.utils.logs import configure_logging
 
-logging.basicConfig(format='%(asctime)-15s %(message)s', level=20)
+configure_logging()
 
 worker = Celery(
     'scheduler',
     broker='redis://{0}:6379/0'.format(settings.REDIS_URL),
+    backend='redis://{0}:6379/1'.format(settings.REDIS_URL),
     include=['src.runners'],
 )
 worker.conf.task_routes = {
-    'src.runners.parse_all': {'queue': 'all'},
+    'src.runners.*': {'queue': 'all'},
 }
+worker.conf.worker_prefetch_multiplier = 1
+worker.conf.result_expires = 24 * 60 * 60
+
+
+@setup_logging.connect
+def keep_logging(**kwargs) -> None:
+    """Оставляет логирование через очередь вместо настроек celery.
+
+    Args:
+        kwargs: Аргументы сигнала.
+    """
+    configure_logging()
+
+
+@worker_init.connect
+def serve_metrics(**kwargs) -> None:
+    """Отдаёт метрики воркера для Prometheus.
+
+    Args:
+        kwargs: Аргументы сигнала.
+    """
+    metrics.serve()
+
 
 worker.conf.beat_schedule = {
     'parse-all': {
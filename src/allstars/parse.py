@@ -1,158 +1,129 @@
-import asyncio
 import json
 import logging
 import re
 from json import JSONDecodeError
-from typing import Optional
-
-import httpx
-from bs4 import BeautifulSoup
-from fastapi.encoders import jsonable_encoder
-from httpx import Response
-from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import HttpUrl, ValidationError
-
-from src.enums import SexEnum
-from src.models import Category, ProductModelParse, Size, Specification
-from src.settings import settings
-
-spec_mapper = {
-    'пол': 'sex',
-    'цвет': 'color',
-    'артикул': 'article',
-}
+from typing import Any, Iterable
+
+from src.crawler.extract import (
+    PageContext,
+    compile_xpath,
+    find_next,
+    has_class,
+    text,
+)
+from src.crawler.registry import register
+from src.crawler.site import SiteParser, encode_sex
+from src.enums import SexEnum, SiteEnum
+from src.models import Category
+
 logger = logging.getLogger(__name__)
+BASE_URL = 'https://all-stars.by'
+SEX_MAPPING = {
+    'для мужчин': SexEnum.MALE,
+    'для мальчиков': SexEnum.MALE,
+    'для женщин': SexEnum.FEMALE,
+    'для девочек': SexEnum.FEMALE,
+}
+SITEMAP_PRODUCTS = re.compile(r'^/store/(?:men|women)/shoes/[^/?]+/[^/?]+/$')
+CART_DATA = re.compile("data-pixel-add-items-to-cart='({.*})'")
+ADD_CART = compile_xpath('//button[{0}]'.format(has_class('js-add-cart')))
+CONTENT_ADD_CART = compile_xpath(
+    '(//div[{0}])[1]//button[{1}]'.format(
+        has_class('content-container'),
+        has_class('js-add-cart'),
+    ),
+)
+CONTENT_SIZES = compile_xpath(
+    '(//div[{0}])[1]//a[{1}]'.format(
+        has_class('content-container'),
+        has_class('js-size-type'),
+    ),
+)
+CONTENT_SUBTITLE = compile_xpath(
+    '(//div[{0}])[1]//div[{1}]'.format(
+        has_class('content-container'),
+        has_class('subtitle'),
+    ),
+)
+BREADCRUMB_LINKS = compile_xpath(
+    '(//div[{0}])[1]//a'.format(has_class('breadcrumbs')),
+)
+TITLE = compile_xpath("//meta[@itemprop='name']")
+IMAGES = compile_xpath(
+    '(//ul[{0}])[1]//img/@src'.format(has_class('js-images-main')),
+)
+CARDS = compile_xpath('//article[{0}]'.format(has_class('s_item')))
+CARD_DETAILS = find_next('div', has_class('s_item-det'))
+CARD_LINK = find_next('a')
+PAGINATION = compile_xpath('//nav[{0}]'.format(has_class('pages')))
+NEXT_PAGE = find_next('a', "@aria-label='Next'")
+PAGE_LINKS = compile_xpath('.//a/@href')
+FINGERPRINT_XPATHS = (
+    compile_xpath('//div[{0}]'.format(has_class('breadcrumbs'))),
+    compile_xpath('//button[{0}]/@data-price'.format(
+        has_class('js-add-cart'),
+    )),
+    compile_xpath('//button[{0}]/@data-oldprice'.format(
+        has_class('js-add-cart'),
+    )),
+    compile_xpath("//meta[@itemprop='name']/@content"),
+    compile_xpath('//a[{0}]'.format(has_class('js-size-type'))),
+    compile_xpath('//div[{0}]'.format(has_class('subtitle'))),
+    compile_xpath('//ul[{0}]//img/@src'.format(
+        has_class('js-images-main'),
+    )),
+)
+
+
+def get_product_links(page: PageContext) -> list[str]:
+    """Находит ссылки на продукты на странице каталога.
 
+    Args:
+        page: Страница для парсинга.
 
-async def parse_site():
-    """Функция запускает парсинг сайта."""
-    print('Start parsing allstars.')
-    parse_addreses = [
-        '/store/men/shoes/',
-        '/store/women/shoes/',
-    ]
-    tasks = [parse_main_page(page) for page in parse_addreses]
-    main_page_set = set()
-    results = await asyncio.gather(*tasks)
-    for result in results:
-        main_page_set = main_page_set | result
-    print(len(main_page_set))
-    mongodb_client = AsyncIOMotorClient(
-        'mongodb://{0}:{1}@{2}:{3}/{4}'.format(
-            settings.MONGODB_USER,
-            settings.MONGODB_PASSWORD,
-            settings.MONGODB_HOST,
-            settings.MONGODB_PORT,
-            settings.MONGODB_DB,
-        ),
-        tz_aware=True,
-    )[settings.MONGODB_DB]['byshoes-collection']
-    tasks = []
-    for page in main_page_set:
-        task = asyncio.ensure_future(
-            parse_product_page(
-                page,
-            ),
-        )
-        await asyncio.sleep(1)
-        tasks.append(task)
-    print('Finish parsing allstars.')
-    return await asyncio.gather(*tasks)
-
-
-async def parse_main_page(start_page: str) -> set[str]:
-    """Функция парсит постранично страницу с моделями.
+    Returns:
+        Ссылки на страницы продуктов.
+    """
+    links = []
+    for item in page.xpath(CARDS):
+        links.append(CARD_LINK(CARD_DETAILS(item)[0])[0].get('href'))
+    return links
+
+
+def get_cart_json(page: PageContext) -> str:
+    """Достаёт json кнопки добавления в корзину из текста страницы.
+
+    Костыль, чтобы объекты у которых в названии неэкранированный ' не
+    ломали парсер: атрибут ищется регулярным выражением по тексту.
 
     Args:
-        start_page: Адрес начальный страницы.
+        page: Страница для парсинга.
 
     Returns:
-        Список ссылок на отдельные модели для дальнейшего парсинга.
-
+        Текст json.
     """
-    print(f'Start parsing {start_page}.')
-    next_page = start_page
-    uniq_pages = set()
-    async with httpx.AsyncClient(base_url='https://all-stars.by') as client:
-        while next_page:
-            try:
-                response = await client.get(next_page)
-            except httpx.ReadTimeout:
-                response = await client.get(next_page)
-            soup = BeautifulSoup(response.text, 'lxml')
-            next_page = get_next_page(soup)
-            cards: list[BeautifulSoup] = soup.findAll(
-                'article',
-                {'class': 's_item'},
-            )
-            for item in cards:
-                uniq_pages.add(
-                    item.findNext(
-                        'div',
-                        {'class': 's_item-det'},
-                    ).findNext(
-                        'a',
-                    ).attrs.get('href'),
-                )
-    print(f'Finish parsing {start_page}.')
-    return uniq_pages
-
-
-async def parse_product_page(
-    url: str,
-):
-    """Парсит страницу продкута и записывает в базу информацию.
+    return page.memo('cart_json', lambda: CART_DATA.search(page.text)[1])
+
+
+def get_cart_data(page: PageContext, button: Any) -> dict[str, Any]:
+    """Декодирует json кнопки добавления в корзину.
+
+    Для первой кнопки на странице используется текст, найденный
+    get_cart_json, и результат декодирования запоминается.
 
     Args:
-        url: Ссылка на страницу продукта.
+        page: Страница для парсинга.
+        button: Кнопка добавления в корзину.
 
+    Returns:
+        Данные кнопки.
     """
-    print(f'Start parsing {url}.')
-    async with httpx.AsyncClient(base_url='https://all-stars.by') as client:
-        response: Response = await client.get(url)
-        while response.status_code != 200:
-            print(f'Responce is not correct: {response}.')
-            await asyncio.sleep(3)
-            response = await client.get(url)
-        add_item_json = re.search(
-            "data-pixel-add-items-to-cart='({.*})'",
-            response.text,
-        )[1]
-        # Костыль, чтобы объекты у которых в названии неэкранированный ' не
-        # ломали парсер.
-        soup = BeautifulSoup(response.text, 'lxml')
-        soup.find(
-            'button', {'class': 'js-add-cart'},
-        ).attrs['data-pixel-add-items-to-cart'] = add_item_json
-        price = soup.find(
-            'button',
-            {'class': 'js-add-cart'},
-        ).attrs['data-price']
-        old_price = soup.find(
-            'button',
-            {'class': 'js-add-cart'},
-        ).attrs['data-oldprice']
-        try:
-            pm = ProductModelParse(
-                title=soup.find('meta', {'itemprop': 'name'}).attrs['content'],
-                images=get_images(soup, str(client.base_url)),
-                link=str(client.base_url) + url,
-                price=price,
-                discounted_price=old_price if old_price != price else None,
-                category=get_categories(soup),
-                site='allstars',
-                article=get_article(soup),
-                specification=get_specification(soup),
-            )
-        except ValidationError as exc:
-            print(exc.json())
-            print('error on' + str(client.base_url) + url)
-            return
-        print(f'Finish parsing {url}.')
-        return jsonable_encoder(pm, by_alias=True)
-
-
-def get_categories(page: BeautifulSoup) -> list[Category]:
+    if button is page.first(ADD_CART):
+        return page.memo('cart_data', lambda: json.loads(get_cart_json(page)))
+    return json.loads(button.get('data-pixel-add-items-to-cart'))
+
+
+def get_categories(page: PageContext) -> list[Category]:
     """Парсинг карточки с информацией о продукте.
 
     Args:
@@ -161,47 +132,47 @@ def get_categories(page: BeautifulSoup) -> list[Category]:
     Returns:
         Информация о продукте.
     """
-    content = page.find('div', {'class': 'breadcrumbs'}).findAll('a')
+    content = page.xpath(BREADCRUMB_LINKS)
     out = []
     out.append(Category(id='obuv', name='обувь'))
     out.append(Category(
-        id=content[-1].attrs['href'].split('/')[-2],
-        name=content[-1].attrs['title'].strip().lower(),
+        id=content[-1].attrib['href'].split('/')[-2],
+        name=content[-1].attrib['title'].strip().lower(),
     ))
     return out
 
 
-def get_specification(page: BeautifulSoup) -> Specification:
+def get_specification(page: PageContext) -> dict[str, Any]:
     """Парсинг карточки с информацией о продукте.
 
     Args:
         page: Страница для парсинга.
 
     Returns:
-        Информация о продукте.
+        Информация о продукте в виде полей Specification.
     """
-    content = page.find('div', {'class': 'content-container'})
-    return Specification(
-        color=get_color(content),
-        sex=get_sex(content),
-        size=get_sizes(content),
-    )
+    return {
+        'size': get_sizes(page),
+        'color': get_color(page),
+        'sex': get_sex(page),
+    }
 
 
-def get_sizes(page: BeautifulSoup) -> list[Size]:  # noqa: C901
+def get_sizes(page: PageContext) -> list[dict[str, Any]]:  # noqa: C901
     """Парсит карточку размеров продкута.
 
+    Размерные сетки с нечисловыми значениями пропускаются.
+
     Args:
         page: Страница для парсинга.
 
     Returns:
-        Список размеров.
+        Список размеров в виде полей Size.
     """
     well_known_keys = ('data-us', 'data-eu', 'data-uk', 'data-ru', 'data-cm')
-    sizes_block = page.findAll('a', {'class': 'js-size-type'})
     size_merged = {}
-    for size in sizes_block:
-        for key, value in size.attrs.items():
+    for size in page.xpath(CONTENT_SIZES):
+        for key, value in size.attrib.items():
             if key not in size_merged:
                 size_merged[key] = []
             size_merged[key].append(value)
@@ -209,16 +180,14 @@ def get_sizes(page: BeautifulSoup) -> list[Size]:  # noqa: C901
     for key, value in size_merged.items():
         if key in well_known_keys:
             try:
-                out.append(Size(
-                    size_type=key.split('-')[-1],
-                    values=value,
-                ))
-            except ValidationError:
+                values = [float(size) for size in value]
+            except ValueError:
                 continue
+            out.append({'size_type': key.split('-')[-1], 'values': values})
     return out
 
 
-def get_color(page: BeautifulSoup) -> list[str]:
+def get_color(page: PageContext) -> list[str]:
     """Парсинг в поисках цвета.
 
     Args:
@@ -227,14 +196,13 @@ def get_color(page: BeautifulSoup) -> list[str]:
     Returns:
         наименование цвета.
     """
-    return json.loads(page.find(
-        'button', {'class': 'js-add-cart'},
-    ).attrs.get(
-        'data-pixel-add-items-to-cart',
-    )).get('color').split(' ')
+    return get_cart_data(
+        page,
+        page.first(CONTENT_ADD_CART),
+    ).get('color').split(' ')
 
 
-def get_article(page: BeautifulSoup) -> str:
+def get_article(page: PageContext) -> str:
     """Парсинг в поисках цвета.
 
     Args:
@@ -244,16 +212,12 @@ def get_article(page: BeautifulSoup) -> str:
         наименование цвета.
     """
     try:
-        return json.loads(page.find(
-            'button', {'class': 'js-add-cart'},
-        ).attrs.get(
-            'data-pixel-add-items-to-cart',
-        )).get('article')
+        return get_cart_data(page, page.first(ADD_CART)).get('article')
     except JSONDecodeError:
         raise JSONDecodeError
 
 
-def get_sex(page: BeautifulSoup) -> SexEnum:
+def get_sex(page: PageContext) -> SexEnum:
     """Парсинг в поисках цвета.
 
     Args:
@@ -262,62 +226,69 @@ def get_sex(page: BeautifulSoup) -> SexEnum:
     Returns:
         наименование цвета.
     """
-    return encode_sex(page.find(
-        'div', {'class': 'subtitle'},
-    ).text)
-
-
-def encode_sex(sex: str) -> SexEnum:
-    """Переводит пол из того что записано на сайте, в енум.
-
-    Args:
-        sex: Пол с сайта.
-
-    Returns:
-        Пол по енуму.
-    """
-    sex = sex.strip().lower()
-    if sex == 'для мужчин' or sex == 'для мальчиков':
-        return SexEnum.MALE
-    if sex == 'для женщин' or sex == 'для девочек':
-        return SexEnum.FEMALE
-    return SexEnum.UNISEX
-
+    return encode_sex(text(page.first(CONTENT_SUBTITLE)), SEX_MAPPING)
 
-def get_next_page(page: BeautifulSoup) -> Optional[str]:
-    """Находит следующую страницу на главной.
 
-    Args:
-        page: Страница для парсинга.
+@register
+class AllstarsParser(SiteParser):
+    """Описание сайта all-stars.by."""
 
-    Returns:
-        Ссылку на следующую страницу.
-    """
-    pagination = page.findAll('nav', {'class': 'pages'})
-    if len(pagination) == 0:
-        return None
-    next_page_tag = pagination[0].findNext(
-        'a',
-        {'aria-label': 'Next'},
+    site = SiteEnum.ALLSTARS
+    base_url = BASE_URL
+    start_pages = (
+        '/store/men/shoes/',
+        '/store/women/shoes/',
     )
-    if next_page_tag is None:
-        return None
-    else:
-        return next_page_tag.attrs.get('href')
-
-
-def get_images(page: BeautifulSoup, base_url: str) -> list[HttpUrl]:
-    """Парсит страницу для получения ссылок на картинки модели.
-
-    Args:
-        page: Страница для парсинга.
-        base_url: Базовый url для подшивания в адреса.
-
-    Returns:
-        Список ссылок на картинки.
-    """
-    image_rotator = page.find('ul', {'class': 'js-images-main'}).findAll('img')
-    images = []
-    for img in image_rotator:
-        images.append(base_url + img.attrs['src'])
-    return images
+    pagination = PAGINATION
+    next_page = NEXT_PAGE
+    page_links = PAGE_LINKS
+    images = IMAGES
+    fingerprint_xpaths = FINGERPRINT_XPATHS
+    sitemaps = ('/sitemap.xml',)
+    sitemap_products = SITEMAP_PRODUCTS
+    get_product_links = staticmethod(get_product_links)
+
+    def product_fields(
+        self,
+        page: PageContext,
+        categories: set[Category],
+    ) -> dict[str, Any]:
+        """Извлекает поля продукта со страницы.
+
+        Категории берутся из хлебных крошек страницы продукта.
+
+        Args:
+            page: Страница продукта.
+            categories: Категории, в которых найден продукт.
+
+        Returns:
+            Поля модели продукта.
+        """
+        add_cart = page.first(ADD_CART)
+        price = add_cart.attrib['data-price']
+        old_price = add_cart.attrib['data-oldprice']
+        return {
+            'title': page.first(TITLE).attrib['content'],
+            'images': self.get_images(page),
+            'price': price,
+            'discounted_price': old_price if old_price != price else None,
+            'category': get_categories(page),
+            'article': get_article(page),
+            'specification': get_specification(page),
+        }
+
+    def fingerprint_extra(
+        self,
+        page: PageContext,
+        categories: set[Category],
+    ) -> Iterable[str]:
+        """Значения для отпечатка страницы, которых нет в её фрагментах.
+
+        Args:
+            page: Страница продукта.
+            categories: Категории, в которых найден продукт.
+
+        Returns:
+            Json кнопки добавления в корзину.
+        """
+        return (get_cart_json(page),)
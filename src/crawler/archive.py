@@ -0,0 +1,270 @@
+import base64
+import gzip
+import json
+import logging
+import os
+from collections import defaultdict, deque
+from typing import IO, Any, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+Headers = list[tuple[bytes, bytes]]
+URL = tuple[bytes, bytes, Optional[int], bytes]
+
+_record_path: Optional[str] = None
+_replay_path: Optional[str] = None
+_writer: Optional[IO[str]] = None
+_responses: Optional[dict[str, deque[dict[str, Any]]]] = None
+
+
+def configure(
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+) -> None:
+    """Включает запись ответов сайтов в архив или воспроизведение из него.
+
+    Args:
+        record: Путь к архиву для записи.
+        replay: Путь к архиву для воспроизведения.
+    """
+    global _record_path, _replay_path
+    _record_path = record
+    _replay_path = replay
+
+
+def enabled() -> bool:
+    """Проверяет, включены ли запись или воспроизведение.
+
+    Returns:
+        True, если ответы пишутся в архив или берутся из него.
+    """
+    return _record_path is not None or _replay_path is not None
+
+
+def replaying() -> bool:
+    """Проверяет, включено ли воспроизведение.
+
+    Returns:
+        True, если ответы берутся из архива.
+    """
+    return _replay_path is not None
+
+
+def wrap(transport: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+    """Подменяет транспорт клиента в соответствии с режимом.
+
+    Args:
+        transport: Сетевой транспорт.
+
+    Returns:
+        Транспорт для записи, воспроизведения или исходный.
+    """
+    if _replay_path is not None:
+        return ReplayTransport(_load(_replay_path))
+    if _record_path is not None:
+        return RecordingTransport(transport)
+    return transport
+
+
+def close() -> None:
+    """Закрывает архив записи."""
+    global _writer, _responses
+    if _writer is not None:
+        _writer.close()
+        logger.info('Recorded responses to %s.', _record_path)
+    _writer = None
+    _responses = None
+
+
+def url_to_str(url: URL) -> str:
+    """Адрес запроса транспорта в виде строки.
+
+    Args:
+        url: Схема, хост, порт и путь запроса.
+
+    Returns:
+        Адрес.
+    """
+    scheme, host, port, target = url
+    netloc = host.decode('ascii')
+    if port is not None:
+        netloc = '{0}:{1}'.format(netloc, port)
+    return '{0}://{1}{2}'.format(
+        scheme.decode('ascii'),
+        netloc,
+        target.decode('ascii'),
+    )
+
+
+def _write(record: dict[str, Any]) -> None:
+    """Дописывает ответ в архив.
+
+    Args:
+        record: Запись об ответе.
+    """
+    global _writer
+    if _writer is None:
+        directory = os.path.dirname(_record_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _writer = gzip.open(_record_path, 'wt', encoding='utf-8')
+    _writer.write(json.dumps(record))
+    _writer.write('\n')
+
+
+def _load(path: str) -> dict[str, deque[dict[str, Any]]]:
+    """Загружает архив ответов, один раз на процесс.
+
+    Args:
+        path: Путь к архиву.
+
+    Returns:
+        Ответы по адресу в порядке записи.
+    """
+    global _responses
+    if _responses is None:
+        _responses = defaultdict(deque)
+        with gzip.open(path, 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                record = json.loads(line)
+                _responses[record['url']].append(record)
+        logger.info('Loaded %d urls from %s.', len(_responses), path)
+    return _responses
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Транспорт, сохраняющий все ответы в архив."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        """Конструктор транспорта.
+
+        Args:
+            transport: Сетевой транспорт.
+        """
+        self._transport = transport
+
+    async def handle_async_request(
+        self,
+        method: bytes,
+        url: URL,
+        headers: Headers,
+        stream: httpx.AsyncByteStream,
+        extensions: dict,
+    ) -> tuple[int, Headers, httpx.AsyncByteStream, dict]:
+        """Выполняет запрос и записывает ответ.
+
+        Args:
+            method: Метод запроса.
+            url: Адрес запроса.
+            headers: Заголовки запроса.
+            stream: Тело запроса.
+            extensions: Расширения запроса.
+
+        Returns:
+            Ответ с прочитанным телом.
+        """
+        (
+            status_code,
+            response_headers,
+            response_stream,
+            response_extensions,
+        ) = await self._transport.handle_async_request(
+            method,
+            url,
+            headers,
+            stream,
+            extensions,
+        )
+        try:
+            body = b''.join([chunk async for chunk in response_stream])
+        finally:
+            await response_stream.aclose()
+        _write({
+            'method': method.decode('ascii'),
+            'url': url_to_str(url),
+            'status': status_code,
+            'http_version': response_extensions.get(
+                'http_version',
+                b'HTTP/1.1',
+            ).decode('ascii'),
+            'reason_phrase': response_extensions.get(
+                'reason_phrase',
+                b'',
+            ).decode('ascii'),
+            'headers': [
+                [name.decode('latin-1'), value.decode('latin-1')]
+                for name, value in response_headers
+            ],
+            'body': base64.b64encode(body).decode('ascii'),
+        })
+        return (
+            status_code,
+            response_headers,
+            httpx.ByteStream(body),
+            response_extensions,
+        )
+
+    async def aclose(self) -> None:
+        """Закрывает сетевой транспорт."""
+        await self._transport.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Транспорт, отдающий ответы из архива без обращения к сети.
+
+    Если адрес запрашивался при записи несколько раз, ответы отдаются в
+    том же порядке, последний ответ повторяется. На адреса, которых нет в
+    архиве, отвечает 404.
+    """
+
+    def __init__(self, responses: dict[str, deque[dict[str, Any]]]):
+        """Конструктор транспорта.
+
+        Args:
+            responses: Ответы по адресу.
+        """
+        self._responses = responses
+
+    async def handle_async_request(
+        self,
+        method: bytes,
+        url: URL,
+        headers: Headers,
+        stream: httpx.AsyncByteStream,
+        extensions: dict,
+    ) -> tuple[int, Headers, httpx.AsyncByteStream, dict]:
+        """Отдаёт записанный ответ.
+
+        Args:
+            method: Метод запроса.
+            url: Адрес запроса.
+            headers: Заголовки запроса.
+            stream: Тело запроса.
+            extensions: Расширения запроса.
+
+        Returns:
+            Записанный ответ.
+        """
+        address = url_to_str(url)
+        records = self._responses.get(address)
+        if not records:
+            logger.warning('No recorded response for %s.', address)
+            return 404, [], httpx.ByteStream(b''), {
+                'http_version': b'HTTP/1.1',
+                'reason_phrase': b'Not Found',
+            }
+        record = records.popleft() if len(records) > 1 else records[0]
+        return (
+            record['status'],
+            [
+                (name.encode('latin-1'), value.encode('latin-1'))
+                for name, value in record['headers']
+            ],
+            httpx.ByteStream(base64.b64decode(record['body'])),
+            {
+                'http_version': record['http_version'].encode('ascii'),
+                'reason_phrase': record['reason_phrase'].encode('ascii'),
+            },
+        )
@@ -0,0 +1,318 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+from httpx import Request, Response
+
+logger = logging.getLogger(__name__)
+
+STORED_HEADERS = ('content-type', 'etag', 'last-modified')
+
+_caches: dict[str, 'ResponseCache'] = {}
+
+
+def open_cache(
+    path: str,
+    max_size: int,
+    commit_batch: int = 1,
+) -> 'ResponseCache':
+    """Открывает кэш ответов, один на файл в процессе.
+
+    Клиенты сайтов, работающие в одном процессе, получают общий кэш,
+    поэтому размер кэша учитывается по всем сайтам сразу. Каждый
+    открывший кэш должен его закрыть.
+
+    Args:
+        path: Путь к файлу кэша.
+        max_size: Максимальный суммарный размер сжатых тел в байтах.
+        commit_batch: Количество изменений в одной транзакции.
+
+    Returns:
+        Кэш ответов.
+    """
+    cache = _caches.get(path)
+    if cache is None:
+        cache = ResponseCache(path, max_size, commit_batch)
+        _caches[path] = cache
+    cache.users += 1
+    return cache
+
+
+@dataclass
+class CacheEntry(object):
+    """Сохранённый ответ сервера."""
+
+    headers: dict[str, str]
+    body: bytes
+
+    def validators(self) -> dict[str, str]:
+        """Заголовки для условного запроса.
+
+        Returns:
+            If-None-Match и If-Modified-Since для известных валидаторов.
+        """
+        out = {}
+        if 'etag' in self.headers:
+            out['If-None-Match'] = self.headers['etag']
+        if 'last-modified' in self.headers:
+            out['If-Modified-Since'] = self.headers['last-modified']
+        return out
+
+    def to_response(self, request: Request) -> Response:
+        """Собирает из записи ответ, как будто он пришёл от сервера.
+
+        Args:
+            request: Запрос, на который получен 304.
+
+        Returns:
+            Ответ с сохранённым телом.
+        """
+        return Response(
+            200,
+            headers=self.headers,
+            content=self.body,
+            request=request,
+        )
+
+
+class ResponseCache(object):
+    """Дисковый кэш ответов с валидаторами ETag и Last-Modified.
+
+    Тела хранятся сжатыми в sqlite, при превышении размера вытесняются
+    давно не использованные записи. Размер учитывается в процессе и
+    перечитывается из файла перед вытеснением, но у каждого процесса
+    должен быть свой файл кэша, а в процессе кэш открывается через
+    open_cache. Если файл всё же занят другим процессом, ответ просто не
+    сохраняется.
+
+    Методы блокирующие и рассчитаны на вызов из потоков, обращения к файлу
+    выполняются по очереди. Изменения записываются транзакциями по
+    commit_batch штук, незаписанные сохраняются при закрытии.
+    """
+
+    def __init__(self, path: str, max_size: int, commit_batch: int = 1):
+        """Конструктор кэша.
+
+        Args:
+            path: Путь к файлу кэша.
+            max_size: Максимальный суммарный размер сжатых тел в байтах.
+            commit_batch: Количество изменений в одной транзакции.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.users = 0
+        self.commit_batch = commit_batch
+        self._path = path
+        self._uncommitted = 0
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'url TEXT PRIMARY KEY, headers TEXT, body BLOB, '
+            'size INTEGER, accessed REAL)',
+        )
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS responses_accessed '
+            'ON responses (accessed)',
+        )
+        self._size = self._read_size()
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """Ищет запись в кэше.
+
+        Args:
+            url: Полный адрес страницы.
+
+        Returns:
+            Запись или None.
+        """
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    'SELECT headers, body FROM responses WHERE url = ?',
+                    (url,),
+                ).fetchone()
+        except sqlite3.OperationalError as exc:
+            logger.warning('Cached response %s is not read: %s', url, exc)
+            return None
+        if row is None:
+            return None
+        return CacheEntry(
+            headers=json.loads(row[0]),
+            body=zlib.decompress(row[1]),
+        )
+
+    def resolve(
+        self,
+        url: str,
+        entry: Optional[CacheEntry],
+        response: Response,
+    ) -> Response:
+        """Обрабатывает ответ на условный запрос.
+
+        На 304 возвращает сохранённое тело, на 200 обновляет запись.
+
+        Args:
+            url: Полный адрес страницы.
+            entry: Запись, по которой строился запрос.
+            response: Ответ сервера.
+
+        Returns:
+            Ответ для парсера.
+        """
+        if response.status_code == 304 and entry is not None:
+            with self._lock:
+                self.hits += 1
+                self._touch(url)
+            return entry.to_response(response.request)
+        with self._lock:
+            self.misses += 1
+        if response.status_code == 200:
+            self.store(url, response)
+        return response
+
+    def store(self, url: str, response: Response) -> None:
+        """Сохраняет ответ, если у него есть валидаторы.
+
+        Args:
+            url: Полный адрес страницы.
+            response: Ответ сервера.
+        """
+        headers = {
+            name: response.headers[name]
+            for name in STORED_HEADERS
+            if name in response.headers
+        }
+        if 'etag' not in headers and 'last-modified' not in headers:
+            return
+        body = zlib.compress(response.content)
+        with self._lock:
+            try:
+                previous = self._db.execute(
+                    'SELECT size FROM responses WHERE url = ?',
+                    (url,),
+                ).fetchone()
+                self._db.execute(
+                    'REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                    (url, json.dumps(headers), body, len(body), time.time()),
+                )
+                self._changed()
+            except sqlite3.OperationalError as exc:
+                self._rollback()
+                logger.warning('Response %s is not cached: %s', url, exc)
+                return
+            self._size += len(body) - (previous[0] if previous else 0)
+            if self._size > self.max_size:
+                self._evict()
+
+    def stats(self) -> dict[str, int]:
+        """Статистика использования кэша.
+
+        Returns:
+            Попадания, промахи, вытеснения и текущий размер.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': self._size,
+        }
+
+    def close(self) -> None:
+        """Закрывает файл кэша, когда его закрыли все открывшие."""
+        with self._lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if _caches.get(self._path) is self:
+                del _caches[self._path]
+            try:
+                self._db.commit()
+            except sqlite3.OperationalError as exc:
+                logger.warning('Cached responses are not saved: %s', exc)
+            self._db.close()
+
+    def _changed(self) -> None:
+        """Учитывает изменение и записывает транзакцию, если она набрана."""
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_batch:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def _rollback(self) -> None:
+        """Откатывает незаписанные изменения и перечитывает размер."""
+        self._db.rollback()
+        self._uncommitted = 0
+        try:
+            self._size = self._read_size()
+        except sqlite3.OperationalError:
+            logger.debug('Cache size is not refreshed.')
+
+    def _read_size(self) -> int:
+        """Суммарный размер сжатых тел в файле кэша.
+
+        Returns:
+            Размер в байтах.
+        """
+        return self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses',
+        ).fetchone()[0]
+
+    def _touch(self, url: str) -> None:
+        """Отмечает использование записи.
+
+        Args:
+            url: Полный адрес страницы.
+        """
+        try:
+            self._db.execute(
+                'UPDATE responses SET accessed = ? WHERE url = ?',
+                (time.time(), url),
+            )
+            self._changed()
+        except sqlite3.OperationalError as exc:
+            self._rollback()
+            logger.warning('Cached response %s is not touched: %s', url, exc)
+
+    def _evict(self) -> None:
+        """Удаляет давно использованные записи до 90% от лимита.
+
+        Размер перечитывается из файла, чтобы учесть записи, сделанные в
+        обход этого экземпляра.
+        """
+        target = self.max_size * 0.9
+        evicted = []
+        try:
+            size = self._read_size()
+            rows = self._db.execute(
+                'SELECT url, size FROM responses ORDER BY accessed',
+            )
+            for url, entry_size in rows:
+                if size <= target:
+                    break
+                evicted.append((url,))
+                size -= entry_size
+            self._db.executemany(
+                'DELETE FROM responses WHERE url = ?',
+                evicted,
+            )
+            self._db.commit()
+            self._uncommitted = 0
+        except sqlite3.OperationalError as exc:
+            self._rollback()
+            logger.warning('Cached responses are not evicted: %s', exc)
+            return
+        self._size = size
+        self.evictions += len(evicted)
+        logger.info('Evicted %d cached responses.', len(evicted))
@@ -0,0 +1,135 @@
+import logging
+from typing import Iterable
+
+from fastapi.encoders import jsonable_encoder
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from src.enums import SiteEnum
+from src.models import Category
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlCheckpoint(object):
+    """Сохраняемое состояние парсинга сайта в рамках запуска.
+
+    В базу по ходу парсинга пишутся найденные в каталоге ссылки на
+    продукты. Разобранными считаются продукты, документы которых уже
+    записаны с версией запуска, поэтому отметка о завершении появляется
+    только после записи пачки. При продолжении прерванного запуска
+    разобранные продукты пропускаются, а остальные найденные ставятся в
+    очередь сразу, не дожидаясь обхода каталога.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        version: int,
+        site: SiteEnum,
+        base_url: str,
+    ):
+        """Конструктор состояния.
+
+        Args:
+            db: База данных приложения.
+            version: Версия запуска.
+            site: Сайт.
+            base_url: Базовый адрес сайта.
+        """
+        self.state = db['byshoes-crawl-state']
+        self.runs = db['byshoes-runs']
+        self.products = db['byshoes-collection']
+        self.version = version
+        self.site = site
+        self.base_url = base_url
+        self._pending: list[UpdateOne] = []
+
+    async def is_finished(self) -> bool:
+        """Проверяет, завершён ли уже парсинг сайта в этом запуске.
+
+        Returns:
+            True, если сайт уже полностью разобран.
+        """
+        run = await self.runs.find_one(
+            {'_id': self.version, 'sites_finished': self.site.value},
+        )
+        return run is not None
+
+    async def load_discovered(self) -> list[tuple[str, set[Category]]]:
+        """Загружает найденные в каталоге продукты.
+
+        Returns:
+            Ссылки на продукты и их категории.
+        """
+        records = self.state.find(
+            {'version': self.version, 'site': self.site.value},
+            {'url': 1, 'categories': 1},
+        )
+        return [
+            (
+                record['url'],
+                {Category(**category) for category in record['categories']},
+            )
+            async for record in records
+        ]
+
+    async def load_written(self) -> list[tuple[str, str, set[Category]]]:
+        """Загружает уже записанные в этом запуске продукты.
+
+        Returns:
+            Ссылки на продукты, идентификаторы документов и категории.
+        """
+        documents = self.products.find(
+            {'version': self.version, 'site': self.site.value},
+            {'link': 1, 'category': 1},
+        )
+        return [
+            (
+                document['link'][len(self.base_url):],
+                document['_id'],
+                {Category(**category) for category in document['category']},
+            )
+            async for document in documents
+        ]
+
+    async def discover(self, url: str, categories: Iterable[Category]) -> None:
+        """Запоминает найденный продукт.
+
+        Args:
+            url: Ссылка на страницу продукта.
+            categories: Категории, в которых найден продукт.
+        """
+        self._pending.append(UpdateOne(
+            {'_id': '{0}:{1}:{2}'.format(self.version, self.site.value, url)},
+            {
+                '$setOnInsert': {
+                    'version': self.version,
+                    'site': self.site.value,
+                    'url': url,
+                },
+                '$addToSet': {'categories': {
+                    '$each': jsonable_encoder(list(categories)),
+                }},
+            },
+            upsert=True,
+        ))
+        if len(self._pending) >= settings.WRITE_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Записывает найденные продукты в базу."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        await self.state.bulk_write(pending, ordered=False)
+
+    async def finish(self) -> None:
+        """Отмечает парсинг сайта завершённым."""
+        await self.flush()
+        await self.runs.update_one(
+            {'_id': self.version},
+            {'$addToSet': {'sites_finished': self.site.value}},
+        )
+        logger.info('Site %s finished in run %d.', self.site, self.version)
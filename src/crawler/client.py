@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Union
+
+import httpx
+from asgiref.sync import sync_to_async
+from httpx import Response
+
+from src.crawler import archive
+from src.crawler.cache import CacheEntry, ResponseCache, open_cache
+from src.crawler.limiter import AdaptiveRateLimiter
+from src.crawler.metrics import CrawlMetrics
+from src.crawler.retry import CircuitBreaker, FetchError, RetryPolicy
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def create_client(base_url: str) -> httpx.AsyncClient:
+    """Создаёт httpx клиент с пулом соединений для сайта.
+
+    Args:
+        base_url: Базовый адрес сайта.
+
+    Returns:
+        Настроенный клиент.
+    """
+    transport = httpx.AsyncHTTPTransport(
+        http2=settings.HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+    return httpx.AsyncClient(
+        base_url=base_url,
+        transport=archive.wrap(transport),
+        timeout=httpx.Timeout(
+            settings.HTTP_READ_TIMEOUT,
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+        ),
+    )
+
+
+class SiteClient(object):
+    """Долгоживущий клиент сайта с ограничением одновременных запросов.
+
+    Один экземпляр используется на весь запуск парсинга сайта, как для
+    страниц каталога, так и для страниц продуктов. Частота запросов к
+    хосту регулируется адаптивным ограничителем, а при включённом кэше
+    запросы отправляются условными. При воспроизведении ответов из архива
+    ограничитель и кэш отключаются. Неудачные запросы повторяются по
+    политике повторов, а при всплеске ошибок запросы к сайту
+    приостанавливаются.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        max_in_flight: Optional[int] = None,
+        cached: bool = True,
+        metrics: Optional[CrawlMetrics] = None,
+    ):
+        """Конструктор клиента.
+
+        Args:
+            base_url: Базовый адрес сайта.
+            max_in_flight: Максимум одновременных запросов, по умолчанию
+                из настроек.
+            cached: Использовать кэш ответов, если он включён.
+            metrics: Метрики сайта, по умолчанию с хостом сайта в метке.
+        """
+        self.base_url = base_url
+        self._client = create_client(base_url)
+        self.metrics = metrics or CrawlMetrics(self._client.base_url.host)
+        self.limiter: Optional[AdaptiveRateLimiter] = None
+        if not archive.replaying():
+            self.limiter = AdaptiveRateLimiter(self._client.base_url.host)
+        self.retry = RetryPolicy()
+        self.breaker = CircuitBreaker(self._client.base_url.host)
+        self._semaphore = asyncio.Semaphore(
+            max_in_flight or settings.CRAWL_MAX_IN_FLIGHT,
+        )
+        self.cache: Optional[ResponseCache] = None
+        enabled = cached and settings.HTTP_CACHE_ENABLED
+        if enabled and not archive.enabled():
+            self.cache = open_cache(
+                settings.HTTP_CACHE_PATH,
+                settings.HTTP_CACHE_MAX_SIZE,
+                settings.HTTP_CACHE_COMMIT_BATCH,
+            )
+
+    async def get(self, url: str) -> Response:
+        """Выполняет GET запрос с повторами по политике клиента.
+
+        Args:
+            url: Адрес страницы относительно базового.
+
+        Returns:
+            Успешный ответ сервера.
+
+        Raises:
+            FetchError: Если страницу не удалось загрузить.
+        """
+        attempt = 1
+        while True:
+            await self.breaker.wait()
+            response, reason = await self._attempt(url)
+            if response is not None:
+                return response
+            if attempt >= self.retry.attempts:
+                raise FetchError(url, reason)
+            delay = self.retry.delay(attempt)
+            self.metrics.retry()
+            logger.info(
+                'Retrying %s in %.1fs after %s.',
+                url,
+                delay,
+                reason,
+                extra={
+                    'site': self.metrics.site,
+                    'url': url,
+                    'status': reason,
+                },
+            )
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream(self, url: str) -> AsyncIterator[Response]:
+        """Выполняет GET запрос, тело ответа читается по частям.
+
+        Для больших документов вроде карты сайта: кэш и повторы не
+        используются, лимиты одновременных запросов и частоты те же, что у
+        get.
+
+        Args:
+            url: Адрес относительно базового.
+
+        Yields:
+            Ответ с непрочитанным телом.
+
+        Raises:
+            FetchError: Если запрос не удался или сервер вернул ошибку.
+        """
+        await self.breaker.wait()
+        async with self._semaphore:
+            if self.limiter:
+                await self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                with self.metrics.in_flight.track_inprogress():
+                    async with self._client.stream('GET', url) as response:
+                        self._feedback(response.status_code, started)
+                        if response.is_error:
+                            raise FetchError(url, response.status_code)
+                        try:
+                            yield response
+                        finally:
+                            self.metrics.add_bytes(
+                                response.num_bytes_downloaded,
+                            )
+            except httpx.TransportError as exc:
+                self._feedback(None, started)
+                raise FetchError(url, repr(exc))
+
+    async def _attempt(
+        self,
+        url: str,
+    ) -> tuple[Optional[Response], Union[int, str]]:
+        """Выполняет одну попытку запроса.
+
+        Args:
+            url: Адрес страницы относительно базового.
+
+        Returns:
+            Успешный ответ или None и причина неудачи для повтора.
+
+        Raises:
+            FetchError: Если ответ не имеет смысла повторять.
+        """
+        try:
+            response = await self._send(url)
+        except httpx.TransportError as exc:
+            self.breaker.record(False)
+            return None, repr(exc)
+        if not response.is_error:
+            self.breaker.record(True)
+            return response, response.status_code
+        retryable = self.retry.is_retryable(response.status_code)
+        self.breaker.record(not retryable)
+        if not retryable:
+            raise FetchError(url, response.status_code)
+        return None, response.status_code
+
+    async def _send(self, url: str) -> Response:
+        """Выполняет один GET запрос с учётом лимита одновременных запросов.
+
+        Args:
+            url: Адрес страницы относительно базового.
+
+        Returns:
+            Ответ сервера.
+        """
+        full_url = str(self._client.base_url.join(url))
+        entry = await self._cached(full_url)
+        async with self._semaphore:
+            if self.limiter:
+                await self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                with self.metrics.in_flight.track_inprogress():
+                    response = await self._client.get(
+                        url,
+                        headers=entry.validators() if entry else None,
+                    )
+            except httpx.TransportError:
+                self._feedback(None, started)
+                raise
+            self._feedback(response.status_code, started)
+            self.metrics.add_bytes(response.num_bytes_downloaded)
+        if self.cache:
+            return await sync_to_async(
+                self.cache.resolve,
+                thread_sensitive=False,
+            )(full_url, entry, response)
+        return response
+
+    async def _cached(self, full_url: str) -> Optional[CacheEntry]:
+        """Ищет ответ в кэше, не блокируя цикл событий.
+
+        Args:
+            full_url: Полный адрес страницы.
+
+        Returns:
+            Запись кэша или None.
+        """
+        if self.cache is None:
+            return None
+        return await sync_to_async(
+            self.cache.get,
+            thread_sensitive=False,
+        )(full_url)
+
+    def _feedback(self, status_code: Optional[int], started: float) -> None:
+        """Передаёт результат запроса ограничителю частоты и в метрики.
+
+        Args:
+            status_code: Код ответа, None если запрос не удался.
+            started: Время начала запроса.
+        """
+        elapsed = time.monotonic() - started
+        self.metrics.request(status_code, elapsed)
+        if self.limiter:
+            self.limiter.feedback(status_code, elapsed)
+
+    async def aclose(self) -> None:
+        """Закрывает пул соединений и кэш."""
+        await self._client.aclose()
+        if self.cache:
+            logger.info('Cache %s: %s.', self.base_url, self.cache.stats())
+            await sync_to_async(self.cache.close, thread_sensitive=False)()
+
+    async def __aenter__(self) -> 'SiteClient':
+        """Вход в контекстный менеджер.
+
+        Returns:
+            Клиент сайта.
+        """
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        """Выход из контекстного менеджера.
+
+        Args:
+            args: Информация об исключении.
+        """
+        await self.aclose()
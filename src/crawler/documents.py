@@ -0,0 +1,370 @@
+import logging
+import random
+import re
+import uuid
+from datetime import datetime
+from typing import Any, Iterable, Optional
+
+import pytz
+from fastapi.encoders import jsonable_encoder
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import ValidationError
+
+from src.crawler.history import version_source
+from src.enums import SexEnum, SiteEnum
+from src.models import Category, ProductModelParse
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Подмножество адресов, которые HttpUrl точно принимает без изменений.
+# Остальные адреса проверяет полная валидация модели.
+TRUSTED_URL = re.compile(
+    r'^https?://[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,63}'
+    r'(?::[0-9]{1,5})?(?:/[^\s?#]*)?(?:\?[^\s#]*)?(?:#[^\s#]*)?$',
+)
+URL_MAX_LENGTH = 2083
+UNKNOWN_COLOR = 'неизвестно'
+VOLATILE_FIELDS = ('_id', 'parsed')
+
+
+class UntrustedValue(ValueError):
+    """Значение нельзя привести без полной валидации модели."""
+
+
+def build_document(fields: dict[str, Any]) -> dict[str, Any]:
+    """Собирает документ продукта для записи в базу.
+
+    Поля приводятся быстрым путём без модели. Если значение не удаётся
+    привести, документ собирается через модель, чтобы ошибка была такой
+    же, как при полной валидации. Часть документов в режиме sampled
+    дополнительно сверяется с моделью.
+
+    Args:
+        fields: Поля модели продукта.
+
+    Returns:
+        Документ в том же виде, что и jsonable_encoder модели.
+
+    Raises:
+        ValidationError: Поля не проходят валидацию модели.
+    """
+    if settings.VALIDATION_MODE == 'full':
+        return build_validated(fields)
+    try:
+        document = build_trusted(fields)
+    except (KeyError, TypeError, ValueError):
+        return build_validated(fields)
+    sampled = random.random() < settings.VALIDATION_SAMPLE_RATE  # noqa: S311
+    if settings.VALIDATION_MODE == 'sampled' and sampled:
+        return check_document(fields, document)
+    return document
+
+
+def build_validated(fields: dict[str, Any]) -> dict[str, Any]:
+    """Собирает документ через полную валидацию модели.
+
+    Args:
+        fields: Поля модели продукта.
+
+    Returns:
+        Документ для записи в базу.
+    """
+    return jsonable_encoder(ProductModelParse(**fields), by_alias=True)
+
+
+def build_trusted(fields: dict[str, Any]) -> dict[str, Any]:
+    """Собирает документ без модели.
+
+    Повторяет приведение типов и валидаторы ProductModelParse для данных,
+    которые отдают парсеры сайтов. Порядок ключей совпадает с порядком
+    полей модели.
+
+    Args:
+        fields: Поля модели продукта.
+
+    Returns:
+        Документ для записи в базу.
+    """
+    return {
+        '_id': str(uuid.uuid4()),
+        'title': normalize_str(fields['title']),
+        'images': [
+            normalize_url(image)
+            for image in normalize_list(fields['images'])
+        ],
+        'link': normalize_url(fields['link']),
+        'price': normalize_float(fields['price']),
+        'discounted_price': normalize_optional_float(
+            fields.get('discounted_price'),
+        ),
+        'category': normalize_categories(fields['category']),
+        'specification': normalize_specification(fields['specification']),
+        'site': SiteEnum(fields['site']).value,
+        'article': normalize_optional_str(fields.get('article')),
+        'parsed': datetime.now(pytz.utc).isoformat(),
+        'version': fields.get('version'),
+    }
+
+
+def check_document(
+    fields: dict[str, Any],
+    document: dict[str, Any],
+) -> dict[str, Any]:
+    """Сверяет документ быстрого пути с полной валидацией.
+
+    Args:
+        fields: Поля модели продукта.
+        document: Документ быстрого пути.
+
+    Returns:
+        Документ модели, если документы расходятся, иначе тот же документ.
+    """
+    validated = build_validated(fields)
+    differs = diff_documents(validated, document)
+    if not differs:
+        return document
+    logger.warning(
+        'Trusted document of %s differs from model in %s',
+        fields.get('link'),
+        ', '.join(differs),
+    )
+    return validated
+
+
+def diff_documents(expected: dict[str, Any], actual: dict[str, Any]) -> list:
+    """Поля, в которых документы расходятся.
+
+    Идентификатор и время разбора не сравниваются.
+
+    Args:
+        expected: Документ модели.
+        actual: Проверяемый документ.
+
+    Returns:
+        Имена различающихся полей.
+    """
+    return [
+        key
+        for key in expected.keys() | actual.keys()
+        if key not in VOLATILE_FIELDS and expected.get(key) != actual.get(key)
+    ]
+
+
+async def validate_stored(
+    db: AsyncIOMotorDatabase,
+    version: int,
+    limit: int = 0,
+) -> tuple[int, int]:
+    """Проверяет записанные документы версии полной валидацией модели.
+
+    Проверка для документов, собранных без модели: выполняется отдельно
+    от парсинга и не замедляет его. Документы старых версий собираются
+    по журналу изменений.
+
+    Args:
+        db: База данных.
+        version: Версия запуска.
+        limit: Максимум документов, 0 - все документы версии.
+
+    Returns:
+        Количество проверенных и невалидных документов.
+    """
+    checked = 0
+    invalid = 0
+    collection, pipeline = await version_source(db, version)
+    if limit:
+        pipeline = pipeline + [{'$limit': limit}]
+    documents = collection.aggregate(pipeline, allowDiskUse=True)
+    async for document in documents:
+        checked += 1
+        try:
+            model = ProductModelParse.parse_obj(document)
+        except ValidationError as exc:
+            invalid += 1
+            logger.warning('Invalid document %s: %s', document['_id'], exc)
+            continue
+        differs = diff_documents(
+            jsonable_encoder(model, by_alias=True),
+            document,
+        )
+        if differs:
+            invalid += 1
+            logger.warning(
+                'Document %s differs from model in %s',
+                document['_id'],
+                ', '.join(differs),
+            )
+    return checked, invalid
+
+
+def normalize_str(value: Any) -> str:
+    """Строка, которую str модели оставит без изменений.
+
+    Args:
+        value: Значение поля.
+
+    Returns:
+        Та же строка.
+
+    Raises:
+        UntrustedValue: Значение не строка.
+    """
+    if not isinstance(value, str):
+        raise UntrustedValue(value)
+    return value
+
+
+def normalize_optional_str(value: Any) -> Optional[str]:
+    """Необязательная строка.
+
+    Args:
+        value: Значение поля.
+
+    Returns:
+        Строка или None.
+    """
+    return None if value is None else normalize_str(value)
+
+
+def normalize_float(value: Any) -> float:
+    """Число так же, как его приводит float модели.
+
+    Args:
+        value: Значение поля.
+
+    Returns:
+        Число.
+    """
+    if isinstance(value, float):
+        return value
+    if isinstance(value, bool):
+        raise UntrustedValue(value)
+    return float(value)
+
+
+def normalize_optional_float(value: Any) -> Optional[float]:
+    """Необязательное число.
+
+    Args:
+        value: Значение поля.
+
+    Returns:
+        Число или None.
+    """
+    return None if value is None else normalize_float(value)
+
+
+def normalize_list(value: Any) -> list:
+    """Список, который list модели примет поэлементно.
+
+    Args:
+        value: Значение поля.
+
+    Returns:
+        Тот же список.
+
+    Raises:
+        UntrustedValue: Значение не список.
+    """
+    if not isinstance(value, list):
+        raise UntrustedValue(value)
+    return value
+
+
+def normalize_url(value: Any) -> str:
+    """Ссылка, которую HttpUrl примет без изменений.
+
+    Args:
+        value: Ссылка.
+
+    Returns:
+        Та же ссылка.
+
+    Raises:
+        UntrustedValue: Ссылку нужно проверить моделью.
+    """
+    value = normalize_str(value)
+    if len(value) > URL_MAX_LENGTH or not TRUSTED_URL.match(value):
+        raise UntrustedValue(value)
+    return value
+
+
+def normalize_categories(categories: Iterable[Category]) -> list[dict]:
+    """Категории продукта.
+
+    Категории уже прошли валидаторы модели Category при создании.
+
+    Args:
+        categories: Категории.
+
+    Returns:
+        Категории в виде словарей.
+
+    Raises:
+        UntrustedValue: Категория не является моделью.
+    """
+    out = []
+    for category in categories:
+        if not isinstance(category, Category):
+            raise UntrustedValue(category)
+        out.append({'id': category.id, 'name': category.name})
+    return out
+
+
+def normalize_specification(specification: dict[str, Any]) -> dict:
+    """Характеристики продукта так же, как их приводит Specification.
+
+    Args:
+        specification: Размеры, цвета и пол.
+
+    Returns:
+        Характеристики в виде словаря.
+    """
+    colors = [UNKNOWN_COLOR]
+    if 'color' in specification:
+        colors = [
+            normalize_color(color)
+            for color in normalize_list(specification['color'])
+        ]
+    return {
+        'size': [
+            normalize_size(size)
+            for size in normalize_list(specification['size'])
+        ],
+        'color': colors,
+        'sex': SexEnum(specification['sex']).value,
+    }
+
+
+def normalize_size(size: dict[str, Any]) -> dict[str, Any]:
+    """Размерная сетка так же, как её приводит Size.
+
+    Args:
+        size: Тип сетки и значения.
+
+    Returns:
+        Размерная сетка в виде словаря.
+    """
+    return {
+        'size_type': normalize_str(size['size_type']),
+        'values': [
+            normalize_float(value)
+            for value in normalize_list(size['values'])
+        ],
+    }
+
+
+def normalize_color(color: Optional[str]) -> str:
+    """Цвет так же, как его приводит валидатор Specification.
+
+    Args:
+        color: Цвет с сайта.
+
+    Returns:
+        Цвет в нижнем регистре.
+    """
+    if color is None:
+        return UNKNOWN_COLOR
+    color = normalize_str(color).lower()
+    return UNKNOWN_COLOR if color == 'array' else color
@@ -0,0 +1,180 @@
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from httpx import Response
+from lxml import etree, html
+
+TEXT = etree.XPath('string()', smart_strings=False)
+
+
+def has_class(name: str) -> str:
+    """Условие XPath на наличие класса у элемента.
+
+    Работает так же как поиск по классу в BeautifulSoup: класс должен
+    быть одним из перечисленных через пробел.
+
+    Args:
+        name: Имя класса.
+
+    Returns:
+        Условие для подстановки в предикат XPath.
+    """
+    return (
+        "contains(concat(' ', normalize-space(@class), ' '), ' {0} ')"
+    ).format(name)
+
+
+def compile_xpath(expression: str) -> etree.XPath:
+    """Компилирует выражение XPath один раз на модуль.
+
+    Args:
+        expression: Выражение XPath.
+
+    Returns:
+        Скомпилированное выражение, возвращающее обычные строки.
+    """
+    return etree.XPath(expression, smart_strings=False)
+
+
+def find_next(tag: str, condition: Optional[str] = None) -> etree.XPath:
+    """Аналог findNext из BeautifulSoup.
+
+    Ищет первый подходящий элемент после узла в порядке документа, сначала
+    среди потомков, затем среди следующих за ним элементов.
+
+    Args:
+        tag: Имя тега.
+        condition: Условие для предиката.
+
+    Returns:
+        Скомпилированное относительное выражение.
+    """
+    step = '{0}[{1}]'.format(tag, condition) if condition else tag
+    return compile_xpath(
+        '(descendant::{0} | following::{0})[1]'.format(step),
+    )
+
+
+def text(node: Any) -> str:
+    """Текст элемента со всеми потомками, как .text у BeautifulSoup.
+
+    Args:
+        node: Элемент страницы.
+
+    Returns:
+        Текст элемента.
+    """
+    return TEXT(node)
+
+
+@lru_cache(maxsize=None)
+def _get_parser(encoding: Optional[str]) -> html.HTMLParser:
+    """Парсер HTML для кодировки.
+
+    Args:
+        encoding: Кодировка страницы.
+
+    Returns:
+        Парсер lxml.
+    """
+    return html.HTMLParser(encoding=encoding)
+
+
+class PageContext(object):
+    """Разобранная страница с кэшем найденных узлов.
+
+    Страница разбирается lxml один раз прямо из байт ответа, результаты
+    выражений XPath и производные значения (например декодированный json)
+    запоминаются, поэтому повторные обращения экстракторов к одним и тем
+    же узлам ничего не стоят.
+    """
+
+    def __init__(self, content: bytes, encoding: Optional[str] = None):
+        """Конструктор контекста.
+
+        Args:
+            content: Тело страницы.
+            encoding: Кодировка страницы.
+        """
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+        self.tree = etree.fromstring(content, _get_parser(encoding))
+        self._text: Optional[str] = None
+        self._memo: dict[Any, Any] = {}
+
+    @classmethod
+    def from_response(cls, response: Response) -> 'PageContext':
+        """Создаёт контекст по ответу сервера.
+
+        Args:
+            response: Ответ сервера.
+
+        Returns:
+            Контекст страницы.
+        """
+        return cls(response.content, response.encoding)
+
+    @property
+    def text(self) -> str:
+        """Декодированный текст страницы.
+
+        Returns:
+            Текст страницы.
+        """
+        if self._text is None:
+            self._text = self.content.decode(self.encoding, errors='replace')
+        return self._text
+
+    def xpath(self, query: etree.XPath, **variables: str) -> list[Any]:
+        """Выполняет выражение над страницей с запоминанием результата.
+
+        Args:
+            query: Скомпилированное выражение.
+            variables: Переменные выражения.
+
+        Returns:
+            Найденные узлы.
+        """
+        key = (query, tuple(sorted(variables.items())))
+        if key not in self._memo:
+            self._memo[key] = query(self.tree, **variables)
+        return self._memo[key]
+
+    def first(self, query: etree.XPath, **variables: str) -> Any:
+        """Первый найденный узел, как find у BeautifulSoup.
+
+        Args:
+            query: Скомпилированное выражение.
+            variables: Переменные выражения.
+
+        Returns:
+            Узел или None.
+        """
+        nodes = self.xpath(query, **variables)
+        return nodes[0] if nodes else None
+
+    def last(self, query: etree.XPath, **variables: str) -> Any:
+        """Последний найденный узел, как findAll(...).pop().
+
+        Args:
+            query: Скомпилированное выражение.
+            variables: Переменные выражения.
+
+        Returns:
+            Узел.
+        """
+        return self.xpath(query, **variables)[-1]
+
+    def memo(self, key: str, factory: Callable[[], Any]) -> Any:
+        """Запоминает производное значение страницы.
+
+        Args:
+            key: Имя значения.
+            factory: Функция для вычисления значения.
+
+        Returns:
+            Значение.
+        """
+        if key not in self._memo:
+            self._memo[key] = factory()
+        return self._memo[key]
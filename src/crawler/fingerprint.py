@@ -0,0 +1,364 @@
+import hashlib
+import json
+import logging
+import math
+import uuid
+from datetime import datetime
+from typing import Any, Iterable, Optional
+
+import pytz
+from fastapi.encoders import jsonable_encoder
+from lxml import etree, html
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
+
+from src.crawler.extract import PageContext
+from src.enums import SiteEnum
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def page_fingerprint(
+    ctx: PageContext,
+    xpaths: Iterable[etree.XPath],
+    extra: Iterable[str] = (),
+) -> str:
+    """Считает отпечаток значимых для парсинга фрагментов страницы.
+
+    Args:
+        ctx: Разобранная страница.
+        xpaths: Скомпилированные выражения для поиска фрагментов.
+        extra: Дополнительные значения, которых нет на странице.
+
+    Returns:
+        Хеш фрагментов.
+    """
+    digest = hashlib.sha1()
+    for xpath in xpaths:
+        for node in ctx.xpath(xpath):
+            if isinstance(node, str):
+                digest.update(node.encode())
+            else:
+                digest.update(html.tostring(node))
+        digest.update(b'\0')
+    for value in extra:
+        digest.update(value.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def product_state(document: dict[str, Any]) -> str:
+    """Хеш значимых для покупателя полей документа: цен и размеров.
+
+    Args:
+        document: Документ продукта.
+
+    Returns:
+        Хеш полей.
+    """
+    state = [
+        document.get('price'),
+        document.get('discounted_price'),
+        document.get('specification', {}).get('size'),
+    ]
+    return hashlib.sha1(
+        json.dumps(state, sort_keys=True).encode(),
+    ).hexdigest()
+
+
+def change_probability(
+    stats: dict[str, Any],
+    checked: datetime,
+    now: datetime,
+) -> float:
+    """Вероятность, что продукт изменился с последней проверки.
+
+    Изменения считаются пуассоновским потоком, интенсивность оценивается
+    по числу изменений за время наблюдения с априорной оценкой из
+    настроек, поэтому у продуктов без истории она не нулевая.
+
+    Args:
+        stats: Статистика изменений продукта.
+        checked: Время последней проверки.
+        now: Текущее время.
+
+    Returns:
+        Вероятность изменения.
+    """
+    observed = (checked - stats.get('first_checked', checked)).total_seconds()
+    rate = (stats.get('changes', 0) + settings.RECRAWL_PRIOR_CHANGES) / (
+        observed + settings.RECRAWL_PRIOR_PERIOD
+    )
+    elapsed = max((now - checked).total_seconds(), 0)
+    return 1 - math.exp(-rate * elapsed)
+
+
+class FingerprintStore(object):
+    """Хранилище отпечатков страниц продуктов по (сайт, артикул).
+
+    Вместе с отпечатком хранится последний собранный документ, чтобы
+    для не изменившихся страниц не выполнять полный парсинг и валидацию.
+
+    Для каждого продукта копится статистика проверок и изменений цен и
+    размеров. По ней перед запуском выбираются продукты, которые стоит
+    загрузить, остальные берутся из прошлого документа.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection, site: SiteEnum):
+        """Конструктор хранилища.
+
+        Args:
+            collection: Коллекция с отпечатками.
+            site: Сайт, к которому относятся отпечатки.
+        """
+        self.collection = collection
+        self.site = site
+        self.enabled = settings.FINGERPRINT_ENABLED
+        self.reused = 0
+        self._by_link: dict[str, dict[str, Any]] = {}
+        self._pending: list[UpdateOne] = []
+        self._due: Optional[set[str]] = None
+
+    async def load(self, links: Optional[Iterable[str]] = None) -> None:
+        """Загружает отпечатки сайта в память.
+
+        Сохранённые документы не загружаются, они читаются из базы, только
+        когда документ переиспользуется, поэтому память не растёт вместе
+        с каталогом документов.
+
+        Args:
+            links: Загрузить только отпечатки этих страниц.
+        """
+        if not self.enabled:
+            return
+        query: dict[str, Any] = {'site': self.site.value}
+        if links is not None:
+            query['link'] = {'$in': list(links)}
+        records = self.collection.find(
+            query,
+            {'link': 1, 'fingerprint': 1, 'stats': 1, 'document.parsed': 1},
+        )
+        async for record in records:
+            self._by_link[record['link']] = record
+
+    def plan(self, budget: Optional[int] = None) -> None:
+        """Выбирает известные продукты, которые нужно загрузить в запуске.
+
+        Продукт загружается, если вероятность его изменения достигла
+        порога из настроек или он не проверялся дольше предельного срока.
+        С бюджетом загружаются только самые вероятно изменившиеся, просроченные
+        продукты идут первыми. Новые продукты загружаются всегда.
+
+        Args:
+            budget: Загрузок известных продуктов за запуск, по умолчанию
+                из настроек. 0 - без ограничений.
+        """
+        if not self.enabled or not settings.RECRAWL_ENABLED:
+            return
+        budget = settings.RECRAWL_BUDGET if budget is None else budget
+        now = datetime.now(pytz.utc)
+        ranked = []
+        for link, record in self._by_link.items():
+            priority = self._priority(record, now)
+            if priority >= settings.RECRAWL_TARGET:
+                ranked.append((priority, link))
+        ranked.sort(reverse=True)
+        if budget:
+            ranked = ranked[:budget]
+        self._due = {link for _, link in ranked}
+        logger.info(
+            'Recrawl %s: %d of %d known products are due.',
+            self.site.value,
+            len(self._due),
+            len(self._by_link),
+        )
+
+    def due(self, link: str) -> bool:
+        """Нужно ли загружать страницу продукта в этом запуске.
+
+        Args:
+            link: Адрес страницы продукта.
+
+        Returns:
+            False, если можно взять прошлый документ без загрузки.
+        """
+        if self._due is None or link not in self._by_link:
+            return True
+        return link in self._due
+
+    def _priority(self, record: dict[str, Any], now: datetime) -> float:
+        """Приоритет загрузки продукта.
+
+        Args:
+            record: Запись хранилища.
+            now: Текущее время.
+
+        Returns:
+            Вероятность изменения, больше 1 для просроченных продуктов.
+        """
+        checked = self._checked(record)
+        if checked is None:
+            return math.inf
+        age = (now - checked).total_seconds()
+        if age >= settings.RECRAWL_MAX_AGE:
+            return 1 + age
+        return change_probability(record.get('stats', {}), checked, now)
+
+    def _checked(self, record: dict[str, Any]) -> Optional[datetime]:
+        """Время последней загрузки страницы продукта.
+
+        Args:
+            record: Запись хранилища.
+
+        Returns:
+            Время или None, если оно неизвестно.
+        """
+        checked = record.get('stats', {}).get('checked')
+        if checked is None:
+            return self.parsed(record['link'])
+        if checked.tzinfo is None:
+            return pytz.utc.localize(checked)
+        return checked
+
+    def fingerprint(self, link: str) -> Optional[str]:
+        """Отпечаток страницы с прошлого запуска.
+
+        Args:
+            link: Адрес страницы продукта.
+
+        Returns:
+            Отпечаток или None, если страница не встречалась.
+        """
+        record = self._by_link.get(link)
+        return None if record is None else record['fingerprint']
+
+    async def lookup(
+        self,
+        link: str,
+        fingerprint: str,
+    ) -> Optional[dict[str, Any]]:
+        """Возвращает прошлый документ, если страница не изменилась.
+
+        Args:
+            link: Адрес страницы продукта.
+            fingerprint: Отпечаток текущей версии страницы.
+
+        Returns:
+            Копия документа с новым идентификатором или None.
+        """
+        if fingerprint is None or self.fingerprint(link) != fingerprint:
+            return None
+        document = await self.reuse(link)
+        if document is not None:
+            self._pending.append(UpdateOne(
+                {'_id': self._by_link[link]['_id']},
+                self._observe(link, product_state(document)),
+            ))
+        return document
+
+    async def reuse(self, link: str) -> Optional[dict[str, Any]]:
+        """Возвращает прошлый документ без проверки страницы.
+
+        Args:
+            link: Адрес страницы продукта.
+
+        Returns:
+            Копия документа с новым идентификатором или None.
+        """
+        record = self._by_link.get(link)
+        if record is None:
+            return None
+        stored = await self.collection.find_one(
+            {'_id': record['_id']},
+            {'document': 1},
+        )
+        if stored is None:
+            return None
+        self.reused += 1
+        document = stored['document']
+        document['_id'] = str(uuid.uuid4())
+        document['parsed'] = jsonable_encoder(datetime.now(pytz.utc))
+        return document
+
+    def parsed(self, link: str) -> Optional[datetime]:
+        """Время, когда был собран прошлый документ страницы.
+
+        Args:
+            link: Адрес страницы продукта.
+
+        Returns:
+            Время разбора или None, если страница не встречалась.
+        """
+        record = self._by_link.get(link)
+        stored = {} if record is None else record.get('document', {})
+        if not stored.get('parsed'):
+            return None
+        parsed = datetime.fromisoformat(stored['parsed'])
+        if parsed.tzinfo is None:
+            return pytz.utc.localize(parsed)
+        return parsed
+
+    def update(self, fingerprint: str, document: dict[str, Any]) -> None:
+        """Запоминает отпечаток и документ для записи в базу.
+
+        Args:
+            fingerprint: Отпечаток страницы.
+            document: Собранный по странице документ.
+        """
+        if not self.enabled or document.get('article') is None:
+            return
+        update = self._observe(document['link'], product_state(document))
+        update['$set'].update({
+            'site': self.site.value,
+            'link': document['link'],
+            'fingerprint': fingerprint,
+            'document': dict(document),
+        })
+        self._pending.append(UpdateOne(
+            {'_id': '{0}:{1}'.format(self.site.value, document['article'])},
+            update,
+            upsert=True,
+        ))
+
+    def _observe(self, link: str, state: str) -> dict[str, Any]:
+        """Обновление статистики изменений после загрузки страницы.
+
+        Изменением считается смена цен или размеров по сравнению с
+        прошлой загрузкой.
+
+        Args:
+            link: Адрес страницы продукта.
+            state: Хеш цен и размеров загруженного документа.
+
+        Returns:
+            Обновление записи хранилища.
+        """
+        now = datetime.now(pytz.utc)
+        record = self._by_link.get(link)
+        previous = None
+        first_checked = now
+        if record is not None:
+            previous = record.get('stats', {}).get('state')
+            first_checked = self._checked(record) or now
+        changed = previous is not None and previous != state
+        update: dict[str, Any] = {
+            '$set': {'stats.checked': now, 'stats.state': state},
+            '$inc': {'stats.checks': 1, 'stats.changes': int(changed)},
+            '$min': {'stats.first_checked': first_checked},
+        }
+        if changed:
+            update['$set']['stats.changed'] = now
+        return update
+
+    async def flush(self) -> None:
+        """Записывает накопленные отпечатки в базу."""
+        logger.info(
+            'Fingerprints %s: %d reused, %d updated.',
+            self.site.value,
+            self.reused,
+            len(self._pending),
+        )
+        if self._pending:
+            await self.collection.bulk_write(self._pending, ordered=False)
+        self._pending = []
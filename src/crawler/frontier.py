@@ -0,0 +1,341 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Iterable, Optional
+
+from asgiref.sync import sync_to_async
+from redis import Redis, RedisError
+
+from src.enums import SiteEnum
+from src.models import Category
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# KEYS: urls, pending, categories, producers, done
+# ARGV: key, url, producer, deadline, ttl, categories...
+ADD_SCRIPT = """
+local new = 0
+if redis.call('SISMEMBER', KEYS[5], ARGV[1]) == 0 then
+    new = redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2])
+end
+if new == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+end
+local known = {}
+local current = redis.call('HGET', KEYS[3], ARGV[1])
+if current then
+    for _, category in ipairs(cjson.decode(current)) do
+        known[category] = true
+    end
+end
+local added = 0
+for i = 6, #ARGV do
+    if not known[ARGV[i]] then
+        known[ARGV[i]] = true
+        added = added + 1
+    end
+end
+if added > 0 then
+    local merged = {}
+    for category in pairs(known) do
+        table.insert(merged, category)
+    end
+    redis.call('HSET', KEYS[3], ARGV[1], cjson.encode(merged))
+end
+redis.call('ZADD', KEYS[4], ARGV[4], ARGV[3])
+for i = 1, #KEYS do
+    redis.call('EXPIRE', KEYS[i], ARGV[5])
+end
+return {new, added}
+"""
+
+# KEYS: pending, claimed, urls, categories
+# ARGV: now, deadline
+CLAIM_SCRIPT = """
+local key = redis.call(
+    'ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, 1
+)[1]
+if not key then
+    key = redis.call('LPOP', KEYS[1])
+end
+if not key then
+    return false
+end
+redis.call('ZADD', KEYS[2], ARGV[2], key)
+return {
+    key,
+    redis.call('HGET', KEYS[3], key),
+    redis.call('HGET', KEYS[4], key) or '[]',
+}
+"""
+
+# KEYS: pending, claimed, producers
+# ARGV: now
+IDLE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', ARGV[1])
+return redis.call('LLEN', KEYS[1])
+    + redis.call('ZCARD', KEYS[2])
+    + redis.call('ZCARD', KEYS[3])
+"""
+
+_redis: Optional[Redis] = None
+
+
+def get_redis() -> Redis:
+    """Подключается к redis для общей очереди продуктов.
+
+    Returns:
+        Клиент redis, один на процесс.
+    """
+    global _redis
+    if _redis is None:
+        _redis = Redis(
+            host=settings.REDIS_URL,
+            port=6379,
+            db=settings.FRONTIER_REDIS_DB,
+            socket_timeout=settings.REDIS_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_TIMEOUT,
+        )
+    return _redis
+
+
+def create_frontier(
+    version: int,
+    site: SiteEnum,
+) -> Optional['RedisFrontier']:
+    """Создаёт общую очередь продуктов, если она включена в настройках.
+
+    Args:
+        version: Версия запуска.
+        site: Сайт.
+
+    Returns:
+        Очередь в redis или None для очереди внутри процесса.
+    """
+    if settings.CRAWL_FRONTIER != 'redis':
+        return None
+    return RedisFrontier(get_redis(), version, site)
+
+
+def encode_category(category: Category) -> str:
+    """Категория в виде строки для множества в redis.
+
+    Args:
+        category: Категория.
+
+    Returns:
+        JSON категории с сортированными ключами.
+    """
+    return json.dumps(category.dict(), sort_keys=True, ensure_ascii=False)
+
+
+def decode_categories(encoded: Iterable[str]) -> set[Category]:
+    """Категории из строк redis.
+
+    Args:
+        encoded: JSON категорий.
+
+    Returns:
+        Категории.
+    """
+    return {Category(**json.loads(category)) for category in encoded}
+
+
+class RedisFrontier(object):
+    """Общая для процессов очередь продуктов запуска в redis.
+
+    Продукты дедуплицируются по ключу модели: первый процесс, нашедший
+    продукт, ставит его в очередь, остальные только дополняют категории.
+    Разобранные и уже записанные продукты в очередь больше не попадают.
+    Воркеры забирают продукты атомарно и получают аренду на время
+    разбора. Если процесс упал, по истечении аренды продукт заберёт другой
+    процесс. Аренда обхода каталога продлевается по таймеру, пока обход
+    идёт, даже если он долго не находит новых продуктов. Очередь пуста,
+    когда нет ни ожидающих, ни арендованных продуктов и ни один процесс
+    не обходит каталог.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        version: int,
+        site: SiteEnum,
+        lease: Optional[float] = None,
+    ):
+        """Конструктор очереди.
+
+        Args:
+            redis: Клиент redis.
+            version: Версия запуска.
+            site: Сайт.
+            lease: Время аренды продукта и обхода каталога в секундах,
+                по умолчанию из настроек.
+        """
+        prefix = 'byshoes:frontier:{0}:{1}'.format(version, site.value)
+        self.urls = '{0}:urls'.format(prefix)
+        self.pending = '{0}:pending'.format(prefix)
+        self.claimed = '{0}:claimed'.format(prefix)
+        self.categories = '{0}:categories'.format(prefix)
+        self.producers = '{0}:producers'.format(prefix)
+        self.done = '{0}:done'.format(prefix)
+        self.lease = lease or settings.FRONTIER_LEASE
+        self.producer = str(uuid.uuid4())
+        self._redis = redis
+        self._heartbeat: Optional[asyncio.Future] = None
+        self._add = redis.register_script(ADD_SCRIPT)
+        self._claim = redis.register_script(CLAIM_SCRIPT)
+        self._idle = redis.register_script(IDLE_SCRIPT)
+
+    async def add(
+        self,
+        key: str,
+        url: str,
+        categories: Iterable[Category],
+    ) -> bool:
+        """Ставит продукт в очередь или дополняет его категории.
+
+        Args:
+            key: Ключ модели.
+            url: Ссылка на страницу продукта.
+            categories: Категории, в которых найден продукт.
+
+        Returns:
+            True, если продукт или его категории новые для запуска.
+        """
+        new, added = await sync_to_async(self._add, thread_sensitive=False)(
+            keys=[
+                self.urls,
+                self.pending,
+                self.categories,
+                self.producers,
+                self.done,
+            ],
+            args=[
+                key,
+                url,
+                self.producer,
+                time.time() + self.lease,
+                int(settings.RUN_RESUME_MAX_AGE),
+                *(encode_category(category) for category in categories),
+            ],
+        )
+        return bool(new or added)
+
+    async def mark_done(self, key: str, url: str) -> None:
+        """Отмечает продукт, уже записанный в этом запуске.
+
+        Args:
+            key: Ключ модели.
+            url: Ссылка на страницу продукта.
+        """
+        def mark() -> None:
+            pipe = self._redis.pipeline()
+            pipe.hsetnx(self.urls, key, url)
+            pipe.sadd(self.done, key)
+            pipe.expire(self.done, int(settings.RUN_RESUME_MAX_AGE))
+            pipe.execute()
+
+        await sync_to_async(mark, thread_sensitive=False)()
+
+    async def claim(self) -> Optional[tuple[str, set[Category]]]:
+        """Забирает продукт для разбора.
+
+        Returns:
+            Ссылка и категории продукта или None, если свободных
+            продуктов нет.
+        """
+        now = time.time()
+        claimed = await sync_to_async(self._claim, thread_sensitive=False)(
+            keys=[self.pending, self.claimed, self.urls, self.categories],
+            args=[now, now + self.lease],
+        )
+        if not claimed:
+            return None
+        _, url, categories = claimed
+        return url.decode(), decode_categories(json.loads(categories))
+
+    async def complete(self, key: str) -> None:
+        """Отмечает продукт разобранным.
+
+        Args:
+            key: Ключ модели.
+        """
+        def complete() -> None:
+            pipe = self._redis.pipeline()
+            pipe.zrem(self.claimed, key)
+            pipe.sadd(self.done, key)
+            pipe.expire(self.done, int(settings.RUN_RESUME_MAX_AGE))
+            pipe.execute()
+
+        await sync_to_async(complete, thread_sensitive=False)()
+
+    async def get_categories(self, keys: list[str]) -> list[set[Category]]:
+        """Текущие категории продуктов.
+
+        Args:
+            keys: Ключи моделей.
+
+        Returns:
+            Категории в порядке ключей.
+        """
+        if not keys:
+            return []
+        encoded = await sync_to_async(
+            self._redis.hmget,
+            thread_sensitive=False,
+        )(self.categories, keys)
+        return [
+            decode_categories(json.loads(value)) if value else set()
+            for value in encoded
+        ]
+
+    async def is_idle(self) -> bool:
+        """Проверяет, что в запуске не осталось работы.
+
+        Returns:
+            True, если нет ожидающих и арендованных продуктов и никто не
+            обходит каталог.
+        """
+        left = await sync_to_async(self._idle, thread_sensitive=False)(
+            keys=[self.pending, self.claimed, self.producers],
+            args=[time.time()],
+        )
+        return left == 0
+
+    async def start(self) -> None:
+        """Отмечает, что процесс начал обход каталога.
+
+        Аренда обхода продлевается в фоне до вызова stop.
+        """
+        await self._renew_lease()
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.ensure_future(self._keep_lease())
+
+    async def stop(self) -> None:
+        """Отмечает, что процесс закончил обход каталога."""
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        await sync_to_async(self._redis.zrem, thread_sensitive=False)(
+            self.producers,
+            self.producer,
+        )
+
+    async def _renew_lease(self) -> None:
+        """Продлевает аренду обхода каталога."""
+        await sync_to_async(self._redis.zadd, thread_sensitive=False)(
+            self.producers,
+            {self.producer: time.time() + self.lease},
+        )
+
+    async def _keep_lease(self) -> None:
+        """Продлевает аренду обхода каталога каждую треть её срока."""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self._renew_lease()
+            except RedisError as exc:
+                logger.warning('Producer lease is not renewed: %s', exc)
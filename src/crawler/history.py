@@ -0,0 +1,440 @@
+import logging
+from typing import Any, AsyncIterator, Optional
+
+from motor.motor_asyncio import (
+    AsyncIOMotorCollection,
+    AsyncIOMotorCursor,
+    AsyncIOMotorDatabase,
+)
+from pymongo import ASCENDING, DESCENDING, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from src.crawler.writer import DUPLICATE_KEY
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+NOT_CONTENT = frozenset(('_id', 'parsed', 'version'))
+CURRENT = 'byshoes-current'
+CURRENT_INDEXES = ('is_new', 'price', 'site', 'specification.size.values')
+
+
+def product_key(document: dict[str, Any]) -> str:
+    """Ключ продукта в истории: сайт и артикул.
+
+    Продукты без артикула различаются по ссылке.
+
+    Args:
+        document: Документ продукта.
+
+    Returns:
+        Ключ продукта.
+    """
+    return '{0}:{1}'.format(
+        document['site'],
+        document.get('article') or document['link'],
+    )
+
+
+def get_content(document: dict[str, Any]) -> dict[str, Any]:
+    """Поля документа, изменения которых попадают в историю.
+
+    Args:
+        document: Документ продукта.
+
+    Returns:
+        Поля без идентификатора, времени разбора и версии.
+    """
+    return {
+        key: value
+        for key, value in document.items()
+        if key not in NOT_CONTENT
+    }
+
+
+def diff_content(
+    previous: dict[str, Any],
+    content: dict[str, Any],
+) -> dict[str, Any]:
+    """Поля, изменившиеся с прошлой версии продукта.
+
+    Args:
+        previous: Прошлый документ продукта.
+        content: Поля нового документа.
+
+    Returns:
+        Новые значения изменившихся полей.
+    """
+    return {
+        key: value
+        for key, value in content.items()
+        if previous.get(key) != value
+    }
+
+
+def version_pipeline(version: int) -> list[dict[str, Any]]:
+    """Агрегация каталога на момент версии по журналу изменений.
+
+    Изменения продукта до версии включительно накладываются по порядку,
+    в каталог попадают продукты, доступные в этой версии.
+
+    Args:
+        version: Версия запуска.
+
+    Returns:
+        Стадии агрегации для коллекции изменений.
+    """
+    return [
+        {'$match': {'version': {'$lte': version}}},
+        {'$sort': {'product': ASCENDING, 'version': ASCENDING}},
+        {'$group': {
+            '_id': '$product',
+            'fields': {'$mergeObjects': '$fields'},
+            'available': {'$last': '$available'},
+            'parsed': {'$last': '$parsed'},
+        }},
+        {'$match': {'available': True}},
+        {'$replaceRoot': {'newRoot': {'$mergeObjects': [
+            '$fields',
+            {'_id': '$_id', 'parsed': '$parsed', 'version': version},
+        ]}}},
+    ]
+
+
+async def version_source(
+    db: AsyncIOMotorDatabase,
+    version: int,
+) -> tuple[AsyncIOMotorCollection, list[dict[str, Any]]]:
+    """Откуда читать документы версии.
+
+    Документы последней опубликованной и текущей версии ещё лежат в
+    byshoes-collection, более старые собираются по журналу изменений.
+
+    Args:
+        db: База данных.
+        version: Версия запуска.
+
+    Returns:
+        Коллекция и стадии агрегации, отдающие документы версии.
+    """
+    staged = db['byshoes-collection']
+    if await staged.find_one({'version': version}, {'_id': 1}) is not None:
+        return staged, [{'$match': {'version': version}}]
+    return db['byshoes-changes'], version_pipeline(version)
+
+
+class ProductHistory(object):
+    """Каталог продуктов с историей изменений.
+
+    Запуск парсинга записывает документы версии в byshoes-collection, при
+    публикации они сворачиваются в один документ на продукт в
+    byshoes-products и журнал изменений byshoes-changes. В журнал попадают
+    только изменившиеся поля, появление и исчезновение продукта из
+    каталога. Документы прошлых версий в byshoes-collection после этого
+    удаляются, ещё не свёрнутые прошлые версии перед этим сворачиваются.
+
+    Свёртка повторяема: записи журнала имеют постоянный идентификатор и
+    пишутся раньше продуктов, поэтому прерванную свёртку можно повторить.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        """Конструктор истории.
+
+        Args:
+            db: База данных.
+        """
+        self.db = db
+        self.staged = db['byshoes-collection']
+        self.products = db['byshoes-products']
+        self.changes = db['byshoes-changes']
+        self.runs = db['byshoes-runs']
+
+    async def ensure_indexes(self) -> None:
+        """Создаёт индексы коллекций истории."""
+        await self.products.create_index('key', unique=True)
+        await self.products.create_index([
+            ('available', ASCENDING),
+            ('available_since', DESCENDING),
+        ])
+        await self.changes.create_index([
+            ('product', ASCENDING),
+            ('version', ASCENDING),
+        ])
+        await self.changes.create_index('version')
+
+    async def unfolded(self, before: Optional[int] = None) -> list[int]:
+        """Завершённые версии в byshoes-collection, ещё не свёрнутые.
+
+        Args:
+            before: Учитывать только версии меньше этой.
+
+        Returns:
+            Версии по возрастанию.
+        """
+        running = await self.runs.distinct('_id', {'status': 'running'})
+        folded = await self.runs.distinct('_id', {'history': True})
+        skipped = set(running).union(folded)
+        query = {} if before is None else {'version': {'$lt': before}}
+        return sorted(
+            version
+            for version in await self.staged.distinct('version', query)
+            if version not in skipped
+        )
+
+    async def commit(self, version: int) -> None:
+        """Сворачивает документы версии в каталог и журнал изменений.
+
+        Продукты сайтов, по которым в версии нет ни одного документа, не
+        считаются пропавшими: скорее всего, сайт не удалось разобрать. Из
+        документов с одним ключом в версии учитывается первый. Прошлые
+        версии, которые ещё не свёрнуты, например записанные полными
+        копиями до перехода на историю, сворачиваются первыми, чтобы их
+        документы не удалились без следа.
+
+        Args:
+            version: Версия запуска.
+        """
+        for earlier in await self.unfolded(version):
+            await self._commit(earlier)
+        await self._commit(version)
+
+    async def _commit(self, version: int) -> None:
+        """Сворачивает одну версию, если она ещё не свёрнута.
+
+        Args:
+            version: Версия запуска.
+        """
+        run = await self.runs.find_one({'_id': version}, {'history': 1})
+        if run is not None and run.get('history'):
+            return
+        await self.ensure_indexes()
+        sites: set[str] = set()
+        changed = 0
+        async for batch in _batches(self.staged.find({'version': version})):
+            sites.update(document['site'] for document in batch)
+            changed += await self._fold(version, batch)
+        removed = await self._remove_missing(version, sites)
+        await self.runs.update_one(
+            {'_id': version},
+            {
+                '$set': {'history': True},
+                '$setOnInsert': {'status': 'finished'},
+            },
+            upsert=True,
+        )
+        await self.staged.delete_many({'version': {'$lt': version}})
+        logger.info(
+            'Run %d: %d products changed, %d removed.',
+            version,
+            changed,
+            removed,
+            extra={'version': version},
+        )
+
+    async def materialize(self, version: int) -> None:
+        """Собирает текущий каталог и подменяет им byshoes-current.
+
+        Каталог собирается в отдельной коллекции версии вместе с
+        индексами и заменяет прошлый одним переименованием, поэтому
+        выдача видит либо старый каталог, либо новый целиком. Новинки
+        отмечаются полем is_new.
+
+        Args:
+            version: Версия запуска.
+        """
+        staging = '{0}-v{1}'.format(CURRENT, version)
+        latest = await self.products.find_one(
+            {'available': True},
+            {'available_since': 1},
+            sort=[('available_since', DESCENDING)],
+        )
+        newest = None if latest is None else latest['available_since']
+        await self.products.aggregate([
+            {'$match': {'available': True}},
+            {'$addFields': {
+                'is_new': {'$eq': ['$available_since', newest]},
+            }},
+            {'$project': {'key': 0, 'available': 0}},
+            {'$out': staging},
+        ], allowDiskUse=True).to_list(None)
+        for field in CURRENT_INDEXES:
+            await self.db[staging].create_index(field)
+        await self.db[staging].rename(CURRENT, dropTarget=True)
+        logger.info(
+            'Run %d: current catalog is published.',
+            version,
+            extra={'version': version},
+        )
+
+    async def _fold(self, version: int, batch: list[dict[str, Any]]) -> int:
+        """Сворачивает пачку документов версии.
+
+        Args:
+            version: Версия запуска.
+            batch: Документы версии.
+
+        Returns:
+            Количество новых и изменившихся продуктов.
+        """
+        known = {
+            product['key']: product
+            async for product in self.products.find(
+                {'key': {'$in': [product_key(doc) for doc in batch]}},
+            )
+        }
+        changes: list[InsertOne] = []
+        products: list[UpdateOne] = []
+        for document in batch:
+            key = product_key(document)
+            content = get_content(document)
+            previous = known.get(key)
+            if previous is not None and previous['version'] == version:
+                continue
+            product = {**content, 'key': key, 'version': version}
+            product['parsed'] = document['parsed']
+            product['available'] = True
+            if previous is None:
+                previous = {'_id': document['_id'], 'available': False}
+            fields = diff_content(previous, content)
+            if fields or not previous['available']:
+                changes.append(InsertOne(self._change(
+                    version,
+                    previous['_id'],
+                    key,
+                    {'fields': fields, 'available': True},
+                    document['parsed'],
+                )))
+            if not previous['available']:
+                product['available_since'] = version
+            known[key] = {**previous, **product}
+            products.append(UpdateOne(
+                {'key': key},
+                {'$set': product, '$setOnInsert': {'_id': previous['_id']}},
+                upsert=True,
+            ))
+        await self._write(self.changes, changes)
+        await self._write(self.products, products)
+        return len(changes)
+
+    async def _remove_missing(self, version: int, sites: set[str]) -> int:
+        """Отмечает недоступными продукты, которых нет в версии.
+
+        Args:
+            version: Версия запуска.
+            sites: Сайты, разобранные в версии.
+
+        Returns:
+            Количество пропавших продуктов.
+        """
+        query = {
+            'available': True,
+            'site': {'$in': list(sites)},
+            'version': {'$lt': version},
+        }
+        missing = self.products.find(query, {'key': 1, 'parsed': 1})
+        removed = 0
+        async for batch in _batches(missing):
+            await self._write(self.changes, [
+                InsertOne(self._change(
+                    version,
+                    product['_id'],
+                    product['key'],
+                    {'fields': {}, 'available': False},
+                    product['parsed'],
+                ))
+                for product in batch
+            ])
+            removed += len(batch)
+        await self.products.update_many(query, {'$set': {'available': False}})
+        return removed
+
+    def _change(
+        self,
+        version: int,
+        product_id: str,
+        key: str,
+        change: dict[str, Any],
+        parsed: Any,
+    ) -> dict[str, Any]:
+        """Запись журнала изменений.
+
+        Args:
+            version: Версия запуска.
+            product_id: Идентификатор продукта.
+            key: Ключ продукта.
+            change: Изменившиеся поля и доступность.
+            parsed: Время разбора продукта.
+
+        Returns:
+            Запись журнала.
+        """
+        return {
+            '_id': '{0}:{1}'.format(version, key),
+            'product': product_id,
+            'version': version,
+            'parsed': parsed,
+            **change,
+        }
+
+    async def _write(self, collection: Any, operations: list) -> None:
+        """Записывает операции, повторно записанное не считается ошибкой.
+
+        Args:
+            collection: Коллекция.
+            operations: Операции записи.
+        """
+        if not operations:
+            return
+        try:
+            await collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as exc:
+            for error in exc.details.get('writeErrors', []):
+                if error['code'] != DUPLICATE_KEY:
+                    logger.error(
+                        'Failed to write history: %s',
+                        error['errmsg'],
+                    )
+
+
+async def migrate(db: AsyncIOMotorDatabase) -> list[int]:
+    """Переносит записанные полными копиями версии в историю.
+
+    Версии сворачиваются по возрастанию, уже перенесённые и
+    незавершённые пропускаются.
+
+    Args:
+        db: База данных.
+
+    Returns:
+        Перенесённые версии.
+    """
+    history = ProductHistory(db)
+    versions = await history.unfolded()
+    for version in versions:
+        await history.commit(version)
+    if versions:
+        await history.materialize(versions[-1])
+    return versions
+
+
+async def _batches(
+    cursor: AsyncIOMotorCursor,
+    size: Optional[int] = None,
+) -> AsyncIterator[list[dict[str, Any]]]:
+    """Читает курсор пачками.
+
+    Args:
+        cursor: Курсор.
+        size: Размер пачки, по умолчанию из настроек.
+
+    Yields:
+        Пачки документов.
+    """
+    size = size or settings.WRITE_BATCH_SIZE
+    batch = []
+    async for document in cursor:
+        batch.append(document)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
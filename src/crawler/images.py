@@ -0,0 +1,373 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, AsyncIterator, Optional
+
+import pytz
+from asgiref.sync import sync_to_async
+from httpx import Response
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from PIL import Image, UnidentifiedImageError
+from pymongo import UpdateOne
+
+from src.crawler.client import SiteClient
+from src.crawler.history import version_source
+from src.crawler.registry import get_parser
+from src.crawler.retry import FetchError
+from src.enums import SiteEnum
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+MEDIA_TYPES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+WEBP_MAGIC = b'WEBP'
+THUMBNAIL_MEDIA_TYPE = 'image/jpeg'
+
+_store: Optional['ImageStore'] = None
+
+
+def get_store() -> 'ImageStore':
+    """Хранилище картинок из настроек.
+
+    Returns:
+        Хранилище, одно на процесс.
+    """
+    global _store
+    if _store is None:
+        _store = ImageStore(settings.IMAGES_PATH)
+    return _store
+
+
+def guess_media_type(head: bytes) -> Optional[str]:
+    """Определяет тип картинки по первым байтам.
+
+    Args:
+        head: Начало файла.
+
+    Returns:
+        MIME тип или None, если это не поддерживаемая картинка.
+    """
+    if head[:4] == b'RIFF' and head[8:12] == WEBP_MAGIC:
+        return 'image/webp'
+    for magic, media_type in MEDIA_TYPES:
+        if head.startswith(magic):
+            return media_type
+    return None
+
+
+class ImageStore(object):
+    """Картинки продуктов на локальном диске.
+
+    Файлы адресуются sha256 содержимого, поэтому одинаковые картинки с
+    разных страниц хранятся один раз, а файл по адресу никогда не
+    меняется. Рядом с оригиналом лежат уменьшенные копии в JPEG по
+    размерам из настроек.
+    """
+
+    def __init__(self, root: str):
+        """Конструктор хранилища.
+
+        Args:
+            root: Каталог для картинок.
+        """
+        self.root = root
+
+    def path(self, digest: str, size: Optional[int] = None) -> str:
+        """Путь к оригиналу или уменьшенной копии.
+
+        Args:
+            digest: sha256 оригинала.
+            size: Размер стороны уменьшенной копии, None - оригинал.
+
+        Returns:
+            Путь к файлу.
+        """
+        name = digest if size is None else '{0}.{1}.jpg'.format(digest, size)
+        return os.path.join(self.root, digest[:2], name)
+
+    def save(self, content: bytes) -> tuple[str, int, int]:
+        """Сохраняет картинку и её уменьшенные копии.
+
+        Уже сохранённая картинка не перезаписывается.
+
+        Args:
+            content: Содержимое картинки.
+
+        Returns:
+            sha256 картинки, её ширина и высота.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        with Image.open(io.BytesIO(content)) as image:
+            width, height = image.size
+            if not os.path.exists(self.path(digest)):
+                self._save_thumbnails(digest, image)
+                _write(self.path(digest), content)
+        return digest, width, height
+
+    def _save_thumbnails(self, digest: str, image: Image.Image) -> None:
+        """Сохраняет уменьшенные копии картинки.
+
+        Копии делаются от большей к меньшей, каждая из предыдущей.
+
+        Args:
+            digest: sha256 оригинала.
+            image: Картинка.
+        """
+        thumbnail = flatten(image)
+        for size in sorted(settings.IMAGES_THUMBNAIL_SIZES, reverse=True):
+            thumbnail.thumbnail((size, size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            thumbnail.save(
+                buffer,
+                'JPEG',
+                quality=settings.IMAGES_THUMBNAIL_QUALITY,
+                optimize=True,
+            )
+            _write(self.path(digest, size), buffer.getvalue())
+
+
+def flatten(image: Image.Image) -> Image.Image:
+    """Переводит картинку в RGB, прозрачный фон становится белым.
+
+    Args:
+        image: Картинка.
+
+    Returns:
+        Новая картинка в RGB.
+    """
+    if image.mode in {'RGBA', 'LA', 'P'} or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _write(path: str, content: bytes) -> None:
+    """Записывает файл атомарно через временный файл.
+
+    Args:
+        path: Путь к файлу.
+        content: Содержимое.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(content)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+async def prefetch(db: AsyncIOMotorDatabase, version: int) -> int:
+    """Загружает новые картинки продуктов версии.
+
+    Картинки, уже сохранённые раньше, пропускаются. Запросы идут через
+    клиенты сайтов, поэтому соблюдают их ограничения частоты.
+
+    Args:
+        db: База данных.
+        version: Версия запуска.
+
+    Returns:
+        Количество сохранённых картинок.
+    """
+    saved = 0
+    clients: dict[SiteEnum, SiteClient] = {}
+    semaphore = asyncio.Semaphore(settings.IMAGES_CONCURRENCY)
+    try:
+        async for batch in _missing_images(db, version):
+            fetched = await asyncio.gather(*(
+                _fetch(_get_client(clients, site), semaphore, url)
+                for url, site in batch
+            ))
+            operations = [
+                UpdateOne({'_id': image['_id']}, {'$set': image}, upsert=True)
+                for image in fetched
+                if image is not None
+            ]
+            if operations:
+                await db['byshoes-images'].bulk_write(
+                    operations,
+                    ordered=False,
+                )
+            saved += len(operations)
+    finally:
+        for client in clients.values():
+            await client.aclose()
+    logger.info('Run %d: %d images saved.', version, saved)
+    return saved
+
+
+async def _missing_images(
+    db: AsyncIOMotorDatabase,
+    version: int,
+) -> AsyncIterator[list[tuple[str, SiteEnum]]]:
+    """Картинки продуктов версии, которых ещё нет в хранилище.
+
+    Args:
+        db: База данных.
+        version: Версия запуска.
+
+    Yields:
+        Пачки из адреса картинки и сайта.
+    """
+    collection, pipeline = await version_source(db, version)
+    cursor = collection.aggregate(pipeline + [
+        {'$unwind': '$images'},
+        {'$group': {'_id': '$images', 'site': {'$first': '$site'}}},
+    ], allowDiskUse=True)
+    batch = []
+    async for image in cursor:
+        batch.append((image['_id'], SiteEnum(image['site'])))
+        if len(batch) >= settings.IMAGES_BATCH_SIZE:
+            yield await _filter_known(db, batch)
+            batch = []
+    if batch:
+        yield await _filter_known(db, batch)
+
+
+async def _filter_known(
+    db: AsyncIOMotorDatabase,
+    batch: list[tuple[str, SiteEnum]],
+) -> list[tuple[str, SiteEnum]]:
+    """Убирает из пачки уже сохранённые картинки.
+
+    Args:
+        db: База данных.
+        batch: Адреса картинок и сайты.
+
+    Returns:
+        Несохранённые картинки.
+    """
+    known = {
+        image['_id']
+        async for image in db['byshoes-images'].find(
+            {'_id': {'$in': [url for url, _ in batch]}},
+            {'_id': 1},
+        )
+    }
+    return [(url, site) for url, site in batch if url not in known]
+
+
+def _get_client(
+    clients: dict[SiteEnum, SiteClient],
+    site: SiteEnum,
+) -> SiteClient:
+    """Клиент сайта для загрузки картинок, создаётся при первом обращении.
+
+    Args:
+        clients: Созданные клиенты.
+        site: Сайт.
+
+    Returns:
+        Клиент сайта без кэша ответов.
+    """
+    if site not in clients:
+        clients[site] = SiteClient(
+            get_parser(site).get_base_url(),
+            max_in_flight=settings.IMAGES_CONCURRENCY,
+            cached=False,
+        )
+    return clients[site]
+
+
+async def _download(client: SiteClient, url: str) -> Optional[bytes]:
+    """Загружает картинку, не превышающую лимит размера.
+
+    Args:
+        client: Клиент сайта.
+        url: Адрес картинки.
+
+    Returns:
+        Содержимое картинки или None, если её не удалось загрузить или
+        она больше лимита.
+    """
+    try:
+        async with client.stream(url) as response:
+            content = await _read_limited(
+                response,
+                settings.IMAGES_MAX_BYTES,
+            )
+    except FetchError as exc:
+        logger.warning('Image %s not fetched: %s', url, exc)
+        return None
+    if content is None:
+        logger.warning('Image %s skipped: larger than the limit.', url)
+    return content
+
+
+async def _read_limited(response: Response, limit: int) -> Optional[bytes]:
+    """Читает тело ответа, пока оно не превышает лимит.
+
+    Размер проверяется по заголовку Content-Length до чтения тела и по
+    прочитанным байтам, чтение прерывается, как только лимит превышен.
+
+    Args:
+        response: Ответ с непрочитанным телом.
+        limit: Наибольший размер тела в байтах.
+
+    Returns:
+        Тело ответа или None, если оно больше лимита.
+    """
+    length = response.headers.get('Content-Length', '')
+    if length.isdigit() and int(length) > limit:
+        return None
+    content = bytearray()
+    async for chunk in response.aiter_bytes():
+        content.extend(chunk)
+        if len(content) > limit:
+            return None
+    return bytes(content)
+
+
+async def _fetch(
+    client: SiteClient,
+    semaphore: asyncio.Semaphore,
+    url: str,
+) -> Optional[dict[str, Any]]:
+    """Загружает и сохраняет одну картинку.
+
+    Args:
+        client: Клиент сайта.
+        semaphore: Ограничение одновременных загрузок.
+        url: Адрес картинки.
+
+    Returns:
+        Запись о картинке или None, если её не удалось сохранить.
+    """
+    async with semaphore:
+        content = await _download(client, url)
+    if content is None:
+        return None
+    media_type = guess_media_type(content[:16])
+    if media_type is None:
+        logger.warning('Image %s skipped: not a supported image.', url)
+        return None
+    try:
+        digest, width, height = await sync_to_async(
+            get_store().save,
+            thread_sensitive=False,
+        )(content)
+    except (UnidentifiedImageError, OSError) as exc:
+        logger.warning('Image %s not saved: %s', url, exc)
+        return None
+    return {
+        '_id': url,
+        'digest': digest,
+        'media_type': media_type,
+        'width': width,
+        'height': height,
+        'fetched': datetime.now(pytz.utc),
+    }
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class AdaptiveRateLimiter(object):
+    """Ограничитель частоты запросов к одному хосту.
+
+    Работает как token bucket, скорость пополнения которого регулируется
+    по AIMD: пока ответы быстрые и успешные скорость растёт на постоянную
+    величину, при 429/5xx или таймауте она уменьшается в разы.
+    """
+
+    def __init__(self, host: str):
+        """Конструктор ограничителя.
+
+        Args:
+            host: Хост, к которому относится ограничитель.
+        """
+        self.host = host
+        self.rate = settings.RATE_LIMIT_INITIAL
+        self.latency: Optional[float] = None
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._reported = self._updated
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Ожидает свободный токен на запрос."""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def feedback(self, status_code: Optional[int], latency: float) -> None:
+        """Подстраивает скорость по результату запроса.
+
+        Args:
+            status_code: Код ответа, None если запрос не удался.
+            latency: Время выполнения запроса в секундах.
+        """
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = 0.8 * self.latency + 0.2 * latency
+        if status_code is None or status_code in BACKOFF_STATUSES:
+            self.rate = max(
+                settings.RATE_LIMIT_MIN,
+                self.rate * settings.RATE_LIMIT_DECREASE,
+            )
+            self._tokens = min(self._tokens, 0)
+            logger.warning(
+                'Backing off %s: status %s, rate %.2f rps.',
+                self.host,
+                status_code,
+                self.rate,
+            )
+        elif self.latency <= settings.RATE_LIMIT_TARGET_LATENCY:
+            self.rate = min(
+                settings.RATE_LIMIT_MAX,
+                self.rate + settings.RATE_LIMIT_INCREASE,
+            )
+        self._report()
+
+    def _refill(self) -> None:
+        """Пополняет корзину токенов за прошедшее время."""
+        now = time.monotonic()
+        self._tokens = min(
+            settings.RATE_LIMIT_BURST,
+            self._tokens + (now - self._updated) * self.rate,
+        )
+        self._updated = now
+
+    def _report(self) -> None:
+        """Периодически пишет в лог текущую скорость и задержку."""
+        now = time.monotonic()
+        if now - self._reported < settings.RATE_LIMIT_LOG_INTERVAL:
+            return
+        self._reported = now
+        logger.info(
+            'Rate limit %s: %.2f rps, latency %.3fs.',
+            self.host,
+            self.rate,
+            self.latency,
+        )
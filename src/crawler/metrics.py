@@ -0,0 +1,162 @@
+import logging
+from collections import Counter as Summary
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+REQUESTS = Counter(
+    'byshoes_requests_total',
+    'Запросы к сайтам по коду ответа.',
+    ['site', 'status'],
+)
+REQUEST_SECONDS = Histogram(
+    'byshoes_request_seconds',
+    'Время запроса к сайту.',
+    ['site'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+RESPONSE_BYTES = Counter(
+    'byshoes_response_bytes_total',
+    'Загружено байт с сайта.',
+    ['site'],
+)
+RETRIES = Counter(
+    'byshoes_retries_total',
+    'Повторы запросов к сайту.',
+    ['site'],
+)
+IN_FLIGHT = Gauge(
+    'byshoes_requests_in_flight',
+    'Выполняющиеся запросы к сайту.',
+    ['site'],
+)
+PARSE_SECONDS = Histogram(
+    'byshoes_parse_seconds',
+    'Время разбора страницы продукта по стадиям.',
+    ['site', 'stage'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+PRODUCTS = Counter(
+    'byshoes_products_total',
+    'Разобранные продукты по результату.',
+    ['site', 'result'],
+)
+QUEUED = Gauge(
+    'byshoes_products_queued',
+    'Продукты в очереди на разбор.',
+    ['site'],
+)
+IN_PROGRESS = Gauge(
+    'byshoes_products_in_progress',
+    'Продукты, которые разбираются воркерами.',
+    ['site'],
+)
+
+
+def serve(port: Optional[int] = None) -> None:
+    """Отдаёт метрики процесса для Prometheus.
+
+    Args:
+        port: Порт, по умолчанию из настроек. 0 - метрики не отдаются.
+    """
+    port = settings.METRICS_PORT if port is None else port
+    if port:
+        start_http_server(port)
+        logger.info('Serving metrics on port %d.', port)
+
+
+class CrawlMetrics(object):
+    """Метрики парсинга сайта.
+
+    Значения уходят в метрики Prometheus процесса и одновременно
+    копятся в сводку, которая сохраняется в запуске парсинга. Сводки
+    процессов, разбиравших запуск, складываются.
+    """
+
+    def __init__(self, site: str):
+        """Конструктор метрик.
+
+        Args:
+            site: Сайт, метка метрик.
+        """
+        self.site = site
+        self.summary: Summary = Summary()
+        self.in_flight = IN_FLIGHT.labels(site)
+        self.queued = QUEUED.labels(site)
+        self.in_progress = IN_PROGRESS.labels(site)
+
+    def request(
+        self,
+        status_code: Optional[int],
+        seconds: float,
+        size: int = 0,
+    ) -> None:
+        """Учитывает запрос к сайту.
+
+        Args:
+            status_code: Код ответа, None если запрос не удался.
+            seconds: Время запроса.
+            size: Загружено байт.
+        """
+        status = 'error' if status_code is None else str(status_code)
+        REQUESTS.labels(self.site, status).inc()
+        REQUEST_SECONDS.labels(self.site).observe(seconds)
+        self.summary['requests.{0}'.format(status)] += 1
+        self.summary['request_seconds'] += seconds
+        self.add_bytes(size)
+
+    def add_bytes(self, size: int) -> None:
+        """Учитывает загруженные байты.
+
+        Args:
+            size: Загружено байт.
+        """
+        RESPONSE_BYTES.labels(self.site).inc(size)
+        self.summary['bytes'] += size
+
+    def retry(self) -> None:
+        """Учитывает повтор запроса."""
+        RETRIES.labels(self.site).inc()
+        self.summary['retries'] += 1
+
+    def parse(self, stage: str, seconds: float) -> None:
+        """Учитывает время стадии разбора.
+
+        Args:
+            stage: Стадия разбора.
+            seconds: Время стадии.
+        """
+        PARSE_SECONDS.labels(self.site, stage).observe(seconds)
+        self.summary['{0}_seconds'.format(stage)] += seconds
+
+    def product(self, result: str) -> None:
+        """Учитывает результат разбора продукта.
+
+        Args:
+            result: written, skipped, failed или error.
+        """
+        PRODUCTS.labels(self.site, result).inc()
+        self.summary['products.{0}'.format(result)] += 1
+
+    async def save(self, runs: AsyncIOMotorCollection, version: int) -> None:
+        """Добавляет сводку к запуску парсинга.
+
+        Args:
+            runs: Коллекция запусков.
+            version: Версия запуска.
+        """
+        if not self.summary:
+            return
+        await runs.update_one(
+            {'_id': version},
+            {'$inc': {
+                'stats.{0}.{1}'.format(self.site, key): value
+                for key, value in self.summary.items()
+            }},
+        )
+        self.summary.clear()
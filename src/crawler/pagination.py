@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, Iterable, Optional
+
+from httpx import Response
+
+from src.crawler.client import SiteClient
+from src.crawler.extract import PageContext
+from src.crawler.retry import FetchError
+
+logger = logging.getLogger(__name__)
+PAGE_NUMBER = re.compile(r'[?&](PAGEN_\d+)=(\d+)')
+
+
+def page_url(start_page: str, parameter: str, number: int) -> str:
+    """Адрес страницы каталога по номеру.
+
+    Args:
+        start_page: Адрес первой страницы каталога.
+        parameter: Имя параметра номера страницы.
+        number: Номер страницы.
+
+    Returns:
+        Адрес страницы.
+    """
+    if number == 1:
+        return start_page
+    separator = '&' if '?' in start_page else '?'
+    return '{0}{1}{2}={3}'.format(start_page, separator, parameter, number)
+
+
+def get_page_urls(start_page: str, links: Iterable[str]) -> set[str]:
+    """Выводит адреса страниц каталога из ссылок пагинации.
+
+    Берётся наибольший номер страницы среди ссылок, адреса строятся для
+    всех страниц до него, в том числе скрытых за многоточием.
+
+    Args:
+        start_page: Адрес первой страницы каталога.
+        links: Ссылки блока пагинации.
+
+    Returns:
+        Адреса страниц, пустое множество если номера найти не удалось.
+    """
+    parameter = None
+    last_page = 0
+    for link in links:
+        match = PAGE_NUMBER.search(link)
+        if match is None:
+            continue
+        parameter = match.group(1)
+        last_page = max(last_page, int(match.group(2)))
+    if parameter is None:
+        return set()
+    return {
+        page_url(start_page, parameter, number)
+        for number in range(1, last_page + 1)
+    }
+
+
+async def walk_listing(
+    client: SiteClient,
+    start_page: str,
+    handle: Callable[[PageContext], Awaitable[None]],
+    page_links: Callable[[PageContext], Iterable[str]],
+    next_page: Callable[[PageContext], Optional[str]],
+) -> int:
+    """Обходит все страницы каталога.
+
+    По пагинации первой страницы определяется количество страниц, и
+    остальные загружаются одновременно в пределах общего ограничения
+    клиента. Если пагинация показывает не все страницы, обход продолжается
+    от последней загруженной. Если номера страниц определить не удалось,
+    страницы обходятся последовательно по ссылке на следующую. Страницы,
+    которые не удалось загрузить, пропускаются.
+
+    Args:
+        client: Клиент сайта.
+        start_page: Адрес первой страницы каталога.
+        handle: Обработчик загруженной страницы.
+        page_links: Функция получения ссылок пагинации.
+        next_page: Функция получения ссылки на следующую страницу.
+
+    Returns:
+        Количество загруженных страниц.
+    """
+    seen = {start_page}
+    pending = [start_page]
+    while pending:
+        responses = await asyncio.gather(*(
+            _fetch(client, url) for url in pending
+        ))
+        pending = []
+        for response in responses:
+            if response is None:
+                continue
+            ctx = PageContext.from_response(response)
+            await handle(ctx)
+            urls = get_page_urls(start_page, page_links(ctx))
+            if not urls:
+                urls = {next_page(ctx)} - {None}
+            for url in sorted(urls - seen):
+                seen.add(url)
+                pending.append(url)
+    logger.info('Listing %s has %d pages.', start_page, len(seen))
+    return len(seen)
+
+
+async def _fetch(client: SiteClient, url: str) -> Optional[Response]:
+    """Загружает страницу каталога.
+
+    Args:
+        client: Клиент сайта.
+        url: Адрес страницы.
+
+    Returns:
+        Ответ сервера или None, если страницу не удалось загрузить.
+    """
+    try:
+        return await client.get(url)
+    except FetchError as exc:
+        logger.warning('%s', exc)
+        return None
@@ -0,0 +1,344 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+from src.crawler.checkpoint import CrawlCheckpoint
+from src.crawler.frontier import RedisFrontier
+from src.crawler.metrics import CrawlMetrics
+from src.crawler.retry import FetchError
+from src.crawler.writer import BatchWriter
+from src.models import Category
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+ProductParser = Callable[
+    [str, set[Category]],
+    Awaitable[Optional[dict[str, Any]]],
+]
+
+
+@dataclass
+class ProductTask(object):
+    """Продукт, найденный в каталоге."""
+
+    url: str
+    categories: set[Category] = field(default_factory=set)
+    parsed_categories: Optional[set[Category]] = None
+    document_id: Optional[str] = None
+
+
+class CrawlPipeline(object):
+    """Потоковый обход сайта.
+
+    Обход каталога отдаёт ссылки на продукты по мере нахождения, их
+    разбирает ограниченный набор воркеров, а готовые документы пачками
+    уходят в базу. Очередь между каталогом и воркерами ограничена, поэтому
+    память не растёт вместе с каталогом.
+
+    С общей очередью в redis продукты дедуплицируются и раздаются
+    воркерам всех процессов, разбирающих запуск, а процесс завершается,
+    когда в запуске не осталось работы.
+    """
+
+    def __init__(
+        self,
+        parse_product: ProductParser,
+        writer: BatchWriter,
+        key: Callable[[str], str] = str,
+        checkpoint: Optional[CrawlCheckpoint] = None,
+        frontier: Optional[RedisFrontier] = None,
+        metrics: Optional[CrawlMetrics] = None,
+    ):
+        """Конструктор конвейера.
+
+        Args:
+            parse_product: Функция разбора страницы продукта.
+            writer: Запись документов в базу.
+            key: Функция получения ключа продукта для удаления дублей.
+            checkpoint: Сохраняемое состояние для продолжения запуска.
+            frontier: Общая для процессов очередь продуктов.
+            metrics: Метрики сайта.
+        """
+        self.parse_product = parse_product
+        self.writer = writer
+        self.key = key
+        self.checkpoint = checkpoint
+        self.frontier = frontier
+        self.metrics = metrics or CrawlMetrics('unknown')
+        self._producing = False
+        self._queue: asyncio.Queue = asyncio.Queue(
+            maxsize=settings.CRAWL_QUEUE_SIZE,
+        )
+        self._tasks: dict[str, ProductTask] = {}
+        self._fetching = True
+        self.failed: list[FetchError] = []
+
+    async def emit(
+        self,
+        url: str,
+        categories: Iterable[Category] = (),
+    ) -> None:
+        """Передаёт найденный в каталоге продукт на разбор.
+
+        Повторно найденный продукт не разбирается, но его категории
+        добавляются к уже известным.
+
+        Args:
+            url: Ссылка на страницу продукта.
+            categories: Категории, в которых найден продукт.
+        """
+        categories = set(categories)
+        if await self._add(url, categories) and self.checkpoint is not None:
+            await self.checkpoint.discover(url, categories)
+
+    async def _add(self, url: str, categories: set[Category]) -> bool:
+        """Ставит продукт в очередь или дополняет его категории.
+
+        Args:
+            url: Ссылка на страницу продукта.
+            categories: Категории, в которых найден продукт.
+
+        Returns:
+            True, если продукт или его категории новые.
+        """
+        key = self.key(url)
+        task = self._tasks.get(key)
+        if task is not None and categories <= task.categories:
+            return False
+        if task is None:
+            task = ProductTask(url=url)
+            self._tasks[key] = task
+            new = True
+        else:
+            new = False
+        task.categories.update(categories)
+        if self._fetching and self.frontier is not None:
+            return await self.frontier.add(key, url, categories)
+        if self._fetching and new:
+            await self._queue.put(task)
+            self.metrics.queued.inc()
+        return True
+
+    async def run(self, producers: Iterable[Awaitable[Any]]) -> None:
+        """Запускает обход каталога и разбор продуктов.
+
+        Args:
+            producers: Корутины обхода каталога, вызывающие emit.
+        """
+        if self.frontier is None:
+            await self._run_local(producers)
+        else:
+            await self._run_shared(producers)
+        await self.writer.flush()
+        await self._update_categories()
+        self._report_failed()
+
+    async def _run_local(self, producers: Iterable[Awaitable[Any]]) -> None:
+        """Разбирает продукты из очереди процесса.
+
+        Args:
+            producers: Корутины обхода каталога, вызывающие emit.
+        """
+        workers = [
+            asyncio.ensure_future(self._work())
+            for _ in range(settings.CRAWL_WORKERS)
+        ]
+        try:
+            await self._restore()
+            await asyncio.gather(*producers)
+            await self._queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def _run_shared(self, producers: Iterable[Awaitable[Any]]) -> None:
+        """Разбирает продукты из общей очереди вместе с другими процессами.
+
+        Args:
+            producers: Корутины обхода каталога, вызывающие emit.
+        """
+        self._producing = True
+        await self.frontier.start()
+        workers = [
+            asyncio.ensure_future(self._work_shared())
+            for _ in range(settings.CRAWL_WORKERS)
+        ]
+        try:
+            await self._restore()
+            await asyncio.gather(*producers)
+            await self._stop_producing()
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            if self._producing:
+                await self._stop_producing()
+        await self._refresh_categories()
+
+    async def _stop_producing(self) -> None:
+        """Отмечает, что процесс закончил обход каталога."""
+        self._producing = False
+        await self.frontier.stop()
+
+    async def discover(
+        self,
+        producers: Iterable[Awaitable[Any]],
+    ) -> list[ProductTask]:
+        """Только обходит каталог, продукты не разбираются.
+
+        Используется, когда продукты разбираются отдельными задачами.
+
+        Args:
+            producers: Корутины обхода каталога, вызывающие emit.
+
+        Returns:
+            Найденные продукты, ещё не записанные в этом запуске.
+        """
+        self._fetching = False
+        await self._restore()
+        await asyncio.gather(*producers)
+        if self.checkpoint is not None:
+            await self.checkpoint.flush()
+        return [
+            task for task in self._tasks.values() if task.document_id is None
+        ]
+
+    async def _restore(self) -> None:
+        """Восстанавливает состояние прерванного запуска."""
+        if self.checkpoint is None:
+            return
+        written = await self.checkpoint.load_written()
+        for url, document_id, categories in written:
+            self._tasks[self.key(url)] = ProductTask(
+                url=url,
+                categories=set(categories),
+                parsed_categories=categories,
+                document_id=document_id,
+            )
+            if self.frontier is not None:
+                await self.frontier.mark_done(self.key(url), url)
+        discovered = await self.checkpoint.load_discovered()
+        for url, categories in discovered:
+            await self._add(url, categories)
+        if written or discovered:
+            logger.info(
+                'Restored %d written and %d discovered products.',
+                len(written),
+                len(discovered),
+            )
+
+    async def _work(self) -> None:
+        """Воркер разбора страниц продуктов."""
+        while True:
+            task = await self._queue.get()
+            self.metrics.queued.dec()
+            try:
+                await self._handle(task)
+            finally:
+                self._queue.task_done()
+
+    async def _work_shared(self) -> None:
+        """Воркер разбора продуктов из общей очереди.
+
+        Завершается, когда процесс закончил обход каталога, а в общей
+        очереди не осталось работы.
+        """
+        while True:
+            claimed = await self.frontier.claim()
+            if claimed is None:
+                if not self._producing and await self.frontier.is_idle():
+                    return
+                await asyncio.sleep(settings.FRONTIER_POLL_INTERVAL)
+                continue
+            url, categories = claimed
+            key = self.key(url)
+            task = ProductTask(url=url, categories=categories)
+            self._tasks[key] = task
+            await self._handle(task)
+            await self.frontier.complete(key)
+
+    async def _handle(self, task: ProductTask) -> None:
+        """Разбирает продукт, ошибки разбора не прерывают воркер.
+
+        Args:
+            task: Продукт для разбора.
+        """
+        try:
+            with self.metrics.in_progress.track_inprogress():
+                await self._process(task)
+        except FetchError as exc:
+            logger.warning('%s', exc, extra={
+                'site': self.metrics.site,
+                'url': exc.url,
+                'status': exc.reason,
+            })
+            self.failed.append(exc)
+            self.metrics.product('failed')
+        except Exception:
+            logger.exception(
+                'Failed to parse %s.',
+                task.url,
+                extra={'site': self.metrics.site, 'url': task.url},
+            )
+            self.metrics.product('error')
+
+    async def _process(self, task: ProductTask) -> None:
+        """Разбирает продукт и отдаёт документ на запись.
+
+        Args:
+            task: Продукт для разбора.
+        """
+        task.parsed_categories = set(task.categories)
+        document = await self.parse_product(
+            task.url,
+            task.parsed_categories,
+        )
+        if document is None:
+            self.metrics.product('skipped')
+            return
+        task.document_id = document['_id']
+        await self.writer.add(document)
+        self.metrics.product('written')
+
+    async def _refresh_categories(self) -> None:
+        """Дополняет категории разобранных продуктов из общей очереди.
+
+        Категории могли найти другие процессы уже после разбора.
+        """
+        keys = [
+            key
+            for key, task in self._tasks.items()
+            if task.document_id is not None
+        ]
+        shared = await self.frontier.get_categories(keys)
+        for key, categories in zip(keys, shared):
+            self._tasks[key].categories.update(categories)
+
+    async def _update_categories(self) -> None:
+        """Дописывает категории, найденные после разбора продукта."""
+        for task in self._tasks.values():
+            if task.document_id is None:
+                continue
+            if task.categories == task.parsed_categories:
+                continue
+            await self.writer.update(
+                task.document_id,
+                {'category': jsonable_encoder(list(task.categories))},
+            )
+        await self.writer.flush()
+
+    def _report_failed(self) -> None:
+        """Сообщает о продуктах, которые не удалось загрузить."""
+        if not self.failed:
+            return
+        logger.warning(
+            '%d products were not fetched: %s',
+            len(self.failed),
+            ', '.join(
+                '{0} ({1})'.format(exc.url, exc.reason) for exc in self.failed
+            ),
+        )
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+from src.settings import settings
+from src.utils.logs import configure_logging
+
+logger = logging.getLogger(__name__)
+
+_workers: Optional[int] = None
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def configure(workers: Optional[int]) -> None:
+    """Задаёт количество процессов для разбора страниц.
+
+    Args:
+        workers: Количество процессов, 0 - разбирать в цикле событий,
+            None - взять из настроек.
+    """
+    global _workers
+    _workers = workers
+
+
+def get_executor() -> Optional[ProcessPoolExecutor]:
+    """Возвращает пул процессов, создавая его при первом обращении.
+
+    Returns:
+        Пул процессов или None, если разбор идёт в цикле событий.
+    """
+    global _executor
+    workers = settings.PARSE_WORKERS if _workers is None else _workers
+    if workers <= 0:
+        return None
+    if _executor is None:
+        if multiprocessing.current_process().daemon:
+            logger.warning(
+                'Daemonic process can not start parse workers, '
+                'parsing in the event loop.',
+            )
+            return None
+        _executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=configure_logging,
+        )
+    return _executor
+
+
+async def run_in_pool(func: Callable[..., Any], *args: Any) -> Any:
+    """Выполняет функцию разбора в пуле процессов.
+
+    Функция и аргументы должны сериализоваться pickle.
+
+    Args:
+        func: Функция уровня модуля.
+        args: Аргументы функции.
+
+    Returns:
+        Результат функции.
+    """
+    executor = get_executor()
+    if executor is None:
+        return func(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+
+def shutdown() -> None:
+    """Останавливает пул процессов."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+    _executor = None
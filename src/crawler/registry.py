@@ -0,0 +1,49 @@
+import importlib
+
+from src.crawler.site import SiteParser
+from src.enums import SiteEnum
+
+SITE_MODULES = {
+    SiteEnum.MULTISPORTS: 'src.multisports.parse',
+    SiteEnum.ALLSTARS: 'src.allstars.parse',
+}
+
+_parsers: dict[SiteEnum, SiteParser] = {}
+
+
+def register(parser: type[SiteParser]) -> type[SiteParser]:
+    """Регистрирует описание сайта, используется как декоратор класса.
+
+    Args:
+        parser: Класс описания сайта.
+
+    Returns:
+        Тот же класс.
+    """
+    _parsers[parser.site] = parser()
+    return parser
+
+
+def get_parser(site: SiteEnum) -> SiteParser:
+    """Описание сайта по его енуму.
+
+    Модуль сайта импортируется при первом обращении.
+
+    Args:
+        site: Сайт.
+
+    Returns:
+        Описание сайта.
+    """
+    if site not in _parsers:
+        importlib.import_module(SITE_MODULES[site])
+    return _parsers[site]
+
+
+def get_parsers() -> list[SiteParser]:
+    """Описания всех сайтов в порядке запуска.
+
+    Returns:
+        Описания сайтов.
+    """
+    return [get_parser(site) for site in SITE_MODULES]
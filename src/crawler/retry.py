@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Optional, Union
+
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+
+class FetchError(Exception):
+    """Страницу не удалось загрузить."""
+
+    def __init__(self, url: str, reason: Union[int, str]):
+        """Конструктор ошибки.
+
+        Args:
+            url: Адрес страницы.
+            reason: Код ответа или описание последней ошибки.
+        """
+        super().__init__(url, reason)
+        self.url = url
+        self.reason = reason
+
+    def __str__(self) -> str:
+        """Описание ошибки.
+
+        Returns:
+            Адрес и причина.
+        """
+        return 'Failed to fetch {0}: {1}'.format(self.url, self.reason)
+
+
+class RetryPolicy(object):
+    """Политика повторов запроса.
+
+    Повторяются сетевые ошибки и временные ответы сервера, задержка
+    растёт экспоненциально со случайным разбросом, чтобы повторы
+    параллельных запросов не приходили на сайт одновременно. Остальные
+    ошибочные ответы, например 404, не повторяются.
+    """
+
+    def __init__(
+        self,
+        attempts: Optional[int] = None,
+        base_delay: Optional[float] = None,
+        max_delay: Optional[float] = None,
+    ):
+        """Конструктор политики.
+
+        Args:
+            attempts: Максимум попыток, по умолчанию из настроек.
+            base_delay: Задержка перед первым повтором.
+            max_delay: Максимальная задержка.
+        """
+        self.attempts = attempts or settings.RETRY_ATTEMPTS
+        self.base_delay = base_delay or settings.RETRY_BASE_DELAY
+        self.max_delay = max_delay or settings.RETRY_MAX_DELAY
+
+    def is_retryable(self, status_code: int) -> bool:
+        """Проверяет, имеет ли смысл повторить запрос с таким ответом.
+
+        Args:
+            status_code: Код ответа.
+
+        Returns:
+            True для временных ошибок сервера.
+        """
+        return status_code in RETRY_STATUSES
+
+    def delay(self, attempt: int) -> float:
+        """Задержка перед повтором.
+
+        Args:
+            attempt: Номер неудавшейся попытки, начиная с 1.
+
+        Returns:
+            Задержка в секундах.
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(ceiling / 2, ceiling)
+
+
+class CircuitBreaker(object):
+    """Приостанавливает запросы к сайту при всплеске ошибок.
+
+    Считает долю ошибок среди последних запросов к сайту, и если она
+    превышает порог, все запросы к сайту ждут окончания паузы, вместо
+    того чтобы расходовать попытки повторов.
+    """
+
+    def __init__(self, host: str):
+        """Конструктор.
+
+        Args:
+            host: Хост сайта.
+        """
+        self.host = host
+        self._results: deque[bool] = deque(maxlen=settings.CIRCUIT_WINDOW)
+        self._opened_until = 0.0
+
+    async def wait(self) -> None:
+        """Ожидает окончания паузы, если она есть."""
+        delay = self._opened_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._opened_until - time.monotonic()
+
+    def record(self, success: bool) -> None:
+        """Учитывает результат запроса.
+
+        Args:
+            success: False для сетевых ошибок и временных ошибок сервера.
+        """
+        self._results.append(success)
+        if len(self._results) < settings.CIRCUIT_MIN_REQUESTS:
+            return
+        error_rate = self._results.count(False) / len(self._results)
+        if error_rate < settings.CIRCUIT_ERROR_RATE:
+            return
+        self._opened_until = time.monotonic() + settings.CIRCUIT_COOLDOWN
+        self._results.clear()
+        logger.warning(
+            'Too many errors from %s (%.0f%%), pausing for %.0fs.',
+            self.host,
+            error_rate * 100,
+            settings.CIRCUIT_COOLDOWN,
+        )
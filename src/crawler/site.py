@@ -0,0 +1,648 @@
+import asyncio
+import logging
+import re
+import time
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Iterable, Optional
+from urllib.parse import urlsplit
+
+from fastapi.encoders import jsonable_encoder
+from httpx import Response
+from lxml import etree
+from pydantic import HttpUrl, ValidationError
+
+from src.crawler.checkpoint import CrawlCheckpoint
+from src.crawler.client import SiteClient
+from src.crawler.documents import build_document
+from src.crawler.extract import PageContext
+from src.crawler.fingerprint import FingerprintStore, page_fingerprint
+from src.crawler.frontier import RedisFrontier, create_frontier
+from src.crawler.metrics import PARSE_SECONDS, CrawlMetrics
+from src.crawler.pagination import walk_listing
+from src.crawler.pipeline import CrawlPipeline
+from src.crawler.pool import run_in_pool
+from src.crawler.retry import FetchError
+from src.crawler.sitemap import read_sitemap
+from src.crawler.writer import BatchWriter
+from src.enums import SexEnum, SiteEnum
+from src.models import Category
+from src.settings import settings
+from src.utils.utils import get_mongodb
+
+logger = logging.getLogger(__name__)
+
+
+def encode_sex(sex: str, mapping: dict[str, SexEnum]) -> SexEnum:
+    """Переводит пол из того что записано на сайте, в енум.
+
+    Args:
+        sex: Пол с сайта.
+        mapping: Пол по енуму для записей сайта в нижнем регистре.
+
+    Returns:
+        Пол по енуму, для неизвестных записей унисекс.
+    """
+    return mapping.get(sex.strip().lower(), SexEnum.UNISEX)
+
+
+@dataclass
+class CrawlSession(object):
+    """Клиент, отпечатки и конвейер парсинга сайта в одном процессе."""
+
+    client: SiteClient
+    store: FingerprintStore
+    pipeline: CrawlPipeline
+    unchanged: set[str] = field(default_factory=set)
+
+
+class SiteParser(ABC):
+    """Описание сайта для общего движка парсинга.
+
+    Подкласс задаёт сайт, адреса каталога, выражения для пагинации и
+    картинок и функции извлечения ссылок и полей продукта. Обход каталога,
+    загрузка страниц с ограничением частоты и повторами, отпечатки
+    страниц, сохранение состояния и пакетная запись общие для всех
+    сайтов.
+
+    Если сайт объявляет карты сайта и включён в SITEMAP_SITES, продукты
+    ищутся по карте сайта, а страницы, не изменившиеся по lastmod с
+    прошлого разбора, не загружаются. Без карты сайта используется обход
+    каталога. Базовый адрес можно подменить через SITE_URLS, например на
+    локальный сервер для проверки.
+
+    Для распределённого запуска поиск продуктов и их разбор выполняются
+    отдельно: discover_products и fetch_products.
+
+    product_fields и get_product_links абстрактные, поэтому описание сайта
+    без них не создаётся уже при регистрации.
+    """
+
+    site: SiteEnum
+    base_url: str
+    start_pages: tuple[str, ...] = ()
+    pagination: etree.XPath
+    next_page: etree.XPath
+    page_links: etree.XPath
+    images: etree.XPath
+    fingerprint_xpaths: tuple[etree.XPath, ...] = ()
+    sitemaps: tuple[str, ...] = ()
+    sitemap_products: Optional[re.Pattern] = None
+
+    async def parse_site(self, writer: BatchWriter) -> None:
+        """Запускает парсинг сайта.
+
+        Args:
+            writer: Запись документов в базу.
+        """
+        fields = {'site': self.site.value, 'version': writer.version}
+        logger.info('Start parsing site.', extra=fields)
+        checkpoint = self.get_checkpoint(writer.version)
+        if await checkpoint.is_finished():
+            logger.info('Site is already parsed in this run.', extra=fields)
+            return
+        frontier = create_frontier(writer.version, self.site)
+        async with self.session(writer, checkpoint, frontier) as session:
+            await session.pipeline.run(self.discover(session))
+        await checkpoint.finish()
+        logger.info('Finish parsing site.', extra=fields)
+
+    async def discover_products(
+        self,
+        writer: BatchWriter,
+    ) -> list[dict[str, Any]]:
+        """Ищет продукты сайта без их разбора.
+
+        Используется при распределённом запуске, найденные продукты
+        разбираются пачками в fetch_products.
+
+        Args:
+            writer: Запись документов в базу.
+
+        Returns:
+            Ещё не записанные в этом запуске продукты в виде, пригодном для
+            передачи в задачу.
+        """
+        checkpoint = self.get_checkpoint(writer.version)
+        if await checkpoint.is_finished():
+            return []
+        async with self.session(writer, checkpoint) as session:
+            tasks = await session.pipeline.discover(self.discover(session))
+        return [
+            {
+                'url': task.url,
+                'categories': jsonable_encoder(list(task.categories)),
+                'unchanged': self.is_unchanged(
+                    session.store,
+                    session.unchanged,
+                    task.url,
+                ),
+            }
+            for task in tasks
+        ]
+
+    async def fetch_products(
+        self,
+        writer: BatchWriter,
+        products: list[dict[str, Any]],
+    ) -> None:
+        """Разбирает пачку продуктов, найденных discover_products.
+
+        Args:
+            writer: Запись документов в базу.
+            products: Продукты для разбора.
+        """
+        links = [self.get_base_url() + product['url'] for product in products]
+        async with self.session(writer, links=links) as session:
+            session.unchanged.update(
+                product['url'] for product in products if product['unchanged']
+            )
+            await session.pipeline.run(
+                [self._emit_products(session.pipeline, products)],
+            )
+
+    def get_base_url(self) -> str:
+        """Базовый адрес сайта с учётом подмены из настроек.
+
+        Returns:
+            Базовый адрес.
+        """
+        return settings.SITE_URLS.get(self.site, self.base_url)
+
+    def get_checkpoint(self, version: int) -> CrawlCheckpoint:
+        """Сохраняемое состояние парсинга сайта.
+
+        Args:
+            version: Версия запуска.
+
+        Returns:
+            Состояние парсинга.
+        """
+        return CrawlCheckpoint(
+            get_mongodb(),
+            version,
+            self.site,
+            self.get_base_url(),
+        )
+
+    @asynccontextmanager
+    async def session(
+        self,
+        writer: BatchWriter,
+        checkpoint: Optional[CrawlCheckpoint] = None,
+        frontier: Optional[RedisFrontier] = None,
+        links: Optional[list[str]] = None,
+    ) -> AsyncIterator[CrawlSession]:
+        """Открывает клиент, хранилище отпечатков и конвейер сайта.
+
+        Args:
+            writer: Запись документов в базу.
+            checkpoint: Сохраняемое состояние парсинга.
+            frontier: Общая для процессов очередь продуктов.
+            links: Загрузить отпечатки только этих страниц.
+
+        Yields:
+            Состояние парсинга сайта.
+        """
+        store = FingerprintStore(
+            get_mongodb()['byshoes-fingerprints'],
+            self.site,
+        )
+        await store.load(links)
+        if links is None:
+            store.plan()
+        unchanged: set[str] = set()
+        metrics = CrawlMetrics(self.site.value)
+        async with SiteClient(self.get_base_url(), metrics=metrics) as client:
+            pipeline = CrawlPipeline(
+                lambda url, categories: self.parse_product_page(
+                    client,
+                    store,
+                    url,
+                    categories,
+                    unchanged=self.is_unchanged(store, unchanged, url),
+                ),
+                writer,
+                key=self.product_key,
+                checkpoint=checkpoint,
+                frontier=frontier,
+                metrics=metrics,
+            )
+            try:
+                yield CrawlSession(client, store, pipeline, unchanged)
+            finally:
+                await metrics.save(
+                    get_mongodb()['byshoes-runs'],
+                    writer.version,
+                )
+        await store.flush()
+
+    def is_unchanged(
+        self,
+        store: FingerprintStore,
+        unchanged: set[str],
+        url: str,
+    ) -> bool:
+        """Можно ли взять прошлый документ продукта без загрузки.
+
+        Args:
+            store: Хранилище отпечатков страниц.
+            unchanged: Неизменные по карте сайта страницы.
+            url: Ссылка на страницу продукта.
+
+        Returns:
+            True, если страница не менялась по карте сайта или её
+            перепроверка не запланирована в этом запуске.
+        """
+        if url in unchanged:
+            return True
+        return not store.due(self.get_base_url() + url)
+
+    def discover(self, session: CrawlSession) -> list[Awaitable[None]]:
+        """Источники ссылок на продукты для конвейера.
+
+        Args:
+            session: Состояние парсинга сайта.
+
+        Returns:
+            Корутины обхода карты сайта или страниц каталога.
+        """
+        if self.sitemaps and self.site in settings.SITEMAP_SITES:
+            return [self.parse_sitemaps(session)]
+        return [
+            self.parse_main_page(session.client, session.pipeline, page)
+            for page in self.start_pages
+        ]
+
+    async def parse_sitemaps(self, session: CrawlSession) -> None:
+        """Ищет продукты по карте сайта.
+
+        Если карта недоступна или в ней нет продуктов, обходятся страницы
+        каталога.
+
+        Args:
+            session: Состояние парсинга сайта.
+        """
+        try:
+            found = await self._read_sitemaps(session)
+        except (FetchError, etree.XMLSyntaxError, zlib.error) as exc:
+            logger.warning('Sitemap is not available: %s.', exc)
+            found = 0
+        if found:
+            return
+        logger.warning(
+            'No products in sitemaps of %s, walking catalog pages.',
+            self.site.value,
+        )
+        await asyncio.gather(*(
+            self.parse_main_page(session.client, session.pipeline, page)
+            for page in self.start_pages
+        ))
+
+    async def _read_sitemaps(self, session: CrawlSession) -> int:
+        """Передаёт продукты из карт сайта в конвейер.
+
+        Продукт считается неизменным, если его lastmod не позже времени
+        разбора документа, сохранённого в хранилище отпечатков.
+
+        Args:
+            session: Состояние парсинга сайта.
+
+        Returns:
+            Количество найденных продуктов.
+        """
+        found = 0
+        base_url = str(session.client.base_url)
+        for sitemap in self.sitemaps:
+            logger.info(
+                'Start parsing sitemap.',
+                extra={'site': self.site.value, 'url': sitemap},
+            )
+            async for entry in read_sitemap(session.client, sitemap):
+                if not self.is_sitemap_product(entry.url):
+                    continue
+                found += 1
+                parsed = session.store.parsed(base_url + entry.url)
+                if entry.lastmod and parsed and entry.lastmod <= parsed:
+                    session.unchanged.add(entry.url)
+                await session.pipeline.emit(entry.url)
+        logger.info(
+            'Sitemaps of %s: %d products, %d not modified.',
+            self.site.value,
+            found,
+            len(session.unchanged),
+        )
+        return found
+
+    async def _emit_products(
+        self,
+        pipeline: CrawlPipeline,
+        products: list[dict[str, Any]],
+    ) -> None:
+        """Передаёт продукты из задачи в конвейер.
+
+        Args:
+            pipeline: Конвейер разбора продуктов.
+            products: Продукты для разбора.
+        """
+        for product in products:
+            await pipeline.emit(
+                product['url'],
+                (Category(**category) for category in product['categories']),
+            )
+
+    def is_sitemap_product(self, url: str) -> bool:
+        """Проверяет, ведёт ли адрес из карты сайта на продукт.
+
+        Args:
+            url: Адрес страницы относительно сайта.
+
+        Returns:
+            True для страниц продуктов.
+        """
+        if self.sitemap_products is None:
+            return True
+        return self.sitemap_products.match(url) is not None
+
+    async def parse_main_page(
+        self,
+        client: SiteClient,
+        pipeline: CrawlPipeline,
+        start_page: str,
+    ) -> None:
+        """Парсит страницы каталога с моделями.
+
+        Найденные ссылки на модели сразу передаются на разбор вместе с
+        категориями страницы каталога.
+
+        Args:
+            client: Клиент сайта.
+            pipeline: Конвейер разбора продуктов.
+            start_page: Адрес начальный страницы.
+
+        """
+        fields = {'site': self.site.value, 'url': start_page}
+        logger.info('Start parsing listing.', extra=fields)
+
+        async def handle(ctx: PageContext) -> None:
+            categories = self.listing_categories(ctx, start_page)
+            for link in self.get_product_links(ctx):
+                await pipeline.emit(link, categories)
+
+        await walk_listing(
+            client,
+            start_page,
+            handle,
+            self.get_page_links,
+            self.get_next_page,
+        )
+        logger.info('Finish parsing listing.', extra=fields)
+
+    async def parse_product_page(
+        self,
+        client: SiteClient,
+        store: FingerprintStore,
+        url: str,
+        categories: set[Category],
+        unchanged: bool = False,
+    ) -> Optional[dict[str, Any]]:
+        """Парсит страницу продукта.
+
+        Разбор выполняется в пуле процессов, если он включён. Если отпечаток
+        страницы совпал с прошлым запуском, возвращается сохранённый
+        документ без разбора страницы. Для неизменных по карте сайта
+        страниц и страниц, перепроверка которых не запланирована,
+        сохранённый документ возвращается без загрузки, но с категориями,
+        в которых продукт найден в этом запуске.
+
+        Args:
+            client: Клиент сайта.
+            store: Хранилище отпечатков страниц.
+            url: Ссылка на страницу продукта.
+            categories: Категории, в которых найден продукт.
+            unchanged: Страница не менялась с прошлого разбора.
+
+        Returns:
+            Документ продукта или None, если модель не валидна.
+        """
+        fields = {'site': self.site.value, 'url': url}
+        link = str(client.base_url) + url
+        document = await store.reuse(link) if unchanged else None
+        if document is not None:
+            if categories:
+                document['category'] = jsonable_encoder(list(categories))
+            logger.debug('Product is not modified.', extra=fields)
+            return document
+        response: Response = await client.get(url)
+        started = time.perf_counter()
+        fingerprint, document = await run_in_pool(
+            self.parse_product_content,
+            response.content,
+            response.encoding,
+            link,
+            categories,
+            store.fingerprint(link),
+        )
+        duration = time.perf_counter() - started
+        client.metrics.parse('parse', duration)
+        fields['duration'] = round(duration, 4)
+        reused = await store.lookup(link, fingerprint)
+        if reused is not None:
+            logger.debug('Product page is not changed.', extra=fields)
+            return reused
+        if document is None:
+            return None
+        store.update(fingerprint, document)
+        logger.debug('Product is parsed.', extra=fields)
+        return document
+
+    def parse_product_content(
+        self,
+        content: bytes,
+        encoding: str,
+        link: str,
+        categories: set[Category],
+        previous: Optional[str],
+    ) -> tuple[str, Optional[dict[str, Any]]]:
+        """Разбирает страницу продукта, может выполняться в пуле процессов.
+
+        Args:
+            content: Тело страницы.
+            encoding: Кодировка страницы.
+            link: Полный адрес страницы.
+            categories: Категории, в которых найден продукт.
+            previous: Отпечаток страницы с прошлого запуска.
+
+        Returns:
+            Отпечаток страницы и документ. Документ не собирается, если
+            отпечаток совпал с прошлым.
+        """
+        ctx = PageContext(content, encoding)
+        fingerprint = page_fingerprint(
+            ctx,
+            self.fingerprint_xpaths,
+            self.fingerprint_extra(ctx, categories),
+        )
+        if fingerprint == previous:
+            return fingerprint, None
+        return fingerprint, self.extract_product(ctx, link, categories)
+
+    def extract_product(
+        self,
+        page: PageContext,
+        link: str,
+        categories: set[Category],
+    ) -> Optional[dict[str, Any]]:
+        """Собирает документ продукта по разобранной странице.
+
+        Время извлечения полей и сборки документа попадает в метрики
+        процесса, в котором выполняется разбор, поэтому при разборе в пуле
+        процессов не отдаётся.
+
+        Args:
+            page: Страница продукта.
+            link: Полный адрес страницы.
+            categories: Категории, в которых найден продукт.
+
+        Returns:
+            Документ для записи в базу или None, если модель не валидна.
+        """
+        started = time.perf_counter()
+        try:
+            return build_document({
+                'link': link,
+                'site': self.site,
+                **self.product_fields(page, categories),
+            })
+        except ValidationError as exc:
+            logger.warning(
+                'Invalid product in %s.',
+                ', '.join(
+                    '.'.join(str(part) for part in error['loc'])
+                    for error in exc.errors()
+                ),
+                extra={'site': self.site.value, 'url': link},
+            )
+            return None
+        finally:
+            PARSE_SECONDS.labels(self.site.value, 'extract').observe(
+                time.perf_counter() - started,
+            )
+
+    @abstractmethod
+    def product_fields(
+        self,
+        page: PageContext,
+        categories: set[Category],
+    ) -> dict[str, Any]:
+        """Извлекает поля продукта со страницы.
+
+        Поля отдаются простыми значениями: характеристики и размеры
+        словарями, категории моделями Category. Такие поля документ
+        собирает без полной валидации модели.
+
+        Args:
+            page: Страница продукта.
+            categories: Категории, в которых найден продукт.
+
+        Returns:
+            Поля документа продукта.
+        """
+
+    @abstractmethod
+    def get_product_links(self, page: PageContext) -> list[str]:
+        """Находит ссылки на продукты на странице каталога.
+
+        Args:
+            page: Страница каталога.
+
+        Returns:
+            Ссылки на страницы продуктов.
+        """
+
+    def listing_categories(
+        self,
+        page: PageContext,
+        start_page: str,
+    ) -> set[Category]:
+        """Категории продуктов, найденных на странице каталога.
+
+        Args:
+            page: Страница каталога.
+            start_page: Адрес первой страницы каталога.
+
+        Returns:
+            Категории, по умолчанию без категорий.
+        """
+        return set()
+
+    def fingerprint_extra(
+        self,
+        page: PageContext,
+        categories: set[Category],
+    ) -> Iterable[str]:
+        """Значения для отпечатка страницы, которых нет в её фрагментах.
+
+        Args:
+            page: Страница продукта.
+            categories: Категории, в которых найден продукт.
+
+        Returns:
+            Идентификаторы категорий.
+        """
+        return sorted(category.id for category in categories)
+
+    def product_key(self, url: str) -> str:
+        """Ключ модели для удаления дубликатов.
+
+        Args:
+            url: Ссылка на страницу продукта.
+
+        Returns:
+            Ключ модели, по умолчанию путь ссылки без параметров запроса.
+        """
+        return urlsplit(url).path
+
+    def get_page_links(self, page: PageContext) -> list[str]:
+        """Находит ссылки блока пагинации.
+
+        Args:
+            page: Страница для парсинга.
+
+        Returns:
+            Ссылки на страницы каталога.
+        """
+        pagination = page.xpath(self.pagination)
+        if len(pagination) == 0:
+            return []
+        return self.page_links(pagination[0])
+
+    def get_next_page(self, page: PageContext) -> Optional[str]:
+        """Находит следующую страницу на главной.
+
+        Args:
+            page: Страница для парсинга.
+
+        Returns:
+            Ссылку на следующую страницу.
+        """
+        pagination = page.xpath(self.pagination)
+        if len(pagination) == 0:
+            return None
+        next_page_tag = self.next_page(pagination[0])
+        if not next_page_tag:
+            return None
+        return next_page_tag[0].get('href')
+
+    def get_images(self, page: PageContext) -> list[HttpUrl]:
+        """Парсит страницу для получения ссылок на картинки модели.
+
+        Args:
+            page: Страница для парсинга.
+
+        Returns:
+            Список ссылок на картинки.
+        """
+        return [self.get_base_url() + src for src in page.xpath(self.images)]
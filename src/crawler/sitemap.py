@@ -0,0 +1,194 @@
+import logging
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+from urllib.parse import urlsplit
+
+import pytz
+from lxml import etree
+
+from src.crawler.client import SiteClient
+
+logger = logging.getLogger(__name__)
+GZIP_MAGIC = b'\x1f\x8b'
+ENTRY_TAGS = frozenset(('url', 'sitemap'))
+
+
+@dataclass
+class SitemapEntry(object):
+    """Страница из карты сайта."""
+
+    url: str
+    lastmod: Optional[datetime] = None
+
+
+def parse_lastmod(lastmod: Optional[str]) -> Optional[datetime]:
+    """Разбирает дату изменения страницы в формате W3C.
+
+    Если указана только дата, берётся конец дня, чтобы страница,
+    изменённая в тот же день после разбора, не считалась неизменной.
+
+    Args:
+        lastmod: Значение lastmod.
+
+    Returns:
+        Время изменения в UTC или None, если значение не разобрать.
+    """
+    if not lastmod:
+        return None
+    lastmod = lastmod.strip()
+    try:
+        parsed = datetime.fromisoformat(lastmod.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if 'T' not in lastmod:
+        parsed += timedelta(days=1)
+    if parsed.tzinfo is None:
+        return pytz.utc.localize(parsed)
+    return parsed.astimezone(pytz.utc)
+
+
+async def read_sitemap(
+    client: SiteClient,
+    url: str,
+) -> AsyncIterator[SitemapEntry]:
+    """Читает карту сайта вместе с вложенными картами из индекса.
+
+    Адреса страниц отдаются относительно сайта, поэтому карту можно
+    читать с подменного сервера.
+
+    Args:
+        client: Клиент сайта.
+        url: Адрес карты сайта.
+
+    Yields:
+        Страницы из карты сайта.
+    """
+    pending = [url]
+    seen = set(pending)
+    while pending:
+        current = pending.pop()
+        async for tag, loc, lastmod in _read_entries(client, current):
+            address = relative_url(loc)
+            if tag == 'url':
+                yield SitemapEntry(address, parse_lastmod(lastmod))
+            elif address not in seen:
+                seen.add(address)
+                pending.append(address)
+
+
+def relative_url(loc: str) -> str:
+    """Адрес страницы относительно сайта.
+
+    Args:
+        loc: Полный адрес из карты сайта.
+
+    Returns:
+        Путь с параметрами запроса.
+    """
+    address = urlsplit(loc.strip())
+    if address.query:
+        return '{0}?{1}'.format(address.path, address.query)
+    return address.path
+
+
+async def _read_entries(
+    client: SiteClient,
+    url: str,
+) -> AsyncIterator[tuple[str, str, Optional[str]]]:
+    """Разбирает одну карту сайта по мере загрузки.
+
+    Сжатые gzip карты распаковываются на лету, разобранные записи
+    удаляются из дерева, поэтому память не растёт с размером карты.
+
+    Args:
+        client: Клиент сайта.
+        url: Адрес карты сайта.
+
+    Yields:
+        Тип записи, адрес и дата изменения.
+    """
+    parser = etree.XMLPullParser(
+        events=('end',),
+        resolve_entities=False,
+        no_network=True,
+    )
+    decompressor = None
+    async with client.stream(url) as response:
+        async for chunk in response.aiter_bytes():
+            if decompressor is None:
+                decompressor = _get_decompressor(chunk)
+            parser.feed(decompressor.decompress(chunk))
+            for entry in _pop_entries(parser):
+                yield entry
+    parser.feed(decompressor.flush() if decompressor else b'')
+    parser.close()
+    for entry in _pop_entries(parser):
+        yield entry
+
+
+def _get_decompressor(chunk: bytes):
+    """Выбирает распаковщик по первым байтам карты.
+
+    Args:
+        chunk: Первая часть тела ответа.
+
+    Returns:
+        Распаковщик gzip или объект, отдающий данные как есть.
+    """
+    if chunk.startswith(GZIP_MAGIC):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    return _Passthrough()
+
+
+def _pop_entries(
+    parser: etree.XMLPullParser,
+) -> list[tuple[str, str, Optional[str]]]:
+    """Забирает разобранные записи карты и освобождает их узлы.
+
+    Args:
+        parser: Потоковый разборщик карты.
+
+    Returns:
+        Тип записи, адрес и дата изменения.
+    """
+    entries = []
+    for _, element in parser.read_events():
+        tag = etree.QName(element).localname
+        if tag not in ENTRY_TAGS:
+            continue
+        fields = {
+            etree.QName(child).localname: child.text
+            for child in element
+            if isinstance(child.tag, str)
+        }
+        if fields.get('loc'):
+            entries.append((tag, fields['loc'], fields.get('lastmod')))
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    return entries
+
+
+class _Passthrough(object):
+    """Распаковщик для несжатых карт сайта."""
+
+    def decompress(self, chunk: bytes) -> bytes:
+        """Отдаёт данные как есть.
+
+        Args:
+            chunk: Часть тела ответа.
+
+        Returns:
+            Та же часть.
+        """
+        return chunk
+
+    def flush(self) -> bytes:
+        """Остаток данных.
+
+        Returns:
+            Пустые данные.
+        """
+        return b''
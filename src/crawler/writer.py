@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from typing import Any, Optional, Union
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+from pymongo.write_concern import WriteConcern
+
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+DUPLICATE_KEY = 11000
+
+
+class BatchWriter(object):
+    """Пакетная запись документов запуска парсинга в базу.
+
+    Документы помечаются версией запуска и записываются пачками по мере
+    поступления, не дожидаясь окончания парсинга. Пачки пишутся без
+    сохранения порядка, поэтому ошибочный документ не мешает записи
+    остальных. При сетевых ошибках пачка записывается повторно, уже
+    записанные документы при этом пропускаются по совпадению _id.
+    """
+
+    def __init__(
+        self,
+        collection: AsyncIOMotorCollection,
+        version: int,
+        batch_size: Optional[int] = None,
+    ):
+        """Конструктор записи.
+
+        Args:
+            collection: Коллекция продуктов.
+            version: Версия текущего запуска.
+            batch_size: Размер пачки, по умолчанию из настроек.
+        """
+        self.collection = collection.with_options(
+            write_concern=WriteConcern(
+                w=settings.WRITE_CONCERN_W,
+                j=settings.WRITE_CONCERN_JOURNAL,
+            ),
+        )
+        self.version = version
+        self.batch_size = batch_size or settings.WRITE_BATCH_SIZE
+        self.written = 0
+        self.failed = 0
+        self._buffer: list[Union[InsertOne, UpdateOne]] = []
+
+    async def add(self, document: dict[str, Any]) -> None:
+        """Добавляет документ в очередь на запись.
+
+        Args:
+            document: Документ продукта.
+        """
+        document['version'] = self.version
+        self._buffer.append(InsertOne(document))
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def update(self, document_id: str, fields: dict[str, Any]) -> None:
+        """Добавляет в очередь обновление уже записанного документа.
+
+        Args:
+            document_id: Идентификатор документа.
+            fields: Новые значения полей.
+        """
+        self._buffer.append(UpdateOne({'_id': document_id}, {'$set': fields}))
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Записывает накопленную пачку."""
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        started = time.monotonic()
+        written = len(batch) - await self._write(batch)
+        self.written += written
+        logger.info(
+            'Written %d operations in %.2fs, %d total.',
+            written,
+            time.monotonic() - started,
+            self.written,
+        )
+
+    async def _write(self, batch: list[Union[InsertOne, UpdateOne]]) -> int:
+        """Записывает пачку с повторами при сетевых ошибках.
+
+        Args:
+            batch: Операции пачки.
+
+        Returns:
+            Количество операций, которые не удалось записать.
+
+        Raises:
+            ConnectionFailure: Если пачку не удалось записать после всех
+                повторов.
+        """
+        attempt = 1
+        while True:
+            try:
+                await self.collection.bulk_write(batch, ordered=False)
+            except BulkWriteError as exc:
+                return self._report(exc.details)
+            except ConnectionFailure as exc:
+                if attempt >= settings.WRITE_RETRIES:
+                    raise
+                delay = settings.WRITE_RETRY_DELAY * 2 ** (attempt - 1)
+                logger.warning(
+                    'Batch write failed (%s), retry %d in %.1fs.',
+                    exc,
+                    attempt,
+                    delay,
+                )
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            return 0
+
+    def _report(self, details: dict[str, Any]) -> int:
+        """Сообщает об операциях пачки, которые не удалось записать.
+
+        Совпадение _id означает, что документ уже записан предыдущей
+        попыткой, и ошибкой не считается.
+
+        Args:
+            details: Описание ошибок пачки.
+
+        Returns:
+            Количество операций, которые не удалось записать.
+        """
+        failed = 0
+        for error in details.get('writeErrors', []):
+            if error['code'] == DUPLICATE_KEY:
+                continue
+            failed += 1
+            logger.error(
+                'Failed to write operation %d: %s',
+                error['index'],
+                error['errmsg'],
+            )
+        for error in details.get('writeConcernErrors', []):
+            logger.error('Write concern error: %s', error['errmsg'])
+        self.failed += failed
+        return failed
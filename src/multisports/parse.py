@@ -1,15 +1,17 @@
-import asyncio
 import logging
-from typing import Any, Optional, Set, Tuple, Union
-
-import httpx
-from bs4 import BeautifulSoup, Tag
-from fastapi.encoders import jsonable_encoder
-from httpx import Response
-from pydantic import HttpUrl, ValidationError
-
-from src.enums import SexEnum
-from src.models import Category, ProductModelParse, Size, Specification
+from typing import Any, Optional
+
+from src.crawler.extract import (
+    PageContext,
+    compile_xpath,
+    find_next,
+    has_class,
+    text,
+)
+from src.crawler.registry import register
+from src.crawler.site import SiteParser, encode_sex
+from src.enums import SexEnum, SiteEnum
+from src.models import Category
 
 spec_mapper = {
     'пол': 'sex',
@@ -17,137 +19,56 @@ spec_mapper = {
     'артикул': 'article',
 }
 logger = logging.getLogger(__name__)
-
-
-async def parse_site():
-    """Функция запускает парсинг сайта.
-
-    Returns:
-        Список спаршенных сущностей.
-    """
-    print('Start parsing multisports.')
-    parse_addreses = [
-        '/catalog/muzhchiny/obuv/',
-        '/catalog/zhenshchiny/obuv/',
-        '/catalog/muzhchiny/obuv/botinki/',
-        '/catalog/muzhchiny/obuv/slantsy_i_sandalii/',
-        '/catalog/muzhchiny/obuv/futbolnye_butsy/',
-        '/catalog/muzhchiny/obuv/krossovki/',
-        '/catalog/zhenshchiny/obuv/kedy/',
-        '/catalog/zhenshchiny/obuv/krossovki_vysokie/',
-        '/catalog/zhenshchiny/obuv/sapogi_i_botinki/',
-        '/catalog/zhenshchiny/obuv/slantsy-i-sandalii/',
-    ]
-    tasks = [parse_main_page(page) for page in parse_addreses]
-    main_page_set = set()
-    results = await asyncio.gather(*tasks)
-    for result in results:
-        main_page_set = main_page_set | result
-    unic = remove_duplicates(main_page_set)
-    tasks = []
-    for page in unic:
-        task = asyncio.ensure_future(
-            parse_product_page(
-                page['url'],
-                page['categories'],
-            ),
-        )
-        await asyncio.sleep(1)
-        tasks.append(task)
-    print('Finish parsing multisports.')
-    return await asyncio.gather(*tasks)
-
-
-async def parse_main_page(start_page: str) -> set:
-    """Функция парсит постранично страницу с моделями.
+BASE_URL = 'https://multisports.by'
+SEX_MAPPING = {
+    'мужчины': SexEnum.MALE,
+    'мальчики': SexEnum.MALE,
+    'женщины': SexEnum.FEMALE,
+    'девочки': SexEnum.FEMALE,
+}
+CATEGORY_LINKS = compile_xpath('//a[@href=$href]')
+CARDS = compile_xpath('//div[{0}]'.format(has_class('wrap-product-card')))
+CARD_LINK = find_next('a', has_class('product-name'))
+CARD_INFO = compile_xpath('//div[{0}]'.format(has_class('wrap-card-info')))
+SIZES = compile_xpath('//ul[{0}]'.format(has_class('list-sizes')))
+PRICE_LIST = compile_xpath('//div[{0}]'.format(has_class('price-list')))
+CURRENT_PRICE = compile_xpath('.//span[{0}]'.format(has_class('cur-price')))
+OLD_PRICE = compile_xpath('.//span[{0}]'.format(has_class('old-price')))
+TITLE = compile_xpath(
+    '//div[{0}]'.format(has_class('wrap-product-card-name')),
+)
+PAGINATION = compile_xpath('//div[{0}]'.format(has_class('pagination')))
+NEXT_PAGE = find_next('a', "@title='Следующая страница'")
+PAGE_LINKS = compile_xpath('.//a/@href')
+SPANS = compile_xpath('.//span')
+ITEMS = compile_xpath('.//li')
+IMAGES = compile_xpath(
+    '(//div[{0}])[last()]//img/@src'.format(has_class('main-image')),
+)
+FINGERPRINT_XPATHS = (
+    compile_xpath('(//div[{0}])[last()]'.format(has_class('wrap-card-info'))),
+    compile_xpath('(//ul[{0}])[last()]'.format(has_class('list-sizes'))),
+    compile_xpath('(//div[{0}])[last()]'.format(has_class('price-list'))),
+    compile_xpath('(//div[{0}])[last()]'.format(
+        has_class('wrap-product-card-name'),
+    )),
+    compile_xpath('(//div[{0}])[last()]'.format(has_class('main-image'))),
+)
+
+
+def get_product_links(page: PageContext) -> list[str]:
+    """Находит ссылки на продукты на странице каталога.
 
     Args:
-        start_page: Адрес начальный страницы.
+        page: Страница для парсинга.
 
     Returns:
-        Список ссылок на отдельные модели для дальнейшего парсинга.
-
+        Ссылки на страницы продуктов.
     """
-    print(f'Start parsing {start_page}.')
-    next_page = start_page
-    uniq_pages = set()
-    async with httpx.AsyncClient(base_url='https://multisports.by') as client:
-        while next_page:
-            try:
-                response = await client.get(next_page)
-            except httpx.ReadTimeout:
-                response = await client.get(next_page)
-            soup = BeautifulSoup(response.text, 'lxml')
-            next_page = get_next_page(soup)
-            category = Category(
-                id=start_page.split('/')[-2],
-                name=soup.findAll(
-                    'a',
-                    {'href': start_page},
-                )[-1].text.strip(),
-            )
-            cards: list[BeautifulSoup] = soup.findAll(
-                'div',
-                {'class': 'wrap-product-card'},
-            )
-            for item in cards:
-                uniq_pages.add(
-                    (
-                        item.findNext(
-                            'a',
-                            {'class': 'product-name'},
-                        ).attrs.get('href'),
-                        category,
-                    ),
-                )
-    print(f'Finish parsing {start_page}.')
-    return uniq_pages
-
-
-async def parse_product_page(
-    url: str,
-    categories: set[Category],
-) -> dict[str, Any]:
-    """Парсит страницу продкута и записывает в базу информацию.
+    return [CARD_LINK(item)[0].get('href') for item in page.xpath(CARDS)]
 
-    Args:
-        url: Ссылка на страницу продукта.
-        categories: Список категорий.
 
-    Returns:
-        Спаршенная сущность.
-    """
-    print(f'Start parsing {url}.')
-    async with httpx.AsyncClient(base_url='https://multisports.by') as client:
-        response: Response = await client.get(url)
-        while response.status_code != 200:
-            print(f'Responce is not correct: {response}.')
-            await asyncio.sleep(3)
-            response = await client.get(url)
-        soup = BeautifulSoup(response.text, 'lxml')
-        card_info = get_card_info(soup)
-        card_info['size'] = get_sizes(soup)
-        try:
-            pm = ProductModelParse(
-                title=get_title(soup),
-                images=get_images(soup, str(client.base_url)),
-                link=str(client.base_url) + url,
-                price=get_price(soup),
-                discounted_price=get_discounted_price(soup),
-                category=categories,
-                site='multisports',
-                article=card_info['article'],
-                specification=Specification.parse_obj(card_info),
-            )
-        except ValidationError as exc:
-            print(exc.json())
-            print('error on' + str(client.base_url) + url)
-            return
-        print(f'Finish parsing {url}.')
-        return jsonable_encoder(pm, by_alias=True)
-
-
-def get_card_info(page: BeautifulSoup) -> dict[str, Any]:
+def get_card_info(page: PageContext) -> dict[str, Any]:
     """Парсинг карточки с информацией о продукте.
 
     Args:
@@ -156,65 +77,47 @@ def get_card_info(page: BeautifulSoup) -> dict[str, Any]:
     Returns:
         Информация о продукте.
     """
-    card_info: Tag = page.findAll('div', {'class': 'wrap-card-info'}).pop()
     out = {}
-    for span in card_info.findAll('span'):
-        row = span.text.lower().split(':')
+    for span in SPANS(page.last(CARD_INFO)):
+        row = text(span).lower().split(':')
         if row[0] not in spec_mapper.keys():
             continue
         key = spec_mapper[row[0]]
         if key == 'sex':
-            row[1] = encode_sex(row[1])
+            row[1] = encode_sex(row[1], SEX_MAPPING)
         if key == 'color':
             row[1] = [row[1]]
         out[key] = row[1]
     return out
 
 
-def encode_sex(sex: str) -> str:
-    """Переводит пол из того что записано на сайте, в енум.
-
-    Args:
-        sex: Пол с сайта.
-
-    Returns:
-        Пол по енуму.
-    """
-    sex = sex.strip()
-    if sex == 'мужчины' or sex == 'мальчики':
-        return SexEnum.MALE.value
-    if sex == 'женщины' or sex == 'девочки':
-        return SexEnum.FEMALE.value
-    return SexEnum.UNISEX.value
-
-
-def get_sizes(page: BeautifulSoup) -> list[Size]:
+def get_sizes(page: PageContext) -> list[dict[str, Any]]:
     """Парсит карточку размеров продкута.
 
     Args:
         page: Страница для парсинга.
 
     Returns:
-        Список размеров.
+        Список размеров в виде полей Size.
     """
-    sizes_block: Tag = page.findAll('ul', {'class': 'list-sizes'}).pop()
+    sizes_block = page.last(SIZES)
     sizes = []
     if sizes_block is None:
         return []
-    for li in sizes_block.findAll('li'):
-        if not li.text.strip():
+    for li in ITEMS(sizes_block):
+        if not text(li).strip():
             continue
-        sizes.append(float(li.text.strip().replace(',', '.')))
+        sizes.append(float(text(li).strip().replace(',', '.')))
     sizes.sort()
     if len(sizes) == 0:
         return []
-    return [Size(
-        size_type='ru' if sizes[-1] > 20 else 'us',
-        values=sizes,
-    )]
+    return [{
+        'size_type': 'ru' if sizes[-1] > 20 else 'us',
+        'values': sizes,
+    }]
 
 
-def get_price(page: BeautifulSoup) -> Optional[float]:
+def get_price(page: PageContext) -> Optional[float]:
     """Парсит карточку с ценой.
 
     Args:
@@ -223,15 +126,14 @@ def get_price(page: BeautifulSoup) -> Optional[float]:
     Returns:
         Цена.
     """
-    price_block: Tag = page.findAll('div', {'class': 'price-list'}).pop()
-    card_info = price_block.findAll('span', {'class': 'cur-price'})
+    card_info = CURRENT_PRICE(page.last(PRICE_LIST))
     if len(card_info) == 0:
         return None
     card_info = card_info.pop()
-    return float(card_info.text.strip().split(' ')[0])
+    return float(text(card_info).strip().split(' ')[0])
 
 
-def get_discounted_price(page: BeautifulSoup) -> Optional[float]:
+def get_discounted_price(page: PageContext) -> Optional[float]:
     """Парсит карточку с ценой для поиска цены до скидки.
 
     Args:
@@ -240,15 +142,14 @@ def get_discounted_price(page: BeautifulSoup) -> Optional[float]:
     Returns:
         Цена до скидки.
     """
-    price_block: Tag = page.findAll('div', {'class': 'price-list'}).pop()
-    card_info = price_block.findAll('span', {'class': 'old-price'})
+    card_info = OLD_PRICE(page.last(PRICE_LIST))
     if len(card_info) == 0:
         return None
     card_info = card_info.pop()
-    return float(card_info.text.strip().split(' ')[0])
+    return float(text(card_info).strip().split(' ')[0])
 
 
-def get_title(page: BeautifulSoup) -> str:
+def get_title(page: PageContext) -> str:
     """Парсит карточку в поисках названия.
 
     Args:
@@ -257,71 +158,93 @@ def get_title(page: BeautifulSoup) -> str:
     Returns:
         Название модели.
     """
-    title_tag: Tag = page.findAll(
-        'div',
-        {'class': 'wrap-product-card-name'},
-    ).pop()
-    return title_tag.text.strip()
+    return text(page.last(TITLE)).strip()
 
 
-def get_next_page(page: BeautifulSoup) -> Optional[str]:
-    """Находит следующую страницу на главной.
+def get_product_key(url: str) -> str:
+    """Ключ модели для удаления дубликатов.
 
-    Args:
-        page: Страница для парсинга.
-
-    Returns:
-        Ссылку на следующую страницу.
-    """
-    pagination = page.findAll('div', {'class': 'pagination'})
-    if len(pagination) == 0:
-        return None
-    next_page_tag = pagination[0].findNext(
-        'a',
-        {'title': 'Следующая страница'},
-    )
-    if next_page_tag is None:
-        return None
-    else:
-        return next_page_tag.attrs.get('href')
-
-
-def get_images(page: BeautifulSoup, base_url: str) -> list[HttpUrl]:
-    """Парсит страницу для получения ссылок на картинки модели.
+    Одна и та же модель встречается в нескольких категориях под разными
+    адресами, но с одинаковым последним сегментом пути.
 
     Args:
-        page: Страница для парсинга.
-        base_url: Базовый url для подшивания в адреса.
+        url: Ссылка на страницу продукта.
 
     Returns:
-        Список ссылок на картинки.
+        Ключ модели.
     """
-    image_rotator = page.findAll('div', {'class': 'main-image'}).pop()
-    images = []
-    for img in image_rotator.findAll('img'):
-        images.append(base_url + img.attrs['src'])
-    return images
-
+    return url.split('/')[-2]
 
-def remove_duplicates(
-    urls: Set[Tuple[str, Category]],
-) -> list[dict[str, Union[str, set[Category]]]]:
-    """Удаляет дубликаты моделей из списка ссылок, сохраняет категории.
 
-    Args:
-        urls: Список ссылок для обработки.
+@register
+class MultisportsParser(SiteParser):
+    """Описание сайта multisports.by."""
 
-    Returns:
-        Список ссылок для дальнейшего парсинга.
-    """
-    unic_item_urls = {}
-    for url in urls:
-        object_name = url[0].split('/')[-2]
-        if object_name in unic_item_urls.keys():
-            unic_item_urls[object_name]['categories'].add(url[1])
-            continue
-        unic_item_urls[object_name] = {
-            'url': url[0],
-            'categories': {url[1]},
+    site = SiteEnum.MULTISPORTS
+    base_url = BASE_URL
+    start_pages = (
+        '/catalog/muzhchiny/obuv/',
+        '/catalog/zhenshchiny/obuv/',
+        '/catalog/muzhchiny/obuv/botinki/',
+        '/catalog/muzhchiny/obuv/slantsy_i_sandalii/',
+        '/catalog/muzhchiny/obuv/futbolnye_butsy/',
+        '/catalog/muzhchiny/obuv/krossovki/',
+        '/catalog/zhenshchiny/obuv/kedy/',
+        '/catalog/zhenshchiny/obuv/krossovki_vysokie/',
+        '/catalog/zhenshchiny/obuv/sapogi_i_botinki/',
+        '/catalog/zhenshchiny/obuv/slantsy-i-sandalii/',
+    )
+    pagination = PAGINATION
+    next_page = NEXT_PAGE
+    page_links = PAGE_LINKS
+    images = IMAGES
+    fingerprint_xpaths = FINGERPRINT_XPATHS
+    get_product_links = staticmethod(get_product_links)
+    product_key = staticmethod(get_product_key)
+
+    def product_fields(
+        self,
+        page: PageContext,
+        categories: set[Category],
+    ) -> dict[str, Any]:
+        """Извлекает поля продукта со страницы.
+
+        Категории берутся из страниц каталога, на которых найден продукт.
+
+        Args:
+            page: Страница продукта.
+            categories: Категории, в которых найден продукт.
+
+        Returns:
+            Поля модели продукта.
+        """
+        card_info = get_card_info(page)
+        card_info['size'] = get_sizes(page)
+        return {
+            'title': get_title(page),
+            'images': self.get_images(page),
+            'price': get_price(page),
+            'discounted_price': get_discounted_price(page),
+            'category': categories,
+            'article': card_info['article'],
+            'specification': card_info,
         }
-    return list(unic_item_urls.values())
+
+    def listing_categories(
+        self,
+        page: PageContext,
+        start_page: str,
+    ) -> set[Category]:
+        """Категория страницы каталога по ссылке на неё в меню.
+
+        Args:
+            page: Страница каталога.
+            start_page: Адрес первой страницы каталога.
+
+        Returns:
+            Категория страницы каталога.
+        """
+        return {Category(
+            id=start_page.split('/')[-2],
+            name=text(page.last(CATEGORY_LINKS, href=start_page)).strip(),
+        )}
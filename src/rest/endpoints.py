@@ -1,13 +1,28 @@
+import os
+import re
 from typing import Optional
+from urllib.parse import urlsplit
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.params import Param
 from fastapi_pagination import Page
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import (
+    FileResponse,
+    JSONResponse,
+    RedirectResponse,
+    Response,
+)
 
 from filters import filter_params
+from src.crawler.history import version_pipeline
+from src.crawler.images import (
+    THUMBNAIL_MEDIA_TYPE,
+    get_store,
+    guess_media_type,
+)
+from src.crawler.registry import get_parsers
 from src.enums import SexEnum, SiteEnum
 from src.models import (
     FilterStats,
@@ -18,8 +33,10 @@ from src.models import (
 )
 from src.rest.filtering import ProductFilters
 from src.rest.ordering import ProductOrdering
+from src.settings import settings
 from src.utils.paginate import paginate
-from src.utils.utils import get_max_version, get_newest_list
+
+DIGEST = re.compile('^[0-9a-f]{64}$')
 
 router = APIRouter(
     prefix='/api',
@@ -34,10 +51,60 @@ router = APIRouter(
 )
 
 
+async def get_catalog_etag(request: Request) -> Optional[str]:
+    """ETag текущего каталога по опубликованной версии.
+
+    Версия берётся из кэша процесса, поэтому проверка не обращается к
+    базе.
+
+    Args:
+        request: запрос
+
+    Returns:
+        ETag или None, если версия ещё не опубликована.
+
+    """
+    version = await request.app.version_cache.get(request.app.mongodb)
+    return None if version is None else '"catalog-{0}"'.format(version)
+
+
+def get_catalog_headers(etag: Optional[str]) -> dict[str, str]:
+    """Заголовки кэширования ответа по текущему каталогу.
+
+    Args:
+        etag: ETag каталога
+
+    Returns:
+        Заголовки ответа.
+
+    """
+    if etag is None:
+        return {}
+    return {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+
+def is_not_modified(request: Request, etag: Optional[str]) -> bool:
+    """Совпадает ли каталог у клиента с текущим.
+
+    Args:
+        request: запрос
+        etag: ETag каталога
+
+    Returns:
+        True, если можно ответить 304.
+
+    """
+    return etag is not None and etag in request.headers.get(
+        'if-none-match',
+        '',
+    )
+
+
 @router.get(
     '/products',
     response_model=Page[ProductModel],
     responses={
+        304: {'description': 'Catalog is not modified'},
         404: {'description': 'Item not found'},
     },
     description='Список продкутов только последнее спаршеное.',
@@ -58,19 +125,20 @@ async def get_product_list(
         Список продуктов
 
     """
-    max_version = await get_max_version(
-        request.app.mongodb['byshoes-collection'],
-    )
+    etag = await get_catalog_etag(request)
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=get_catalog_headers(etag))
     filters = ProductFilters().apply(query_params)
-    filters['version'] = {'$eq': max_version}
     sort_by, order_by = order.apply({})
-    return await paginate(
-        request.app.mongodb['byshoes-collection'],
+    response = await paginate(
+        request.app.mongodb['byshoes-current'],
         filters,
         ProductModelList,
         sort_by,
         order_by,
     )
+    response.headers.update(get_catalog_headers(etag))
+    return response
 
 
 @router.get(
@@ -80,17 +148,24 @@ async def get_product_list(
     responses={
         404: {'description': 'Item not found'},
     },
-    description='Список продкутов за все время.',
+    description=(
+        'Список продкутов за все время или каталог на момент версии.'
+    ),
 )
 async def get_product_full_list(
     request: Request,
+    version: Optional[int] = None,
     query_params: filter_params(ProductFilters) = Depends(),
     order: ProductOrdering = Depends(ProductOrdering),
 ) -> JSONResponse:
     """Получение списка продуктов.
 
+    Без версии отдаются все когда-либо найденные продукты в последнем
+    состоянии, с версией - каталог, собранный по журналу изменений.
+
     Args:
         request: запрос
+        version: версия запуска
         query_params: параметры фильтров
         order: параметры сортировки
 
@@ -100,12 +175,21 @@ async def get_product_full_list(
     """
     filters = ProductFilters().apply(query_params)
     sort_by, order_by = order.apply({})
+    if version is None:
+        return await paginate(
+            request.app.mongodb['byshoes-products'],
+            filters,
+            ProductModelParseList,
+            sort_by,
+            order_by,
+        )
     return await paginate(
-        request.app.mongodb['byshoes-collection'],
+        request.app.mongodb['byshoes-changes'],
         filters,
         ProductModelParseList,
         sort_by,
         order_by,
+        pipeline=version_pipeline(version),
     )
 
 
@@ -114,6 +198,7 @@ async def get_product_full_list(
     response_model=Page[ProductModelParse],
     response_model_by_alias=False,
     responses={
+        304: {'description': 'Catalog is not modified'},
         404: {'description': 'Item not found'},
     },
     description='Список продкутов за все время.',
@@ -134,33 +219,35 @@ async def get_product_new_list(
         Список продкутов
 
     """
-    collection = request.app.mongodb['byshoes-collection']
-    max_version = await get_max_version(collection)
-    new_items_ids = await get_newest_list(collection)
-
+    etag = await get_catalog_etag(request)
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=get_catalog_headers(etag))
     filters = ProductFilters().apply(query_params)
-    filters['_id'] = {'$in': new_items_ids}
-    filters['version'] = {'$eq': max_version}
+    filters['is_new'] = True
     sort_by, order_by = order.apply({})
-    return await paginate(
-        collection,
+    response = await paginate(
+        request.app.mongodb['byshoes-current'],
         filters,
         ProductModelParseList,
         sort_by,
         order_by,
     )
+    response.headers.update(get_catalog_headers(etag))
+    return response
 
 
 @router.get(
     '/products/filter_stats',
     response_model=FilterStats,
     responses={
+        304: {'description': 'Catalog is not modified'},
         404: {'description': 'Item not found'},
     },
     description='Информация о фильтрах.',
 )
 async def get_filter_stats(
     request: Request,
+    response: Response,
     is_new: Optional[bool] = None,
     query_params: filter_params(ProductFilters) = Depends(),
 ) -> FilterStats:
@@ -168,6 +255,7 @@ async def get_filter_stats(
 
     Args:
         request: запрос
+        response: ответ
         query_params: параметры фильтров
         is_new: фильтровать по новым.
 
@@ -175,17 +263,14 @@ async def get_filter_stats(
         Список продуктов.
 
     """
-    collection = request.app.mongodb['byshoes-collection']
-    max_version = await get_max_version(
-        collection,
-    )
+    etag = await get_catalog_etag(request)
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=get_catalog_headers(etag))
+    response.headers.update(get_catalog_headers(etag))
     filters = ProductFilters().apply(query_params)
-    filters['version'] = {'$eq': max_version}
-    if is_new is True:
-        filters['_id'] = {'$in': await get_newest_list(collection)}
-    elif is_new is False:
-        filters['_id'] = {'$nin': await get_newest_list(collection)}
-    query = collection.aggregate(
+    if is_new is not None:
+        filters['is_new'] = is_new
+    query = request.app.mongodb['byshoes-current'].aggregate(
         [
             {'$match': filters},
             {'$unwind': {'path': '$specification.size'}},
@@ -296,6 +381,103 @@ async def get_product_detail(
         Список продуктов.
 
     """
-    return await request.app.mongodb['byshoes-collection'].find_one(
+    return await request.app.mongodb['byshoes-products'].find_one(
         {'_id': str(product_id)},
     )
+
+
+@router.get(
+    '/images',
+    responses={
+        307: {'description': 'Redirect to the image'},
+        404: {'description': 'Item not found'},
+    },
+    description='Картинка продукта по её адресу на сайте.',
+)
+async def get_image(
+    request: Request,
+    url: str,
+    size: Optional[int] = None,
+) -> RedirectResponse:
+    """Перенаправление на сохранённую картинку.
+
+    Если картинка ещё не сохранена, перенаправляет на сайт магазина.
+
+    Args:
+        request: запрос
+        url: адрес картинки на сайте
+        size: размер уменьшенной копии
+
+    Returns:
+        Перенаправление на картинку.
+
+    Raises:
+        HTTPException: если картинка не с сайта магазина
+
+    """
+    image = await request.app.mongodb['byshoes-images'].find_one(
+        {'_id': url},
+        {'digest': 1},
+    )
+    if image is not None:
+        location = request.url_for('get_stored_image', digest=image['digest'])
+        if size is not None:
+            location = '{0}?size={1}'.format(location, size)
+        return RedirectResponse(location)
+    hosts = {
+        urlsplit(parser.get_base_url()).netloc
+        for parser in get_parsers()
+    }
+    if urlsplit(url).netloc not in hosts:
+        raise HTTPException(status_code=404, detail='Image not found')
+    return RedirectResponse(url)
+
+
+@router.get(
+    '/images/{digest}',
+    response_class=FileResponse,
+    responses={
+        404: {'description': 'Item not found'},
+    },
+    description='Сохранённая картинка или её уменьшенная копия.',
+)
+async def get_stored_image(
+    digest: str,
+    size: Optional[int] = None,
+) -> FileResponse:
+    """Отдача картинки из локального хранилища.
+
+    Файл по адресу никогда не меняется, поэтому кэшируется клиентами без
+    срока.
+
+    Args:
+        digest: sha256 картинки
+        size: размер уменьшенной копии
+
+    Returns:
+        Файл картинки.
+
+    Raises:
+        HTTPException: если картинки нет
+
+    """
+    sizes = settings.IMAGES_THUMBNAIL_SIZES
+    if not DIGEST.match(digest) or (size is not None and size not in sizes):
+        raise HTTPException(status_code=404, detail='Image not found')
+    path = get_store().path(digest, size)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail='Image not found')
+    media_type = THUMBNAIL_MEDIA_TYPE
+    if size is None:
+        with open(path, 'rb') as image:
+            media_type = guess_media_type(image.read(16))
+    return FileResponse(
+        path,
+        media_type=media_type,
+        headers={
+            'Cache-Control': 'public, max-age={0}, immutable'.format(
+                settings.IMAGES_CACHE_MAX_AGE,
+            ),
+            'ETag': '"{0}.{1}"'.format(digest, size or 'original'),
+        },
+    )
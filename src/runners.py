@@ -1,42 +1,296 @@
 import asyncio
-import itertools
+import logging
+from typing import Any, Optional
 
 from asgiref.sync import async_to_sync
-from motor.motor_asyncio import AsyncIOMotorClient
+from celery import chord
+from motor.motor_asyncio import AsyncIOMotorCollection
 
 from schedule import worker
-from src.allstars.parse import parse_site as allstars
-from src.multisports.parse import parse_site as multisports
+from src.crawler import archive, images, pool
+from src.crawler.history import ProductHistory
+from src.crawler.registry import get_parser, get_parsers
+from src.crawler.writer import BatchWriter
+from src.enums import SiteEnum
 from src.settings import settings
-from src.utils.utils import get_max_version
+from src.utils.utils import (
+    claim_run,
+    finish_run,
+    get_mongodb,
+    get_unfinished_run,
+    renew_run,
+    start_run,
+)
+from src.utils.versions import publish_version
 
-PARSER_LIST = [multisports, allstars]
+logger = logging.getLogger(__name__)
 
 
 @worker.task
 def parse_all():
-    """Запуск парсинга сайта multisport."""
-    async_to_sync(start_parse)()
-
-
-async def start_parse():
-    """Подшивает версию парсинга и запускает его."""
-    mongodb_client = AsyncIOMotorClient(
-        'mongodb://{0}:{1}@{2}:{3}/{4}'.format(
-            settings.MONGODB_USER,
-            settings.MONGODB_PASSWORD,
-            settings.MONGODB_HOST,
-            settings.MONGODB_PORT,
-            settings.MONGODB_DB,
-        ),
-        tz_aware=True,
-    )[settings.MONGODB_DB]['byshoes-collection']
-    parse_version = await get_max_version(mongodb_client)
-    tasks = [asyncio.ensure_future(parser()) for parser in PARSER_LIST]
-    results = list(itertools.chain.from_iterable(await asyncio.gather(*tasks)))
-    insert_result = []
-    for item in results:
-        if item is not None:
-            item['version'] = parse_version + 1
-            insert_result.append(item)
-    await mongodb_client.insert_many(insert_result)
+    """Запускает распределённый парсинг всех сайтов.
+
+    Продукты каждого сайта ищет отдельная задача, найденные продукты
+    разбираются пачками в задачах fetch_chunk на любых воркерах, а версия
+    публикуется задачей commit_run после всех пачек. Если задача упала,
+    версия остаётся незавершённой и продолжается следующим запуском,
+    когда истечёт её аренда. Пока запуск ведут задачи, новый не
+    начинается.
+    """
+    version = async_to_sync(open_run)(resume=True, exclusive=True)
+    if version is None:
+        return
+    chord(
+        discover_site.s(version, parser.site.value)
+        for parser in get_parsers()
+    )(schedule_fetch.s(version))
+
+
+@worker.task
+def discover_site(version: int, site: str) -> dict[str, Any]:
+    """Ищет продукты сайта.
+
+    Args:
+        version: Версия запуска.
+        site: Сайт.
+
+    Returns:
+        Сайт и найденные продукты.
+    """
+    products = async_to_sync(discover_products)(version, SiteEnum(site))
+    return {'site': site, 'products': products}
+
+
+@worker.task
+def schedule_fetch(discovered: list[dict[str, Any]], version: int) -> None:
+    """Делит найденные продукты на пачки и запускает их разбор.
+
+    Args:
+        discovered: Результаты задач discover_site.
+        version: Версия запуска.
+    """
+    size = settings.CRAWL_CHUNK_SIZE
+    chunks = [
+        fetch_chunk.s(version, result['site'], result['products'][i:i + size])
+        for result in discovered
+        for i in range(0, len(result['products']), size)
+    ]
+    logger.info(
+        'Run %d: fetching %d chunks.',
+        version,
+        len(chunks),
+        extra={'version': version},
+    )
+    if not chunks:
+        commit_run.delay(version)
+        return
+    chord(chunks)(commit_run.si(version))
+
+
+@worker.task
+def fetch_chunk(
+    version: int,
+    site: str,
+    products: list[dict[str, Any]],
+) -> None:
+    """Разбирает пачку продуктов сайта.
+
+    Args:
+        version: Версия запуска.
+        site: Сайт.
+        products: Продукты для разбора.
+    """
+    async_to_sync(fetch_products)(version, SiteEnum(site), products)
+
+
+@worker.task
+def commit_run(version: int) -> None:
+    """Публикует версию после разбора всех пачек.
+
+    Args:
+        version: Версия запуска.
+    """
+    async_to_sync(publish_run)(version)
+    if settings.IMAGES_ENABLED:
+        prefetch_images.delay(version)
+
+
+@worker.task
+def prefetch_images(version: int) -> None:
+    """Сохраняет новые картинки продуктов опубликованной версии.
+
+    Args:
+        version: Версия запуска.
+    """
+    async_to_sync(save_images)(version)
+
+
+async def open_run(
+    resume: bool = False,
+    exclusive: bool = False,
+) -> Optional[int]:
+    """Выдаёт версию для нового запуска или прерванного.
+
+    Args:
+        resume: Продолжить прерванный запуск, если он есть.
+        exclusive: Взять запуск в аренду. Незавершённый запуск, аренда
+            которого не истекла, не продолжается и новый не начинается.
+
+    Returns:
+        Версия запуска или None, если незавершённый запуск ещё идёт.
+    """
+    collection = get_mongodb()['byshoes-collection']
+    version = await get_unfinished_run(collection) if resume else None
+    if version is None:
+        version = await start_run(collection)
+        if exclusive:
+            await renew_run(collection, version)
+        return version
+    if exclusive and not await claim_run(collection, version):
+        logger.info(
+            'Run %d is still in progress.',
+            version,
+            extra={'version': version},
+        )
+        return None
+    logger.info(
+        'Resuming parse run %d.',
+        version,
+        extra={'version': version},
+    )
+    return version
+
+
+async def discover_products(
+    version: int,
+    site: SiteEnum,
+) -> list[dict[str, Any]]:
+    """Ищет ещё не записанные в запуске продукты сайта.
+
+    Args:
+        version: Версия запуска.
+        site: Сайт.
+
+    Returns:
+        Найденные продукты.
+    """
+    collection = get_mongodb()['byshoes-collection']
+    await renew_run(collection, version)
+    writer = BatchWriter(collection, version)
+    products = await get_parser(site).discover_products(writer)
+    logger.info(
+        'Run %d: %d products of %s.',
+        version,
+        len(products),
+        site.value,
+        extra={'version': version, 'site': site.value},
+    )
+    return products
+
+
+async def fetch_products(
+    version: int,
+    site: SiteEnum,
+    products: list[dict[str, Any]],
+) -> None:
+    """Разбирает и записывает пачку продуктов сайта.
+
+    Args:
+        version: Версия запуска.
+        site: Сайт.
+        products: Продукты для разбора.
+    """
+    collection = get_mongodb()['byshoes-collection']
+    await renew_run(collection, version)
+    writer = BatchWriter(collection, version)
+    try:
+        await get_parser(site).fetch_products(writer, products)
+    finally:
+        pool.shutdown()
+
+
+async def start_parse(resume: bool = False):
+    """Подшивает версию парсинга и запускает его.
+
+    Версия выдаётся до начала парсинга, документы записываются пачками
+    по мере разбора. Версия становится видна в выдаче только после
+    завершения всех парсеров.
+
+    Args:
+        resume: Продолжить прерванный запуск, если он есть.
+    """
+    collection = get_mongodb()['byshoes-collection']
+    parse_version = await open_run(resume)
+    writer = BatchWriter(collection, parse_version)
+    tasks = [
+        asyncio.ensure_future(parser.parse_site(writer))
+        for parser in get_parsers()
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        pool.shutdown()
+        archive.close()
+    await writer.flush()
+    await publish_run(parse_version)
+    if settings.IMAGES_ENABLED:
+        await images.prefetch(collection.database, parse_version)
+
+
+async def publish_run(version: int) -> None:
+    """Переносит версию в историю продуктов и публикует текущий каталог.
+
+    Args:
+        version: Версия запуска.
+    """
+    db = get_mongodb()['byshoes-collection']
+    history = ProductHistory(db.database)
+    await history.commit(version)
+    await history.materialize(version)
+    await finish_run(db, version)
+    await publish_version(db.database, version)
+    await log_run_summary(db, version)
+
+
+async def save_images(version: int) -> None:
+    """Сохраняет новые картинки продуктов версии.
+
+    Args:
+        version: Версия запуска.
+    """
+    await images.prefetch(get_mongodb(), version)
+
+
+async def log_run_summary(db: AsyncIOMotorCollection, version: int) -> None:
+    """Пишет в лог сводку завершённого запуска по сайтам.
+
+    Args:
+        db: Коллекция продуктов.
+        version: Версия запуска.
+    """
+    run = await db.database['byshoes-runs'].find_one({'_id': version})
+    if run is None:
+        return
+    duration = (run['finished'] - run['started']).total_seconds()
+    for site, stats in (run.get('stats') or {}).items():
+        products = stats.get('products', {})
+        requests = stats.get('requests', {})
+        logger.info(
+            'Run %d of %s: %d written, %d skipped, %d failed, %d errors, '
+            '%d requests (%s), %d retries, %.1f MB in %.0fs.',
+            version,
+            site,
+            products.get('written', 0),
+            products.get('skipped', 0),
+            products.get('failed', 0),
+            products.get('error', 0),
+            sum(requests.values()),
+            ', '.join(
+                '{0}: {1}'.format(status, count)
+                for status, count in sorted(requests.items())
+            ),
+            stats.get('retries', 0),
+            stats.get('bytes', 0) / 1024 / 1024,
+            duration,
+            extra={'version': version, 'site': site, 'duration': duration},
+        )
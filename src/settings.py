@@ -1,5 +1,9 @@
+from typing import Union
+
 from pydantic import BaseSettings
 
+from src.enums import SiteEnum
+
 
 class Settings(BaseSettings):
     """Настройки приложения."""
@@ -10,11 +14,78 @@ class Settings(BaseSettings):
     MONGODB_USER: str = 'mongouser'
     MONGODB_PASSWORD: str = 'password'
     REDIS_URL: str = 'localhost'
+    REDIS_TIMEOUT: float = 5
+    VERSION_CACHE_TTL: float = 60
     CRON_MINUTE: str = '0'
     CRON_HOUR: str = '*/12'
     CRON_DAY_OF_WEEK: str = '*'
     CRON_DAY_OF_MONTH: str = '*'
     CRON_MONTH_OF_YEAR: str = '*'
+    HTTP_MAX_CONNECTIONS: int = 20
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 30
+    HTTP_CONNECT_TIMEOUT: float = 10
+    HTTP_READ_TIMEOUT: float = 30
+    HTTP2: bool = False
+    CRAWL_MAX_IN_FLIGHT: int = 10
+    CRAWL_WORKERS: int = 10
+    CRAWL_QUEUE_SIZE: int = 100
+    CRAWL_CHUNK_SIZE: int = 200
+    CRAWL_FRONTIER: str = 'local'
+    FRONTIER_REDIS_DB: int = 2
+    FRONTIER_LEASE: float = 300
+    FRONTIER_POLL_INTERVAL: float = 1
+    WRITE_BATCH_SIZE: int = 100
+    RUN_RESUME_MAX_AGE: float = 24 * 60 * 60
+    RUN_LEASE: float = 60 * 60
+    WRITE_CONCERN_W: Union[int, str] = 1
+    WRITE_CONCERN_JOURNAL: bool = False
+    WRITE_RETRIES: int = 3
+    WRITE_RETRY_DELAY: float = 1
+    RATE_LIMIT_INITIAL: float = 2
+    RATE_LIMIT_MIN: float = 0.5
+    RATE_LIMIT_MAX: float = 50
+    RATE_LIMIT_BURST: float = 5
+    RATE_LIMIT_INCREASE: float = 0.25
+    RATE_LIMIT_DECREASE: float = 0.5
+    RATE_LIMIT_TARGET_LATENCY: float = 1
+    RATE_LIMIT_LOG_INTERVAL: float = 30
+    RETRY_ATTEMPTS: int = 4
+    RETRY_BASE_DELAY: float = 1
+    RETRY_MAX_DELAY: float = 30
+    CIRCUIT_WINDOW: int = 20
+    CIRCUIT_MIN_REQUESTS: int = 10
+    CIRCUIT_ERROR_RATE: float = 0.5
+    CIRCUIT_COOLDOWN: float = 30
+    HTTP_CACHE_ENABLED: bool = True
+    HTTP_CACHE_PATH: str = 'cache/http.sqlite3'
+    HTTP_CACHE_MAX_SIZE: int = 512 * 1024 * 1024
+    HTTP_CACHE_COMMIT_BATCH: int = 50
+    FINGERPRINT_ENABLED: bool = True
+    RECRAWL_ENABLED: bool = False
+    RECRAWL_TARGET: float = 0.2
+    RECRAWL_BUDGET: int = 0
+    RECRAWL_MAX_AGE: float = 14 * 24 * 60 * 60
+    RECRAWL_PRIOR_CHANGES: float = 1
+    RECRAWL_PRIOR_PERIOD: float = 7 * 24 * 60 * 60
+    PARSE_WORKERS: int = 0
+    SITE_URLS: dict[SiteEnum, str] = {}
+    SITEMAP_SITES: list[SiteEnum] = []
+    VALIDATION_MODE: str = 'sampled'
+    VALIDATION_SAMPLE_RATE: float = 0.01
+    METRICS_PORT: int = 0
+    LOG_LEVEL: str = 'INFO'
+    LOG_FORMAT: str = 'text'
+    LOG_RATE_LIMIT: int = 20
+    LOG_RATE_INTERVAL: float = 10
+    IMAGES_ENABLED: bool = False
+    IMAGES_PATH: str = 'images'
+    IMAGES_CONCURRENCY: int = 8
+    IMAGES_BATCH_SIZE: int = 500
+    IMAGES_MAX_BYTES: int = 10 * 1024 * 1024
+    IMAGES_THUMBNAIL_SIZES: list[int] = [200, 400]
+    IMAGES_THUMBNAIL_QUALITY: int = 85
+    IMAGES_CACHE_MAX_AGE: int = 365 * 24 * 60 * 60
 
 
 settings = Settings()
@@ -0,0 +1,181 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from src.settings import settings
+
+FIELDS = ('site', 'url', 'status', 'duration', 'version', 'suppressed')
+TEXT_FORMAT = '%(asctime)-15s %(message)s'
+
+_listener: Optional[QueueListener] = None
+_pid: Optional[int] = None
+
+
+def configure_logging() -> None:
+    """Настраивает логирование процесса через очередь.
+
+    Записи кладутся в очередь без блокировки, форматируются и пишутся в
+    stderr отдельным потоком, поэтому логирование не останавливает цикл
+    событий. Одинаковые сообщения ниже ERROR ограничиваются по частоте.
+    Повторный вызов ничего не меняет, а в дочернем процессе, где нет
+    потока записи, логирование настраивается заново.
+    """
+    global _listener, _pid
+    if _listener is not None and _pid == os.getpid():
+        return
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    output = logging.StreamHandler()
+    if settings.LOG_FORMAT == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(TextFormatter(TEXT_FORMAT))
+    handler = _ThreadQueueHandler(records)
+    handler.addFilter(RateLimitFilter(
+        settings.LOG_RATE_LIMIT,
+        settings.LOG_RATE_INTERVAL,
+    ))
+    root = logging.getLogger()
+    for previous in root.handlers[:]:
+        root.removeHandler(previous)
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL)
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    _pid = os.getpid()
+    atexit.register(_listener.stop)
+
+
+def get_fields(record: logging.LogRecord) -> dict:
+    """Структурированные поля записи, переданные через extra.
+
+    Args:
+        record: Запись лога.
+
+    Returns:
+        Поля записи.
+    """
+    return {
+        name: getattr(record, name)
+        for name in FIELDS
+        if getattr(record, name, None) is not None
+    }
+
+
+class TextFormatter(logging.Formatter):
+    """Текстовый формат, поля записи добавляются как ключ=значение."""
+
+    def formatMessage(self, record: logging.LogRecord) -> str:  # noqa: N802
+        """Форматирует сообщение записи без трассировки.
+
+        Args:
+            record: Запись лога.
+
+        Returns:
+            Строка лога.
+        """
+        line = super().formatMessage(record)
+        fields = get_fields(record)
+        if not fields:
+            return line
+        return '{0} {1}'.format(line, ' '.join(
+            '{0}={1}'.format(name, value) for name, value in fields.items()
+        ))
+
+
+class JsonFormatter(logging.Formatter):
+    """Формат JSON, одна запись на строку."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Форматирует запись.
+
+        Args:
+            record: Запись лога.
+
+        Returns:
+            Строка JSON.
+        """
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **get_fields(record),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничивает частоту одинаковых сообщений.
+
+    Сообщения различаются по логгеру и шаблону. За интервал пропускается
+    не больше limit сообщений каждого вида, первое сообщение следующего
+    интервала получает поле suppressed с числом отброшенных. Ошибки не
+    ограничиваются.
+    """
+
+    def __init__(self, limit: int, interval: float):
+        """Конструктор фильтра.
+
+        Args:
+            limit: Сообщений одного вида за интервал, 0 - без ограничений.
+            interval: Интервал в секундах.
+        """
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows: dict[tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:  # noqa: A003
+        """Решает, пропустить ли запись.
+
+        Args:
+            record: Запись лога.
+
+        Returns:
+            True, если запись нужно записать.
+        """
+        if not self.limit or record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class _ThreadQueueHandler(QueueHandler):
+    """Очередь записей внутри процесса.
+
+    Запись передаётся потоку записи как есть, сообщение форматируется уже
+    в нём.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Готовит запись к передаче в очередь.
+
+        Args:
+            record: Запись лога.
+
+        Returns:
+            Та же запись.
+        """
+        return record
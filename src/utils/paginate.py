@@ -20,6 +20,7 @@ async def paginate(
     sort_by: str,
     order_by: int,
     params: Optional[AbstractParams] = None,
+    pipeline: Optional[list[dict[str, Any]]] = None,
 ) -> JSONResponse:
     """Метод подстраничного вывода данных для mongodb.
 
@@ -30,6 +31,7 @@ async def paginate(
         params: query параметры из url
         sort_by: объект сортировки
         order_by: направление сортировки
+        pipeline: стадии агрегации, из результата которых идёт выборка
 
     Returns:
         Постраничный ответ
@@ -37,8 +39,9 @@ async def paginate(
     """
     params: Params = resolve_params(params)
 
+    pipeline = pipeline or []
     queryset = query.aggregate(
-        [
+        pipeline + [
             {'$match': find_query},
             {'$sort': {sort_by: order_by}},
             {'$skip': (params.page - 1) * params.size},
@@ -47,7 +50,10 @@ async def paginate(
     )
 
     items = await queryset.to_list(params.size)
-    total = await query.count_documents(find_query)
+    if pipeline:
+        total = await _count(query, pipeline + [{'$match': find_query}])
+    else:
+        total = await query.count_documents(find_query)
 
     return JSONResponse({
         'items': jsonable_encoder(
@@ -58,3 +64,21 @@ async def paginate(
         'page': params.page,
         'size': params.size,
     })
+
+
+async def _count(query: Any, pipeline: list[dict[str, Any]]) -> int:
+    """Количество документов в результате агрегации.
+
+    Args:
+        query: коллекция mongodb
+        pipeline: стадии агрегации
+
+    Returns:
+        Количество документов
+
+    """
+    counted = await query.aggregate(
+        pipeline + [{'$count': 'total'}],
+        allowDiskUse=True,
+    ).to_list(1)
+    return counted[0]['total'] if counted else 0
@@ -1,8 +1,56 @@
-from motor.motor_asyncio import AsyncIOMotorCollection
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+    AsyncIOMotorCollection,
+    AsyncIOMotorDatabase,
+)
+
+from src.settings import settings
+from src.utils.versions import get_active_version
+
+_clients: dict[asyncio.AbstractEventLoop, AsyncIOMotorClient] = {}
+
+
+def get_mongodb() -> AsyncIOMotorDatabase:
+    """Подключается к базе данных из настроек.
+
+    Клиент создаётся при первом обращении и переиспользуется. Motor
+    привязывает клиента к циклу событий, а задачи celery выполняются
+    каждая в своём цикле, поэтому клиент один на цикл, и клиенты
+    закрытых циклов закрываются. Вызывать нужно в цикле, в котором
+    будет работать база.
+
+    Returns:
+        База данных приложения.
+
+    """
+    loop = asyncio.get_event_loop()
+    for closed in [other for other in _clients if other.is_closed()]:
+        _clients.pop(closed).close()
+    if loop not in _clients:
+        _clients[loop] = AsyncIOMotorClient(
+            'mongodb://{0}:{1}@{2}:{3}/{4}'.format(
+                settings.MONGODB_USER,
+                settings.MONGODB_PASSWORD,
+                settings.MONGODB_HOST,
+                settings.MONGODB_PORT,
+                settings.MONGODB_DB,
+            ),
+            tz_aware=True,
+        )
+    return _clients[loop][settings.MONGODB_DB]
 
 
 async def get_max_version(db: AsyncIOMotorCollection) -> int:
-    """Получает из базы максимальную версию объектов.
+    """Получает из базы максимальную версию завершённого парсинга.
+
+    Версии незавершённых запусков не учитываются, чтобы частично
+    записанный каталог не попадал в выдачу. Опубликованная версия
+    берётся из документа метаданных, по запускам и документам она
+    ищется, только если его ещё нет.
 
     Args:
         db: Инстанс бд
@@ -11,8 +59,38 @@ async def get_max_version(db: AsyncIOMotorCollection) -> int:
         максимальная версия в базе данных
 
     """
+    active = await get_active_version(db.database)
+    if active is not None:
+        return active
+    runs = db.database['byshoes-runs']
+    finished = await runs.find_one(
+        {'status': 'finished'},
+        sort=[('_id', -1)],
+    )
+    if finished is not None:
+        return finished['_id']
+    unfinished = await runs.distinct('_id')
+    return await _aggregate_max_version(
+        db,
+        [{'$match': {'version': {'$nin': unfinished}}}],
+    )
+
+
+async def _aggregate_max_version(
+    db: AsyncIOMotorCollection,
+    pipeline: list[dict],
+) -> int:
+    """Максимальная версия среди записанных документов.
+
+    Args:
+        db: Коллекция продуктов.
+        pipeline: Начальные стадии агрегации.
+
+    Returns:
+        Максимальная версия или 0.
+    """
     query = db.aggregate(
-        [
+        pipeline + [
             {
                 '$group': {
                     '_id': None,
@@ -29,52 +107,106 @@ async def get_max_version(db: AsyncIOMotorCollection) -> int:
     return 0 if parse_version is None else parse_version
 
 
-async def get_newest_list(db: AsyncIOMotorCollection) -> list[str]:
-    """Получает список новинок.
+async def start_run(db: AsyncIOMotorCollection) -> int:
+    """Регистрирует новый запуск парсинга и выдаёт ему версию.
 
     Args:
-        db: База данных
+        db: Коллекция продуктов.
 
     Returns:
-        Список новинок.
+        Версия запуска.
     """
-    max_version = await get_max_version(db)
-    last_items = db.aggregate(
-        [
-            {'$match': {'version': {'$eq': max_version}}},
-            {'$group': {'_id': {'$concat': ['$site', '$article']}}},
-        ],
-        allowDiskUse=True,
+    runs = db.database['byshoes-runs']
+    last_run = await runs.find_one(sort=[('_id', -1)])
+    version = max(
+        await _aggregate_max_version(db, []),
+        0 if last_run is None else last_run['_id'],
+    ) + 1
+    await runs.insert_one({
+        '_id': version,
+        'status': 'running',
+        'started': datetime.now(timezone.utc),
+        'finished': None,
+    })
+    return version
+
+
+async def get_unfinished_run(db: AsyncIOMotorCollection) -> Optional[int]:
+    """Находит прерванный запуск парсинга, который можно продолжить.
+
+    Слишком старые запуски не продолжаются, чтобы не смешивать в одной
+    версии сильно разнесённые по времени данные.
+
+    Args:
+        db: Коллекция продуктов.
+
+    Returns:
+        Версия прерванного запуска или None.
+    """
+    started_after = datetime.now(timezone.utc) - timedelta(
+        seconds=settings.RUN_RESUME_MAX_AGE,
     )
-    last_items = await last_items.to_list(None)
-    last_items = {item['_id'] for item in last_items}
-    depth = 0
-    while True:
-        depth += 1
-        prev_items = db.aggregate(
-            [
-                {'$match': {'version': {'$eq': max_version - depth}}},
-                {'$group': {'_id': {'$concat': ['$site', '$article']}}},
-            ],
-            allowDiskUse=True,
-        )
-        prev_items = await prev_items.to_list(None)
-        prev_items = {item['_id'] for item in prev_items}
-        new_items = list(last_items - prev_items)
-        if not (len(new_items) == 0 and depth < max_version):
-            break
-    new_items_ids = db.aggregate(
-        [
-            {'$match': {'version': {'$eq': max_version}}},
-            {
-                '$group': {
-                    '_id': {'$concat': ['$site', '$article']},
-                    'id': {'$last': '$_id'},
-                },
-            },
-            {'$match': {'_id': {'$in': new_items}}},
-        ],
-        allowDiskUse=True,
+    run = await db.database['byshoes-runs'].find_one(
+        {'status': 'running', 'started': {'$gte': started_after}},
+        sort=[('_id', -1)],
+    )
+    return None if run is None else run['_id']
+
+
+async def claim_run(db: AsyncIOMotorCollection, version: int) -> bool:
+    """Берёт незавершённый запуск в работу, если его никто не ведёт.
+
+    Запуск считается брошенным, когда истекла его аренда: задачи запуска
+    продлевают её, пока работают.
+
+    Args:
+        db: Коллекция продуктов.
+        version: Версия запуска.
+
+    Returns:
+        True, если запуск взят в работу.
+    """
+    now = datetime.now(timezone.utc)
+    claimed = await db.database['byshoes-runs'].update_one(
+        {
+            '_id': version,
+            'status': 'running',
+            '$or': [{'lease': None}, {'lease': {'$lt': now}}],
+        },
+        {'$set': {'lease': now + timedelta(seconds=settings.RUN_LEASE)}},
+    )
+    return claimed.modified_count == 1
+
+
+async def renew_run(db: AsyncIOMotorCollection, version: int) -> None:
+    """Продлевает аренду запуска.
+
+    Args:
+        db: Коллекция продуктов.
+        version: Версия запуска.
+    """
+    await db.database['byshoes-runs'].update_one(
+        {'_id': version},
+        {'$set': {'lease': datetime.now(timezone.utc) + timedelta(
+            seconds=settings.RUN_LEASE,
+        )}},
+    )
+
+
+async def finish_run(db: AsyncIOMotorCollection, version: int) -> None:
+    """Отмечает запуск парсинга завершённым.
+
+    После этого версия запуска становится видна в выдаче.
+
+    Args:
+        db: Коллекция продуктов.
+        version: Версия запуска.
+    """
+    await db.database['byshoes-runs'].update_one(
+        {'_id': version},
+        {'$set': {
+            'status': 'finished',
+            'finished': datetime.now(timezone.utc),
+        }},
     )
-    new_items_ids = await new_items_ids.to_list(None)
-    return [item['id'] for item in new_items_ids]
\ No newline at end of file
+    await db.database['byshoes-crawl-state'].delete_many({'version': version})
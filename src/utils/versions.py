@@ -0,0 +1,146 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from asgiref.sync import sync_to_async
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from redis import Redis, RedisError
+
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+META_ID = 'catalog'
+CHANNEL = 'byshoes:catalog'
+
+_redis: Optional[Redis] = None
+
+
+def get_redis() -> Redis:
+    """Подключается к redis для уведомлений о новой версии.
+
+    Returns:
+        Клиент redis, один на процесс.
+    """
+    global _redis
+    if _redis is None:
+        _redis = Redis(
+            host=settings.REDIS_URL,
+            port=6379,
+            socket_timeout=settings.REDIS_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_TIMEOUT,
+        )
+    return _redis
+
+
+async def get_active_version(db: AsyncIOMotorDatabase) -> Optional[int]:
+    """Опубликованная версия каталога из документа метаданных.
+
+    Args:
+        db: База данных.
+
+    Returns:
+        Версия или None, если ни одна версия ещё не опубликована.
+    """
+    meta = await db['byshoes-meta'].find_one({'_id': META_ID})
+    return None if meta is None else meta['version']
+
+
+async def publish_version(db: AsyncIOMotorDatabase, version: int) -> None:
+    """Записывает опубликованную версию и уведомляет о ней API.
+
+    Уведомление отправляется в отдельном потоке, чтобы не блокировать
+    цикл событий. Если redis недоступен, публикация не прерывается, а API
+    узнает о версии по истечении срока кэша.
+
+    Args:
+        db: База данных.
+        version: Версия запуска.
+    """
+    await db['byshoes-meta'].update_one(
+        {'_id': META_ID},
+        {'$set': {
+            'version': version,
+            'published': datetime.now(timezone.utc),
+        }},
+        upsert=True,
+    )
+    try:
+        await sync_to_async(get_redis().publish, thread_sensitive=False)(
+            CHANNEL,
+            version,
+        )
+    except RedisError as exc:
+        logger.warning(
+            'Version %d is not announced: %s',
+            version,
+            exc,
+            extra={'version': version},
+        )
+
+
+class VersionCache(object):
+    """Опубликованная версия каталога в памяти процесса API.
+
+    Версия читается из базы при первом обращении и обновляется по
+    уведомлению из redis. Срок кэша из настроек страхует от потерянных
+    уведомлений.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        """Конструктор кэша.
+
+        Args:
+            ttl: Срок кэша в секундах, по умолчанию из настроек.
+        """
+        self.ttl = settings.VERSION_CACHE_TTL if ttl is None else ttl
+        self.version: Optional[int] = None
+        self._loaded = 0.0
+        self._thread: Any = None
+
+    async def get(self, db: AsyncIOMotorDatabase) -> Optional[int]:
+        """Опубликованная версия каталога.
+
+        Args:
+            db: База данных.
+
+        Returns:
+            Версия или None, если ни одна версия ещё не опубликована.
+        """
+        if self.version is None or time.monotonic() - self._loaded > self.ttl:
+            self.set(await get_active_version(db))
+        return self.version
+
+    def set(self, version: Optional[int]) -> None:  # noqa: A003
+        """Запоминает версию.
+
+        Args:
+            version: Версия.
+        """
+        self.version = version
+        self._loaded = time.monotonic()
+
+    def listen(self) -> None:
+        """Подписывается на уведомления о новых версиях в фоновом потоке."""
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(**{CHANNEL: self._handle})
+        except RedisError as exc:
+            logger.warning('Version notifications are disabled: %s', exc)
+            return
+        self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def close(self) -> None:
+        """Останавливает подписку."""
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+
+    def _handle(self, message: dict[str, Any]) -> None:
+        """Обрабатывает уведомление о новой версии.
+
+        Args:
+            message: Сообщение redis.
+        """
+        self.set(int(message['data']))
+        logger.info('Catalog version %d is active.', self.version)
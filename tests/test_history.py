@@ -0,0 +1,120 @@
+import unittest
+from typing import Any
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+from src.crawler.history import ProductHistory
+from src.settings import settings
+
+TEST_DB = '{0}-test-history'.format(settings.MONGODB_DB)
+
+
+def make_document(version: int, article: str, price: int) -> dict[str, Any]:
+    """Документ продукта версии.
+
+    Args:
+        version: Версия запуска.
+        article: Артикул.
+        price: Цена.
+
+    Returns:
+        Документ продукта.
+    """
+    return {
+        '_id': '{0}-{1}'.format(version, article),
+        'site': 'allstars',
+        'article': article,
+        'link': 'https://example.test/{0}'.format(article),
+        'price': price,
+        'parsed': '2021-01-0{0}T00:00:00'.format(version),
+        'version': version,
+    }
+
+
+class ProductHistoryCommitTestCase(unittest.IsolatedAsyncioTestCase):
+    """Свёртка версий в историю продуктов."""
+
+    async def asyncSetUp(self) -> None:
+        """Подключается к тестовой базе, без сервера тест пропускается."""
+        self.client = AsyncIOMotorClient(
+            'mongodb://{0}:{1}@{2}:{3}/'.format(
+                settings.MONGODB_USER,
+                settings.MONGODB_PASSWORD,
+                settings.MONGODB_HOST,
+                settings.MONGODB_PORT,
+            ),
+            serverSelectionTimeoutMS=1000,
+            tz_aware=True,
+        )
+        try:
+            await self.client.drop_database(TEST_DB)
+        except PyMongoError as exc:
+            self.client.close()
+            self.skipTest('MongoDB is not available: {0}'.format(exc))
+        self.db = self.client[TEST_DB]
+        self.history = ProductHistory(self.db)
+
+    async def asyncTearDown(self) -> None:
+        """Удаляет тестовую базу."""
+        await self.client.drop_database(TEST_DB)
+        self.client.close()
+
+    async def test_commit_folds_unmigrated_versions(self) -> None:
+        """Версии полными копиями сворачиваются до удаления."""
+        await self.db['byshoes-collection'].insert_many([
+            make_document(1, 'a', 100),
+            make_document(1, 'b', 200),
+            make_document(2, 'a', 150),
+        ])
+        await self.db['byshoes-runs'].insert_one(
+            {'_id': 2, 'status': 'running'},
+        )
+        await self.history.commit(2)
+
+        products = {
+            product['article']: product
+            async for product in self.db['byshoes-products'].find()
+        }
+        self.assertEqual(products['a']['available_since'], 1)
+        self.assertEqual(products['a']['price'], 150)
+        self.assertFalse(products['b']['available'])
+        self.assertEqual(
+            await self.db['byshoes-runs'].distinct('_id', {'history': True}),
+            [1, 2],
+        )
+        self.assertEqual(
+            await self.db['byshoes-collection'].distinct('version'),
+            [2],
+        )
+        changes = await self.db['byshoes-changes'].find(
+            {'product': products['b']['_id']},
+        ).sort('version').to_list(None)
+        self.assertEqual(
+            [(change['version'], change['available']) for change in changes],
+            [(1, True), (2, False)],
+        )
+
+    async def test_commit_is_repeatable(self) -> None:
+        """Повторная свёртка не меняет историю."""
+        await self.db['byshoes-collection'].insert_many([
+            make_document(1, 'a', 100),
+            make_document(2, 'a', 100),
+            make_document(3, 'a', 120),
+        ])
+        await self.history.commit(1)
+        await self.history.commit(2)
+        await self.history.commit(3)
+        changes = await self.db['byshoes-changes'].count_documents({})
+        await self.history.commit(3)
+
+        self.assertEqual(
+            await self.db['byshoes-changes'].count_documents({}),
+            changes,
+        )
+        self.assertEqual(changes, 2)
+        product = await self.db['byshoes-products'].find_one(
+            {'key': 'allstars:a'},
+        )
+        self.assertEqual(product['available_since'], 1)
+        self.assertEqual(product['version'], 3)